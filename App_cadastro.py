@@ -1,8 +1,10 @@
 import streamlit as st
+from datetime import datetime
 from streamlit_option_menu import option_menu
 import database as db
 import utils
 import views
+import metricas
 
 st.set_page_config(page_title="Controle de Patrimônio Lavie", page_icon="Lavie1.png", layout="wide")
 utils.aplicar_css()
@@ -43,7 +45,7 @@ def tela_de_login():
     with tab1:
         st.subheader("Login da Obra")
         try:
-            _, lista_obras, _, _, _ = db.carregar_dados_app()
+            _, lista_obras = db.carregar_listas()
             if not lista_obras: st.info("Nenhuma obra cadastrada.")
             else:
                 codigos_obras = st.secrets.obra_codes
@@ -69,9 +71,20 @@ def tela_de_login():
                 st.rerun()
             else: st.error("Senha incorreta.")
 
+# Aviso quando a tela mostra a última versão em memória por falta de conexão
+def aviso_dados_desatualizados():
+    situacao = db.situacao_dados()
+    if not situacao["desatualizado"]:
+        return
+    quando = datetime.fromtimestamp(situacao["atualizado_em"]).strftime("%d/%m %H:%M") if situacao["atualizado_em"] else "?"
+    if situacao["erro"]:
+        st.warning(f"Sem conexão com o banco: exibindo dados de {quando}. Tentando atualizar em segundo plano.", icon="⚠️")
+    else:
+        st.caption(f"Dados de {quando}, atualizando em segundo plano...")
+
 def app_principal():
     is_admin = st.session_state.is_admin
-    lista_status, lista_obras_app, existing_data_full, df_movimentacoes, df_locacoes = db.carregar_dados_app()
+    lista_status, lista_obras_app = db.carregar_listas()
     
     with st.sidebar:
         st.image("Lavie.png", use_container_width=True)
@@ -88,6 +101,9 @@ def app_principal():
 
         menu_options = ["Cadastrar Item", "Inventário", "Dashboard"]
         icons = ["plus-circle-fill", "card-list", "bar-chart-fill"]
+        if is_admin:
+            menu_options.append("Diagnóstico")
+            icons.append("speedometer2")
         
         selected_page = option_menu(
             menu_title=None, options=menu_options, icons=icons,
@@ -110,32 +126,40 @@ def app_principal():
             obras_disponiveis = ["Todas"] + lista_obras_app 
             obra_selecionada_sidebar = st.selectbox("Filtrar Visão por Obra", obras_disponiveis)
         
+        if is_admin:
+            with st.expander("Uso de memória dos dados"):
+                memoria = db.relatorio_memoria()
+                st.caption(f"Total: {memoria['memoria_mb'].sum():,.2f} MB")
+                st.dataframe(memoria, hide_index=True, use_container_width=True)
+
         st.write("---")
         if st.button("Sair / Trocar Obra", type="primary", use_container_width=True):
             st.session_state.clear()
-            st.cache_data.clear()
             st.rerun()
             
     if is_admin:
-        if obra_selecionada_sidebar == "Todas":
-            dados_patrimonio = existing_data_full
-            dados_locacoes_filt = df_locacoes
-        else:
-            dados_patrimonio = existing_data_full[existing_data_full[db.OBRA_COL] == obra_selecionada_sidebar].copy()
-            dados_locacoes_filt = df_locacoes[df_locacoes["obra_destino"] == obra_selecionada_sidebar].copy()
+        obra_visao = None if obra_selecionada_sidebar == "Todas" else obra_selecionada_sidebar
     else: 
-        obra_logada = st.session_state.selected_obra
-        dados_patrimonio = existing_data_full[existing_data_full[db.OBRA_COL] == obra_logada].copy()
-        dados_locacoes_filt = df_locacoes[df_locacoes["obra_destino"] == obra_logada].copy()
+        obra_visao = st.session_state.selected_obra
+    perfil = "cards" if selected_page == "Inventário" else "dashboard"
+    _, _, dados_patrimonio, df_movimentacoes, dados_locacoes_filt = db.carregar_dados_app(obra_visao, perfil)
+    aviso_dados_desatualizados()
 
     if selected_page == "Dashboard":
         views.pagina_dashboard(dados_patrimonio, df_movimentacoes)
     elif selected_page == "Cadastrar Item":
         views.pagina_cadastrar_item(is_admin, lista_status, lista_obras_app, dados_patrimonio)
     elif selected_page == "Inventário":
-        views.pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes_filt, lista_status, lista_obras_app)
+        views.pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes_filt, lista_status, lista_obras_app, obra_visao)
+    elif selected_page == "Diagnóstico":
+        views.pagina_diagnostico()
 
 if not st.session_state.logged_in:
     tela_de_login()
 else:
-    app_principal()
+    metricas.iniciar_rodada()
+    try:
+        with metricas.medir("app.rodada"):
+            app_principal()
+    finally:
+        st.session_state["rodada_anterior"] = metricas.encerrar_rodada()
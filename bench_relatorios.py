@@ -0,0 +1,61 @@
+# Mede a geração do PDF de patrimônio (linhas/segundo) e dos QR das etiquetas
+# (QR/segundo: sequencial, em threads e num pool de processos) com dados sintéticos.
+# Uso: python bench_relatorios.py [linhas ...]   (padrão: 10000 100000)
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+import database as db
+import utils
+
+def dados_sinteticos(n):
+    ids = pd.RangeIndex(n)
+    return pd.DataFrame({
+        db.ID_COL: ids,
+        db.TOMBAMENTO_COL: "PAT-" + pd.Series(ids).astype(str).str.zfill(6),
+        db.OBRA_COL: "OBRA " + pd.Series(ids % 20).astype(str).str.zfill(2),
+        db.NOME_COL: "BETONEIRA ELÉTRICA 400L MODELO " + pd.Series(ids % 97).astype(str),
+        db.STATUS_COL: pd.Series(["ATIVO", "MANUTENÇÃO", "EMPRÉSTIMO", "BAIXADO"]).take(ids % 4).values,
+        db.LOCAL_COL: "ALMOXARIFADO " + pd.Series(ids % 7).astype(str),
+        db.RESPONSAVEL_COL: "RESPONSÁVEL " + pd.Series(ids % 31).astype(str),
+        db.VALOR_COL: (ids % 5000) * 10.5,
+    })
+
+def medir(n, processos):
+    df = dados_sinteticos(n)
+    inicio = time.perf_counter()
+    pdf = utils.gerar_pdf(df, tipo="patrimonio", obra_nome="Benchmark", processos=processos)
+    duracao = time.perf_counter() - inicio
+    print(f"{n:>7} linhas | processos={processos} | {duracao:7.2f}s | {n / duracao:9.0f} linhas/s | {len(pdf) / 1e6:6.1f} MB")
+
+QR_POR_MEDIDA = 500
+
+def _sequencial(payloads):
+    return [utils.gerar_png_qr(p, 6, 2) for p in payloads]
+
+def _em_threads(payloads):
+    with ThreadPoolExecutor(max_workers=utils.MAX_PROCESSOS_PDF) as pool:
+        return list(pool.map(utils.gerar_png_qr, payloads, [6] * len(payloads), [2] * len(payloads)))
+
+def _em_processos(payloads):
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=utils.MAX_PROCESSOS_PDF, mp_context=contexto) as pool:
+        return list(pool.map(utils.gerar_png_qr, payloads, [6] * len(payloads), [2] * len(payloads), chunksize=32))
+
+def medir_qr(n):
+    payloads = [utils.payload_qr(r) for r in dados_sinteticos(n).to_dict("records")]
+    for nome, gerar in [("sequencial", _sequencial), ("threads", _em_threads), ("processos", _em_processos)]:
+        inicio = time.perf_counter()
+        gerar(payloads)
+        duracao = time.perf_counter() - inicio
+        print(f"{n:>7} QR     | {nome:<10} | {duracao:7.2f}s | {n / duracao:9.0f} QR/s")
+
+if __name__ == "__main__":
+    tamanhos = [int(a) for a in sys.argv[1:]] or [10000, 100000]
+    print(f"{os.cpu_count()} núcleo(s)")
+    for n in tamanhos:
+        medir(n, 1)
+        medir(n, utils.MAX_PROCESSOS_PDF)
+    medir_qr(QR_POR_MEDIDA)
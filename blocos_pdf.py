@@ -0,0 +1,37 @@
+from fpdf import FPDF
+
+# Renderização dos blocos do relatório em PDF (utils.gerar_pdf). Fica fora de
+# utils porque roda nos processos do pool, iniciados com "spawn": o processo
+# filho importa só este módulo e o fpdf, sem streamlit, pandas nem o banco.
+ALTURA_LINHA = 7
+
+def _cabecalho_tabela(pdf, larguras, cabecalhos):
+    pdf.set_font('Arial', 'B', 9)
+    pdf.set_fill_color(220, 220, 220)
+    for width, header in zip(larguras, cabecalhos):
+        pdf.cell(width, 8, header, border=1, align='C', fill=True)
+    pdf.ln()
+    pdf.set_font('Arial', '', 8)
+
+# linhas: tuplas de texto já formatadas (qualquer iterável). Só o primeiro
+# bloco leva logo e título; o cabeçalho da tabela se repete a cada página.
+def renderizar_bloco(linhas, larguras, cabecalhos, titulo=None):
+    pdf = FPDF(orientation='L', unit='mm', format='A4')
+    pdf.add_page()
+    if titulo is not None:
+        try: pdf.image("Lavie.png", x=10, y=5, w=35)
+        except: pass
+        pdf.set_y(15)
+        pdf.set_font('Arial', 'B', 14)
+        pdf.cell(0, 10, titulo, 0, 1, 'C')
+        pdf.ln(5)
+
+    _cabecalho_tabela(pdf, larguras, cabecalhos)
+    for linha in linhas:
+        if pdf.will_page_break(ALTURA_LINHA):
+            pdf.add_page()
+            _cabecalho_tabela(pdf, larguras, cabecalhos)
+        for width, texto in zip(larguras, linha):
+            pdf.cell(width, ALTURA_LINHA, texto, border=1, align='C')
+        pdf.ln()
+    return bytes(pdf.output())
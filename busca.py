@@ -0,0 +1,91 @@
+import re
+import bisect
+import hashlib
+import pandas as pd
+import streamlit as st
+import database as db
+import metricas
+
+COLUNAS_BUSCA_PATRIMONIO = [db.NOME_COL, db.TOMBAMENTO_COL, db.RESPONSAVEL_COL, db.LOCAL_COL, db.ESPEC_COL]
+COLUNAS_BUSCA_LOCACOES = ["equipamento", "contrato_sienge", "responsavel"]
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Sem acentos e em minúsculas: "Betoneira Elétrica" -> "betoneira eletrica"
+def normalizar(serie):
+    return (
+        serie.astype(object).where(serie.notna(), "").astype(str)
+        .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+        .str.lower()
+    )
+
+def _trigramas(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+# Índice invertido token -> linhas, mais um índice de trigramas sobre o
+# vocabulário para achar os tokens que contêm um termo. Termos com menos de
+# 3 caracteres são buscados como prefixo no vocabulário ordenado.
+class IndiceBusca:
+    def __init__(self, df, colunas):
+        texto = pd.Series("", index=df.index)
+        for col in colunas:
+            texto = texto + " " + normalizar(df[col])
+
+        self.ids = df[db.ID_COL].tolist()
+        self.postagens = {}
+        for pos, tokens in enumerate(texto.str.findall(_TOKEN)):
+            for token in tokens:
+                self.postagens.setdefault(token, set()).add(pos)
+
+        self.vocabulario = sorted(self.postagens)
+        self.trigramas = {}
+        for token in self.vocabulario:
+            for tri in _trigramas(token):
+                self.trigramas.setdefault(tri, []).append(token)
+
+    def _tokens_com(self, termo):
+        if len(termo) < 3:
+            inicio = bisect.bisect_left(self.vocabulario, termo)
+            fim = bisect.bisect_left(self.vocabulario, termo + "{")
+            return self.vocabulario[inicio:fim]
+        listas = [self.trigramas.get(tri) for tri in _trigramas(termo)]
+        if not all(listas):
+            return []
+        return [token for token in min(listas, key=len) if termo in token]
+
+    # Todos os termos precisam aparecer (E); devolve os ids, ou None se a consulta é vazia
+    def buscar(self, consulta):
+        termos = _TOKEN.findall(normalizar(pd.Series([consulta])).iloc[0])
+        if not termos:
+            return None
+        posicoes = None
+        for termo in sorted(set(termos), key=len, reverse=True):
+            encontradas = set().union(*(self.postagens[t] for t in self._tokens_com(termo)))
+            posicoes = encontradas if posicoes is None else posicoes & encontradas
+            if not posicoes:
+                return set()
+        return {self.ids[pos] for pos in posicoes}
+
+@st.cache_resource(max_entries=16)
+@metricas.medido("busca.montar_indice")
+def _indice_em_cache(chave, colunas, _df):
+    return IndiceBusca(_df, list(colunas))
+
+# Chave de conteúdo para DataFrames sem versão: hash dos bytes do hash de cada
+# linha (uma soma colidiria com linhas trocadas ou que se anulam)
+def chave_conteudo(df):
+    if df.empty:
+        return 0
+    return hashlib.sha1(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes()).hexdigest()
+
+# O índice é montado uma vez por versão dos dados (attrs["versao_dados"] vindo
+# de db.carregar_dados_app); sem versão, usa o hash do conteúdo como chave.
+def buscar_ids(df, colunas, consulta):
+    colunas = tuple(c for c in colunas if c in df.columns)
+    if df.empty or not colunas:
+        return None
+    chave = df.attrs.get("versao_dados")
+    if chave is None:
+        chave = chave_conteudo(df[[db.ID_COL, *colunas]])
+    with metricas.medir("busca.consulta"):
+        return _indice_em_cache(chave, colunas, df).buscar(consulta)
@@ -1,6 +1,17 @@
 import streamlit as st
 import pandas as pd
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from pandas.api.types import union_categoricals
 from st_supabase_connection import SupabaseConnection
+import repositorio
+import imagens
+import metricas
 
 ID_COL = "id"
 OBRA_COL = "obra"
@@ -15,6 +26,22 @@ LOCAL_COL = "local_de_uso"
 RESPONSAVEL_COL = "responsavel"
 VALOR_COL = "valor"
 FOTO_COL = "foto_item"
+FOTO_MINIATURA_COL = "foto_miniatura"
+
+TAMANHO_PAGINA = 1000
+MAX_CONSULTAS_PARALELAS = 8
+TIMEOUT_CONSULTA = 15
+TENTATIVAS_CONSULTA = 3
+ESPERA_CONSULTA = 0.5
+
+# Coluna usada para ordenar a paginação de cada tabela (ordem estável entre páginas)
+ORDEM_TABELAS = {
+    "status": "nome_do_status",
+    "obras": "nome_da_obra",
+    "patrimonio": ID_COL,
+    "movimentacoes": ID_COL,
+    "locacoes": ID_COL,
+}
 
 def get_db_connection():
     try:
@@ -28,84 +55,1092 @@ def get_db_connection():
         st.error("ERRO GRAVE NA CONEXÃO COM O SUPABASE. Verifique os secrets.")
         st.stop()
 
-def upload_nota_fiscal(file_data, file_name):
-    conn = get_db_connection()
+# Repositório de dados em uso (Supabase ou banco local, ver repositorio.criar_repositorio)
+@st.cache_resource
+def get_repositorio():
     try:
-        bucket_name = "notas-fiscais"
-        conn.client.storage.from_(bucket_name).upload(
-            file=file_data,
-            path=file_name,
-            file_options={"content-type": "application/pdf", "x-upsert": "true"}
-        )
-        return conn.client.storage.from_(bucket_name).get_public_url(file_name)
+        config = dict(st.secrets.get("backend_dados", {}))
+    except Exception:
+        config = {}
+    return repositorio.criar_repositorio(config, get_db_connection)
+
+# Uploads: o caminho é o SHA-256 do conteúdo, então o mesmo arquivo sempre cai no
+# mesmo lugar (uma NF que cobre vários itens sobe uma vez só) e dois envios
+# diferentes nunca se sobrescrevem. Cada envio é repetido com espera exponencial
+# (com jitter) em caso de falha, e NF e foto sobem em paralelo (enviar_anexos).
+BUCKET_NOTAS = "notas-fiscais"
+BUCKET_FOTOS = "fotos-patrimonio"
+TENTATIVAS_UPLOAD = 3
+ESPERA_UPLOAD = 0.5
+MAX_UPLOADS_PARALELOS = 4
+
+@st.cache_resource
+def _executor_uploads():
+    return ThreadPoolExecutor(max_workers=MAX_UPLOADS_PARALELOS)
+
+# Caminhos já confirmados no storage neste processo: (bucket, caminho) -> url
+@st.cache_resource
+def _arquivos_enviados():
+    return {}
+
+def caminho_por_conteudo(dados, extensao):
+    return f"{hashlib.sha256(dados).hexdigest()}.{extensao}"
+
+# Espera exponencial com jitter (±50%) antes da tentativa seguinte
+def _espera(base, tentativa):
+    return base * 2 ** tentativa * random.uniform(0.5, 1.5)
+
+def _com_retentativas(funcao, *args):
+    for tentativa in range(TENTATIVAS_UPLOAD):
+        try:
+            return funcao(*args)
+        except repositorio.ArquivoExistente:
+            raise
+        except Exception:
+            if tentativa == TENTATIVAS_UPLOAD - 1:
+                raise
+            time.sleep(_espera(ESPERA_UPLOAD, tentativa))
+
+# O envio nunca sobrescreve: se o caminho já existe no bucket (mesmo conteúdo),
+# o erro de duplicado do próprio upload é o acerto da deduplicação, sem uma
+# consulta antes. Uma retentativa depois de um envio que chegou a gravar também
+# cai aqui. repo e enviados vêm da thread do script: as funções abaixo rodam no
+# pool sem chamar st.
+def _enviar_se_novo(repo, enviados, bucket, caminho, dados, tipo):
+    if (bucket, caminho) in enviados:
+        metricas.contar_cache("upload.dedup", True)
+        return enviados[(bucket, caminho)]
+    try:
+        with metricas.medir("upload.enviar_arquivo"):
+            url = _com_retentativas(repo.enviar_arquivo, bucket, caminho, dados, tipo)
+        metricas.contar_cache("upload.dedup", False)
+        metricas.contar("upload.bytes", len(dados))
+    except repositorio.ArquivoExistente as existente:
+        metricas.contar_cache("upload.dedup", True)
+        url = existente.url
+    enviados[(bucket, caminho)] = url
+    return url
+
+def _enviar_nota_fiscal(repo, enviados, file_data):
+    return _enviar_se_novo(repo, enviados, BUCKET_NOTAS, caminho_por_conteudo(file_data, "pdf"), file_data, "application/pdf")
+
+# A foto é reduzida e recomprimida antes do envio, e a miniatura usada nos cards
+# vai junto (imagens.caminho_miniatura). O caminho vem do arquivo original, para
+# reconhecer a mesma foto enviada de novo. Se o Pillow não conseguir ler o
+# arquivo, ele sobe como veio e fica sem miniatura. Devolve (url_foto, url_miniatura).
+def _enviar_foto(repo, enviados, file_data, file_type):
+    caminho = caminho_por_conteudo(file_data, "jpg")
+    try:
+        foto, miniatura = imagens.preparar_foto(file_data)
+    except Exception:
+        return _enviar_se_novo(repo, enviados, BUCKET_FOTOS, caminho, file_data, file_type), None
+    url_miniatura = _enviar_se_novo(repo, enviados, BUCKET_FOTOS, imagens.caminho_miniatura(caminho), miniatura, imagens.TIPO_FOTO)
+    return _enviar_se_novo(repo, enviados, BUCKET_FOTOS, caminho, foto, imagens.TIPO_FOTO), url_miniatura
+
+# Devolve (url_foto, url_miniatura); (None, None) se o envio falhar
+def upload_foto_patrimonio(file_data, file_type):
+    try:
+        return _enviar_foto(get_repositorio(), _arquivos_enviados(), file_data, file_type)
     except Exception as e:
-        st.error(f"Erro no upload da NF: {e}")
+        st.error(f"Erro no upload da Foto: {e}")
+        return None, None
+
+def _resultado_upload(nome, tarefa):
+    if tarefa is None:
+        return ""
+    try:
+        return tarefa.result()
+    except Exception as e:
+        st.error(f"Erro no upload da {nome}: {e}")
         return None
 
-def upload_foto_patrimonio(file_data, file_name, file_type):
-    conn = get_db_connection()
+# NF e foto em paralelo; devolve (link_nf, link_foto, link_miniatura), "" para o
+# que não foi enviado e None para o que falhou (o erro aparece na tela).
+# link_miniatura é None sempre que a foto não tiver miniatura.
+def enviar_anexos(pdf_data=None, foto_data=None, foto_tipo=None):
+    executor = _executor_uploads()
+    repo, enviados = get_repositorio(), _arquivos_enviados()
+    tarefa_nf = executor.submit(_enviar_nota_fiscal, repo, enviados, pdf_data) if pdf_data else None
+    tarefa_foto = executor.submit(_enviar_foto, repo, enviados, foto_data, foto_tipo) if foto_data else None
+    link_nf = _resultado_upload("NF", tarefa_nf)
+    foto = _resultado_upload("Foto", tarefa_foto)
+    link_foto, link_miniatura = foto if isinstance(foto, tuple) else (foto, None)
+    return link_nf, link_foto, link_miniatura
+
+def _consultar_pagina(repo, tabela, inicio, tamanho, colunas="*", filtros=(), contar=False):
+    return repo.consultar(tabela, colunas, filtros, ordem=ORDEM_TABELAS.get(tabela, ID_COL), inicio=inicio, limite=tamanho, contar=contar)
+
+# A primeira página de cada tabela traz o total (count=exact) e as demais são
+# disparadas no mesmo pool. Se o servidor devolver menos linhas que TAMANHO_PAGINA
+# (max-rows do PostgREST), esse tamanho vira o passo, sem truncar o resultado.
+# filtros: {tabela: [(operador, coluna, valor), ...]}, ex.: ("gt", "id", 120)
+# colunas: projeção única ("*", "id,obra") ou {tabela: projeção}
+# Cada página espera no máximo TIMEOUT_CONSULTA segundos; timeouts e erros de
+# transporte são refeitos até TENTATIVAS_CONSULTA vezes (espera exponencial com
+# jitter), e os demais erros sobem na hora. O pool é largado sem esperar as
+# chamadas penduradas, que terminam sozinhas em segundo plano.
+@metricas.medido("db.buscar_tabelas")
+def buscar_tabelas(repo, tabelas, colunas="*", filtros=None):
+    filtros = filtros or {}
+    if not isinstance(colunas, dict):
+        colunas = {tabela: colunas for tabela in tabelas}
+    linhas = {}
+    pool = ThreadPoolExecutor(max_workers=MAX_CONSULTAS_PARALELAS)
+    try:
+        primeiras = {
+            tabela: (repo, tabela, 0, TAMANHO_PAGINA, colunas.get(tabela, "*"), filtros.get(tabela, ()), True)
+            for tabela in tabelas
+        }
+        futuros = {tabela: pool.submit(_consultar_pagina, *args) for tabela, args in primeiras.items()}
+        restantes = {}
+        for tabela, futuro in futuros.items():
+            resp = _resultado(futuro, primeiras[tabela])
+            linhas[tabela] = list(resp.data)
+            passo = len(resp.data) or TAMANHO_PAGINA
+            total = resp.count if resp.count is not None else len(resp.data)
+            paginas = [
+                (repo, tabela, inicio, passo, colunas.get(tabela, "*"), filtros.get(tabela, ()))
+                for inicio in range(passo, total, passo)
+            ]
+            restantes[tabela] = [(args, pool.submit(_consultar_pagina, *args)) for args in paginas]
+        for tabela, paginas in restantes.items():
+            for args, futuro in paginas:
+                linhas[tabela].extend(_resultado(futuro, args).data)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    metricas.contar("db.linhas_lidas", sum(len(v) for v in linhas.values()))
+    return linhas
+
+# A retentativa roda num executor próprio de uma thread: no pool da carga ela
+# ficaria na fila atrás das chamadas penduradas que causaram o timeout. A chamada
+# original é cancelada (se ainda estiver na fila, sai dela).
+def _resultado(futuro, args):
+    for tentativa in range(TENTATIVAS_CONSULTA):
+        try:
+            return futuro.result(timeout=TIMEOUT_CONSULTA)
+        except Exception as e:
+            metricas.contar("db.consultas_falhas")
+            if tentativa == TENTATIVAS_CONSULTA - 1 or not _erro_transitorio(e):
+                raise
+            futuro.cancel()
+            time.sleep(_espera(ESPERA_CONSULTA, tentativa))
+            executor = ThreadPoolExecutor(max_workers=1)
+            futuro = executor.submit(_consultar_pagina, *args)
+            executor.shutdown(wait=False)
+
+def _erro_transitorio(erro):
+    return isinstance(erro, FuturesTimeoutError) or repositorio.erro_transitorio(erro)
+
+COLUNAS_PATRIMONIO = [
+    ID_COL, OBRA_COL, TOMBAMENTO_COL, NOME_COL, ESPEC_COL, 
+    OBS_COL, LOCAL_COL, RESPONSAVEL_COL, NF_NUM_COL, 
+    NF_LINK_COL, VALOR_COL, STATUS_COL, FOTO_COL, FOTO_MINIATURA_COL
+]
+COLUNAS_MOVIMENTACOES = [
+    ID_COL, OBRA_COL, TOMBAMENTO_COL, "tipo_movimentacao", 
+    "data_hora", "responsavel_movimentacao", "observacoes"
+]
+COLUNAS_LOCACOES = [
+    "id", "equipamento", "obra_destino", "responsavel", "quantidade", 
+    "unidade", "valor_mensal", "contrato_sienge", "status", 
+    "data_inicio", "data_previsao_fim"
+]
+
+TABELAS_DADOS = ["patrimonio", "movimentacoes", "locacoes"]
+COLUNAS_TABELAS = {"patrimonio": COLUNAS_PATRIMONIO, "movimentacoes": COLUNAS_MOVIMENTACOES, "locacoes": COLUNAS_LOCACOES}
+
+# Colunas buscadas por tela. None = todas as colunas ("*"). As colunas largas
+# (observações, NF) ficam de fora dos perfis leves e são buscadas sob demanda
+# (completar_colunas / carregar_item). "login" só precisa das listas de obras e status.
+PERFIS_COLUNAS = {
+    "login": {},
+    "dashboard": {
+        "patrimonio": [ID_COL, OBRA_COL, TOMBAMENTO_COL, NOME_COL, STATUS_COL, RESPONSAVEL_COL, VALOR_COL],
+        "movimentacoes": [ID_COL, OBRA_COL, TOMBAMENTO_COL, "tipo_movimentacao", "data_hora"],
+        "locacoes": None,
+    },
+    "cards": {
+        "patrimonio": [
+            ID_COL, OBRA_COL, TOMBAMENTO_COL, NOME_COL, STATUS_COL, RESPONSAVEL_COL, VALOR_COL,
+            LOCAL_COL, ESPEC_COL, NF_LINK_COL, FOTO_COL, FOTO_MINIATURA_COL
+        ],
+        "movimentacoes": [ID_COL, OBRA_COL, TOMBAMENTO_COL, "tipo_movimentacao", "data_hora"],
+        "locacoes": None,
+    },
+    "tabela": {
+        "patrimonio": None,
+        "movimentacoes": None,
+        "locacoes": None,
+    },
+}
+# Perfis de largura total não alteram a projeção compartilhada: a carga usa o
+# perfil base e as colunas restantes vêm de completar_colunas
+PERFIL_BASE = {"tabela": "cards"}
+# Coluna que define a obra de cada linha; cada tabela é guardada em partições por obra
+COLUNA_OBRA = {"patrimonio": OBRA_COL, "movimentacoes": OBRA_COL, "locacoes": "obra_destino"}
+SEM_OBRA = ""
+# Tabelas carregadas sempre inteiras: a visão de uma obra traz as linhas dos
+# tombamentos do patrimônio dessa obra, em qualquer obra. Uma transferência grava
+# a movimentação na obra de destino, e a "Entrada" original (data de aquisição)
+# fica na obra de origem.
+ESCOPO_POR_TOMBAMENTO = {"movimentacoes"}
+COLUNA_ALTERACAO = "updated_at"
+INTERVALO_SINCRONIZACAO = 30
+# Com o feed de alterações ativo, a sincronização por consulta vira só uma rede de segurança
+INTERVALO_SINCRONIZACAO_COM_FEED = 900
+INTERVALO_CONFERENCIA_EXCLUSOES = 600
+
+# Tipos aplicados uma única vez na carga (valem para qualquer tabela que tenha a
+# coluna): categorias para textos repetitivos, datas em UTC e números.
+ESQUEMA_COLUNAS = {
+    OBRA_COL: "categoria",
+    STATUS_COL: "categoria",
+    LOCAL_COL: "categoria",
+    RESPONSAVEL_COL: "categoria",
+    "tipo_movimentacao": "categoria",
+    "responsavel_movimentacao": "categoria",
+    "obra_destino": "categoria",
+    "unidade": "categoria",
+    VALOR_COL: "numero",
+    "valor_mensal": "numero",
+    "valor_total": "numero",
+    "quantidade": "numero",
+    "data_hora": "data",
+    "data_inicio": "data",
+    "data_previsao_fim": "data",
+    "created_at": "data",
+    COLUNA_ALTERACAO: "data",
+}
+
+def _aplicar_esquema(df):
+    for col, tipo in ESQUEMA_COLUNAS.items():
+        if col not in df.columns:
+            continue
+        if tipo == "categoria":
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        elif tipo == "numero":
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+    return df
+
+# colunas: projeção usada na consulta (None = todas); define as colunas do DataFrame vazio
+def _montar_df(tabela, linhas, colunas=None):
+    esperadas = COLUNAS_TABELAS[tabela] if colunas is None else colunas
+
+    df = pd.DataFrame(linhas)
+    if df.empty: 
+         df = pd.DataFrame(columns=esperadas)
+    if tabela == "patrimonio":
+        for col in esperadas:
+            if col not in df.columns:
+                df[col] = None
+    df = _aplicar_esquema(df)
+    if VALOR_COL in df.columns and tabela == "patrimonio":
+        df[VALOR_COL] = df[VALOR_COL].fillna(0)
+    return df
+
+# Concatena partições mantendo as colunas categóricas (pd.concat viraria object
+# se as categorias de cada parte forem diferentes)
+def _concatenar(partes):
+    partes = [p for p in partes if not p.empty] or partes[:1]
+    if len(partes) == 1:
+        return partes[0].reset_index(drop=True)
+    for col in partes[0].columns:
+        series = [p[col] for p in partes if col in p.columns]
+        if len(series) == len(partes) and all(isinstance(x.dtype, pd.CategoricalDtype) for x in series):
+            tipo = pd.CategoricalDtype(union_categoricals(series, ignore_order=True).categories)
+            partes = [p.assign(**{col: p[col].cat.set_categories(tipo.categories)}) for p in partes]
+    return pd.concat(partes, ignore_index=True)
+
+def _projecao(estado, tabela):
+    colunas = estado.colunas[tabela]
+    if colunas is None:
+        return "*"
+    extras = [ID_COL, COLUNA_OBRA[tabela]]
+    marca = estado.marcas.get(tabela)
+    if marca:
+        extras.append(marca[1])
+    return ",".join(dict.fromkeys(extras + sorted(colunas)))
+
+def _dividir_por_obra(tabela, df):
+    if df.empty:
+        return {}
+    return {
+        (SEM_OBRA if pd.isna(obra) else obra): parte.reset_index(drop=True)
+        for obra, parte in df.groupby(COLUNA_OBRA[tabela], dropna=False, sort=False, observed=True)
+    }
+
+# Marca d'água da tabela: updated_at quando a coluna existe (sql/updated_at.sql),
+# senão o maior id. Lida no servidor antes da carga, para não depender de quais
+# obras já estão em memória.
+def _marca_servidor(repo, tabela):
+    resp = repo.consultar(tabela, ordem=ID_COL, desc=True, limite=1)
+    if not resp.data:
+        return None
+    if COLUNA_ALTERACAO in resp.data[0]:
+        resp = repo.consultar(tabela, COLUNA_ALTERACAO, ordem=COLUNA_ALTERACAO, desc=True, limite=1)
+        return ("gt", COLUNA_ALTERACAO, resp.data[0][COLUNA_ALTERACAO])
+    return ("gt", ID_COL, int(resp.data[0][ID_COL]))
+
+# Só a marca por updated_at enxerga edições; por id (ou sem marca) a
+# sincronização relê as partições inteiras (ver _substituir_particoes)
+def _marca_incremental(marca):
+    return marca is not None and marca[1] == COLUNA_ALTERACAO
+
+def _avancar_marca(marca, linhas):
+    coluna = marca[1] if marca else (COLUNA_ALTERACAO if linhas and COLUNA_ALTERACAO in linhas[0] else ID_COL)
+    valores = [row[coluna] for row in linhas if row.get(coluna) is not None]
+    if not valores:
+        return marca
+    maior = max(valores)
+    return ("gt", coluna, maior if not marca else max(maior, marca[2]))
+
+def _mesclar(df, novas, ids_descartar):
+    if ids_descartar:
+        df = df[~df[ID_COL].isin(ids_descartar)]
+    if not novas.empty:
+        df = _concatenar([df, novas])
+    return df.sort_values(ID_COL, kind="stable").reset_index(drop=True)
+
+# Estado compartilhado entre as sessões: partições por obra de cada tabela,
+# marca d'água por tabela e ids alterados pelo app que ainda precisam ser relidos.
+# completo[tabela] indica que todas as obras (inclusive linhas sem obra) estão em memória;
+# colunas[tabela] é a projeção comum a todas as partições da tabela (None = todas);
+# versoes[tabela][obra] é o contador de versão de cada partição: recebe o próximo
+# valor de um relógio único sempre que o conteúdo daquela partição muda, então a
+# versão da visão "Todas" é simplesmente a maior versão da tabela.
+# lock protege as estruturas (seguro por pouco tempo, inclusive por quem só lê);
+# lock_rede serializa as operações que consultam o banco e depois alteram o estado.
+class EstadoDados:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.lock_rede = threading.Lock()
+        self.lista_status = None
+        self.lista_obras = None
+        self.particoes = {tabela: {} for tabela in TABELAS_DADOS}
+        self.completo = {tabela: False for tabela in TABELAS_DADOS}
+        self.colunas = {tabela: set() for tabela in TABELAS_DADOS}
+        self.versoes = {tabela: {} for tabela in TABELAS_DADOS}
+        self.relogio = 0
+        self.marcas = {}
+        self.ids_pendentes = {tabela: set() for tabela in TABELAS_DADOS}
+        self.ultima_sincronizacao = 0.0
+        self.ultima_conferencia = 0.0
+        self.carimbo = _carimbo_snapshot()
+        self.reconciliar_snapshot = False
+        self.feed_iniciado = False
+        self.feed_ativo = False
+        self.sincronizar_ja = False
+        self.dados_de = 0.0
+        self.falhas_seguidas = 0
+        self.proxima_tentativa = 0.0
+        self.ultimo_erro = None
+        self.ultimo_snapshot = 0.0
+
+@st.cache_resource
+def _estado_dados():
+    estado = EstadoDados()
+    _ler_snapshot(estado)
+    return estado
+
+def _atualizar_listas(estado, dados):
+    lista_status = [row['nome_do_status'] for row in dados["status"]]
+    lista_obras = [row['nome_da_obra'] for row in dados["obras"]]
+    with estado.lock:
+        estado.lista_status, estado.lista_obras = lista_status, lista_obras
+
+def _obra_carregada(tabela, obra):
+    return None if tabela in ESCOPO_POR_TOMBAMENTO else obra
+
+def _faltantes(estado, obra):
+    return [
+        t for t in TABELAS_DADOS
+        if not estado.completo[t] and (_obra_carregada(t, obra) is None or obra not in estado.particoes[t])
+    ]
+
+# obra=None carrega todas as obras que ainda faltam (visão "Todas" do admin)
+def _carregar_particoes(repo, estado, obra):
+    faltantes = _faltantes(estado, obra)
+    if not faltantes:
+        return
+    filtros = {}
+    for t in faltantes:
+        if _obra_carregada(t, obra) is not None:
+            filtros[t] = [("eq", COLUNA_OBRA[t], obra)]
+        elif estado.particoes[t]:
+            filtros[t] = [("fora_de", COLUNA_OBRA[t], list(estado.particoes[t]))]
+
+    for t in faltantes:
+        if t not in estado.marcas:
+            estado.marcas[t] = _marca_servidor(repo, t)
+    dados = buscar_tabelas(repo, faltantes, colunas={t: _projecao(estado, t) for t in faltantes}, filtros=filtros)
+    for t in faltantes:
+        df = _montar_df(t, dados[t], _colunas_df(estado, t))
+        with estado.lock:
+            if _obra_carregada(t, obra) is None:
+                novas = _dividir_por_obra(t, df)
+                estado.particoes[t].update(novas)
+                estado.completo[t] = True
+                _nova_versao(estado, t, novas)
+            else:
+                estado.particoes[t][obra] = df
+                _nova_versao(estado, t, [obra])
+
+def _colunas_df(estado, tabela):
+    projecao = _projecao(estado, tabela)
+    return None if projecao == "*" else projecao.split(",")
+
+def _obras_carregadas(estado, tabela):
+    return [o for o in estado.particoes[tabela] if o != SEM_OBRA]
+
+# colunas=None (todas) só define a projeção na primeira carga da tabela (ex.:
+# locações, sempre inteiras); depois disso, largura total é servida por
+# completar_colunas numa consulta avulsa, sem alargar a projeção compartilhada.
+def _colunas_faltando(estado, tabela, colunas):
+    atuais = estado.colunas[tabela]
+    if atuais is None:
+        return False
+    if colunas is None:
+        return not estado.particoes[tabela]
+    return not set(colunas) <= atuais
+
+# Amplia a projeção da tabela para incluir as colunas pedidas: as partições já
+# em memória recebem só as colunas que faltam (id + faltantes), unidas por id.
+def _garantir_colunas(repo, estado, tabela, colunas):
+    if not _colunas_faltando(estado, tabela, colunas):
+        return
+    atuais = estado.colunas[tabela]
+    if not estado.particoes[tabela]:
+        estado.colunas[tabela] = None if colunas is None else atuais | set(colunas)
+        return
+
+    filtros = {} if estado.completo[tabela] else {tabela: [("in_", COLUNA_OBRA[tabela], _obras_carregadas(estado, tabela))]}
+    faltantes = sorted(set(colunas) - atuais)
+    dados = buscar_tabelas(repo, [tabela], colunas=",".join([ID_COL] + faltantes), filtros=filtros)
+    extra = _montar_df(tabela, dados[tabela], [ID_COL] + faltantes)[[ID_COL] + faltantes]
+    with estado.lock:
+        for chave, parte in estado.particoes[tabela].items():
+            estado.particoes[tabela][chave] = parte.drop(columns=faltantes, errors="ignore").merge(extra, on=ID_COL, how="left")
+        estado.colunas[tabela] = atuais | set(faltantes)
+        _nova_versao(estado, tabela, estado.particoes[tabela])
+
+# Chamada com lock
+def _nova_versao(estado, tabela, obras):
+    for obra in obras:
+        estado.relogio += 1
+        estado.versoes[tabela][obra] = estado.relogio
+
+# Só as partições que recebem linhas ou perdem ids são refeitas (e mudam de versão)
+def _aplicar_alteracoes(estado, tabela, novas, ids_descartar):
+    por_obra = _dividir_por_obra(tabela, novas)
+    with estado.lock:
+        alteradas = []
+        for chave, parte in list(estado.particoes[tabela].items()):
+            entrada = por_obra.pop(chave, pd.DataFrame())
+            if entrada.empty and not (ids_descartar and parte[ID_COL].isin(ids_descartar).any()):
+                continue
+            estado.particoes[tabela][chave] = _mesclar(parte, entrada, ids_descartar)
+            alteradas.append(chave)
+        if estado.completo[tabela]:
+            estado.particoes[tabela].update(por_obra)
+            alteradas.extend(por_obra)
+        _nova_versao(estado, tabela, alteradas)
+
+# Troca as partições em memória pelo conteúdo relido do banco (as obras
+# carregadas, ou a tabela toda se completa); só as que mudaram trocam de versão
+def _substituir_particoes(estado, tabela, df):
+    por_obra = _dividir_por_obra(tabela, df.sort_values(ID_COL, kind="stable") if not df.empty else df)
+    with estado.lock:
+        chaves = set(estado.particoes[tabela])
+        if estado.completo[tabela]:
+            chaves |= set(por_obra)
+        alteradas = []
+        for chave in chaves:
+            nova = por_obra.get(chave)
+            if nova is None:
+                nova = _montar_df(tabela, [], _colunas_df(estado, tabela))
+            atual = estado.particoes[tabela].get(chave)
+            if atual is not None and atual.reset_index(drop=True).equals(nova.reset_index(drop=True)):
+                continue
+            estado.particoes[tabela][chave] = nova
+            alteradas.append(chave)
+        _nova_versao(estado, tabela, alteradas)
+
+@metricas.medido("db.sincronizar")
+def _sincronizar(repo, estado):
+    with estado.lock:
+        estado.sincronizar_ja = False
+        tabelas = [t for t in TABELAS_DADOS if t in estado.marcas]
+        recarregar = [t for t in tabelas if not _marca_incremental(estado.marcas[t])]
+        projecoes = {t: _projecao(estado, t) for t in tabelas}
+        conferir = time.time() - estado.ultima_conferencia > INTERVALO_CONFERENCIA_EXCLUSOES
+        filtros_obras = {
+            t: [("in_", COLUNA_OBRA[t], _obras_carregadas(estado, t))]
+            for t in tabelas if not estado.completo[t]
+        }
+        filtros = {t: [estado.marcas[t]] for t in tabelas if t not in recarregar}
+        filtros.update({t: filtros_obras[t] for t in recarregar if t in filtros_obras})
+        pendentes = {t: set(ids) for t, ids in estado.ids_pendentes.items() if ids and t in estado.marcas}
+        pendentes_incrementais = {t: ids for t, ids in pendentes.items() if t not in recarregar}
+        conferidas = [t for t in tabelas if t not in recarregar] if conferir else []
+
+    # Tabela que estava vazia na carga ainda não tem marca: lida antes da releitura
+    sondadas = {t: _marca_servidor(repo, t) for t in recarregar if estado.marcas[t] is None}
+    dados = buscar_tabelas(repo, ["status", "obras"] + tabelas, colunas=projecoes, filtros=filtros)
+    if pendentes_incrementais:
+        relidos = buscar_tabelas(
+            repo, list(pendentes_incrementais), colunas=projecoes,
+            filtros={t: [("in_", ID_COL, list(ids))] for t, ids in pendentes_incrementais.items()},
+        )
+    else:
+        relidos = {}
+    ids_atuais = buscar_tabelas(repo, conferidas, colunas=ID_COL, filtros=filtros_obras) if conferidas else {}
+
+    _atualizar_listas(estado, dados)
+    for tabela in tabelas:
+        if tabela in recarregar:
+            _substituir_particoes(estado, tabela, _montar_df(tabela, dados[tabela], _colunas_df(estado, tabela)))
+            with estado.lock:
+                estado.ids_pendentes[tabela] -= pendentes.get(tabela, set())
+                if tabela in sondadas:
+                    estado.marcas[tabela] = sondadas[tabela]
+            continue
+        linhas = dados[tabela] + relidos.get(tabela, [])
+        ids_descartar = pendentes.get(tabela, set()) | {row[ID_COL] for row in linhas}
+        if tabela in ids_atuais:
+            existentes = {row[ID_COL] for row in ids_atuais[tabela]}
+            for parte in list(estado.particoes[tabela].values()):
+                ids_descartar.update(set(parte[ID_COL].tolist()) - existentes)
+        if ids_descartar:
+            novas = _montar_df(tabela, linhas, _colunas_df(estado, tabela)).drop_duplicates(ID_COL, keep="last") if linhas else pd.DataFrame()
+            _aplicar_alteracoes(estado, tabela, novas, ids_descartar)
+        with estado.lock:
+            estado.marcas[tabela] = _avancar_marca(estado.marcas[tabela], dados[tabela])
+            estado.ids_pendentes[tabela] -= pendentes.get(tabela, set())
+    with estado.lock:
+        estado.ultima_sincronizacao = time.time()
+        estado.dados_de = estado.ultima_sincronizacao
+        if conferir:
+            estado.ultima_conferencia = estado.ultima_sincronizacao
+
+# Chamadas pelas telas depois de gravar: os ids informados são relidos (ou
+# removidos, se não existirem mais) na próxima leitura, sem recarregar o resto.
+def marcar_alteracao(tabela, ids=()):
+    estado = _estado_dados()
+    with estado.lock:
+        estado.ids_pendentes[tabela].update(int(i) for i in ids)
+        estado.ultima_sincronizacao = 0.0
+        estado.sincronizar_ja = True
+
+def marcar_exclusao(tabela, ids):
+    estado = _estado_dados()
+    _aplicar_alteracoes(estado, tabela, pd.DataFrame(), {int(i) for i in ids})
+    with estado.lock:
+        estado.ultima_sincronizacao = 0.0
+
+TAMANHO_LOTE_INSERCAO = 500
+
+# Insere as linhas em lotes de TAMANHO_LOTE_INSERCAO (um round trip por lote).
+# ao_progredir(inseridas, total) é chamada depois de cada lote; se um lote falhar,
+# os anteriores continuam gravados (e marcados para releitura).
+@metricas.medido("db.inserir_em_lotes")
+def inserir_em_lotes(tabela, linhas, ao_progredir=None):
+    repo = get_repositorio()
+    ids = []
     try:
-        bucket_name = "fotos-patrimonio"
-        conn.client.storage.from_(bucket_name).upload(
-            file=file_data,
-            path=file_name,
-            file_options={"content-type": file_type, "x-upsert": "true"}
+        for inicio in range(0, len(linhas), TAMANHO_LOTE_INSERCAO):
+            inseridos = repo.inserir(tabela, linhas[inicio:inicio + TAMANHO_LOTE_INSERCAO])
+            ids.extend(row[ID_COL] for row in inseridos)
+            if ao_progredir:
+                ao_progredir(min(inicio + TAMANHO_LOTE_INSERCAO, len(linhas)), len(linhas))
+    finally:
+        if ids:
+            marcar_alteracao(tabela, ids)
+    return ids
+
+TAMANHO_LOTE_CONSULTA_IN = 200
+
+# Quais dos tombamentos informados já estão cadastrados, em qualquer obra
+# (filtro "in" no servidor, em lotes para não estourar o tamanho da URL)
+@metricas.medido("db.tombamentos_cadastrados")
+def tombamentos_cadastrados(tombamentos):
+    valores = sorted({str(t) for t in tombamentos if t})
+    if not valores:
+        return set()
+    repo = get_repositorio()
+    existentes = set()
+    for inicio in range(0, len(valores), TAMANHO_LOTE_CONSULTA_IN):
+        filtro = ("in_", TOMBAMENTO_COL, valores[inicio:inicio + TAMANHO_LOTE_CONSULTA_IN])
+        dados = buscar_tabelas(repo, ["patrimonio"], colunas=TOMBAMENTO_COL, filtros={"patrimonio": [filtro]})
+        existentes.update(row[TOMBAMENTO_COL] for row in dados["patrimonio"])
+    return existentes
+
+# Status do item depois de cada tipo de movimentação
+STATUS_MOVIMENTACAO = {"Entrada": "ATIVO", "Saída": "EMPRÉSTIMO"}
+
+# Aplica ao estado em memória as linhas devolvidas por uma escrita, sem reler do banco
+def aplicar_linhas(tabela, linhas):
+    estado = _estado_dados()
+    if not linhas or tabela not in estado.marcas:
+        return
+    colunas = _colunas_df(estado, tabela)
+    df = _montar_df(tabela, linhas)
+    if colunas is not None:
+        df = df[[c for c in colunas if c in df.columns]]
+    _aplicar_alteracoes(estado, tabela, df, {int(row[ID_COL]) for row in linhas})
+
+# Registra a mesma movimentação para vários itens (ids de patrimonio) numa única
+# chamada transacional ao banco (sql/registrar_movimentacoes.sql): insere as
+# movimentações, atualiza status e, se obra_destino for informada, a obra. As
+# linhas devolvidas (patrimonio e movimentações) entram no cache na hora.
+@metricas.medido("db.registrar_movimentacoes")
+def registrar_movimentacoes(ids, tipo, responsavel, observacoes="", obra_destino=None):
+    ids = [int(i) for i in ids]
+    gravadas = get_repositorio().registrar_movimentacoes(
+        ids, tipo, STATUS_MOVIMENTACAO[tipo], responsavel, observacoes, obra_destino
+    )
+    aplicar_linhas("patrimonio", gravadas["patrimonio"])
+    aplicar_linhas("movimentacoes", gravadas["movimentacoes"])
+    return ids
+
+# Versão do conteúdo em memória de uma tabela numa obra (None = todas as obras).
+# Caches derivados usam essa versão como chave: uma escrita só invalida o que
+# depende da tabela e da obra alteradas.
+def versao_dados(tabela, obra=None):
+    estado = _estado_dados()
+    with estado.lock:
+        return _versao(estado, tabela, obra)
+
+def _versao(estado, tabela, obra):
+    versoes = estado.versoes[tabela]
+    if obra is None:
+        return max(versoes.values(), default=0)
+    return versoes.get(obra, 0)
+
+# O DataFrame devolvido leva em attrs["versao_dados"] a identificação do conteúdo
+# (tabela, obra, versão), usada como chave pelos caches derivados (ex.: índice de busca).
+@metricas.medido("db.visao")
+def _visao(estado, tabela, obra):
+    if obra is not None and tabela in ESCOPO_POR_TOMBAMENTO:
+        return _visao_por_tombamento(estado, tabela, obra)
+    if obra is None:
+        partes = [p for p in estado.particoes[tabela].values() if not p.empty]
+        if not partes:
+            df = _montar_df(tabela, [], _colunas_df(estado, tabela))
+        else:
+            df = _concatenar(partes).sort_values(ID_COL, kind="stable").reset_index(drop=True)
+    else:
+        parte = estado.particoes[tabela].get(obra)
+        df = parte.copy() if parte is not None else _montar_df(tabela, [], _colunas_df(estado, tabela))
+    df.attrs["versao_dados"] = (tabela, obra, _versao(estado, tabela, obra))
+    return df
+
+# A versão combina a da tabela inteira com a do patrimônio da obra (que define
+# os tombamentos em visão)
+def _visao_por_tombamento(estado, tabela, obra):
+    df = _visao(estado, tabela, None)
+    patrimonio = estado.particoes["patrimonio"].get(obra)
+    tombamentos = patrimonio[TOMBAMENTO_COL].dropna().unique() if patrimonio is not None else []
+    if not df.empty:
+        df = df[df[TOMBAMENTO_COL].isin(tombamentos)].reset_index(drop=True)
+    df.attrs["versao_dados"] = (tabela, obra, (_versao(estado, tabela, None), _versao(estado, "patrimonio", obra)))
+    return df
+
+def _sincronizacao_vencida(estado):
+    intervalo = INTERVALO_SINCRONIZACAO_COM_FEED if estado.feed_ativo else INTERVALO_SINCRONIZACAO
+    return estado.lista_obras is None or time.time() - estado.ultima_sincronizacao > intervalo
+
+# O que a tela não consegue mostrar sem ir ao banco (a leitura espera): listas,
+# partições e colunas que ainda não estão em memória, e a releitura logo depois de
+# uma gravação do próprio usuário. Sincronização apenas vencida não entra aqui:
+# os dados em memória são servidos e a atualização roda em segundo plano.
+# Durante a espera de uma falha anterior, nada bloqueia.
+def _faltam_dados(estado, obra=None, perfil="login"):
+    with estado.lock:
+        if time.time() < estado.proxima_tentativa and estado.lista_obras is not None:
+            return False
+        if estado.lista_obras is None or estado.sincronizar_ja:
+            return True
+        if perfil == "login":
+            return False
+        if any(_colunas_faltando(estado, t, c) for t, c in PERFIS_COLUNAS[perfil].items()):
+            return True
+        return bool(_faltantes(estado, obra))
+
+# Chamada com lock_rede
+def _preparar_estado(repo, estado):
+    if estado.lista_obras is None:
+        _atualizar_listas(estado, buscar_tabelas(repo, ["status", "obras"]))
+        estado.ultima_sincronizacao = time.time()
+        estado.ultima_conferencia = estado.dados_de = estado.ultima_sincronizacao
+    elif _sincronizacao_vencida(estado):
+        _sincronizar(repo, estado)
+
+# Snapshot em disco (Arrow/Feather, sem compressão para poder ser lido com
+# memory_map): depois de um restart, as telas abrem com os dados do disco e a
+# conferência com o banco roda em segundo plano.
+DIRETORIO_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_dados")
+VERSAO_SNAPSHOT = 3
+INTERVALO_SNAPSHOT = 300
+
+# Versão do formato + banco de origem; snapshot com outro carimbo é ignorado
+def _carimbo_snapshot():
+    try:
+        config = st.secrets.get("backend_dados", {})
+        url = config["caminho"] if config.get("tipo") == "sqlite" else st.secrets["connections"]["supabase"]["url"]
+    except Exception:
+        url = ""
+    return f"{VERSAO_SNAPSHOT}:{hashlib.sha256(url.encode()).hexdigest()[:16]}"
+
+def _arquivo_snapshot(nome):
+    return os.path.join(DIRETORIO_SNAPSHOT, nome)
+
+@metricas.medido("db.salvar_snapshot")
+def _salvar_snapshot(estado):
+    try:
+        import pyarrow.feather as feather
+    except ModuleNotFoundError:
+        return
+    with estado.lock:
+        if estado.lista_obras is None:
+            return
+        # Sem marca por updated_at, a reconciliação não veria as linhas editadas
+        # enquanto o snapshot esteve em disco: essas tabelas não são guardadas
+        guardadas = [t for t in TABELAS_DADOS if _marca_incremental(estado.marcas.get(t))]
+        meta = {
+            "carimbo": estado.carimbo,
+            "salvo_em": time.time(),
+            "lista_status": estado.lista_status,
+            "lista_obras": estado.lista_obras,
+            "marcas": {t: list(estado.marcas[t]) for t in guardadas},
+            "completo": {t: t in guardadas and estado.completo[t] for t in TABELAS_DADOS},
+            "colunas": {t: None if c is None else sorted(c) for t, c in estado.colunas.items()},
+            "particoes": {t: list(estado.particoes[t]) if t in guardadas else [] for t in TABELAS_DADOS},
+        }
+        partes = {t: list(estado.particoes[t].values()) for t in guardadas}
+        estado.ultimo_snapshot = meta["salvo_em"]
+    try:
+        os.makedirs(DIRETORIO_SNAPSHOT, exist_ok=True)
+        for tabela, lista in partes.items():
+            if not lista:
+                continue
+            temporario = _arquivo_snapshot(f"{tabela}.arrow.tmp")
+            feather.write_feather(_concatenar(lista), temporario, compression="uncompressed")
+            os.replace(temporario, _arquivo_snapshot(f"{tabela}.arrow"))
+        temporario = _arquivo_snapshot("snapshot.json.tmp")
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporario, _arquivo_snapshot("snapshot.json"))
+    except Exception:
+        pass
+
+def _agendar_snapshot(estado):
+    if time.time() - estado.ultimo_snapshot > INTERVALO_SNAPSHOT:
+        estado.ultimo_snapshot = time.time()
+        threading.Thread(target=_salvar_snapshot, args=(estado,), daemon=True).start()
+
+@metricas.medido("db.ler_snapshot")
+def _ler_snapshot(estado):
+    try:
+        import pyarrow.feather as feather
+        with open(_arquivo_snapshot("snapshot.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("carimbo") != estado.carimbo:
+            return
+        marcas = {t: tuple(m) for t, m in meta["marcas"].items() if m and _marca_incremental(tuple(m))}
+        particoes = {}
+        for tabela in TABELAS_DADOS:
+            obras = meta["particoes"][tabela]
+            colunas = meta["colunas"][tabela]
+            vazio = _montar_df(tabela, [], colunas)
+            if not obras or tabela not in marcas:
+                particoes[tabela] = {}
+                continue
+            tabela_arrow = feather.read_table(_arquivo_snapshot(f"{tabela}.arrow"), memory_map=True)
+            partes = _dividir_por_obra(tabela, _aplicar_esquema(tabela_arrow.to_pandas()))
+            particoes[tabela] = {obra: partes.get(obra, vazio) for obra in obras}
+    except (ModuleNotFoundError, OSError, ValueError, KeyError):
+        return
+
+    estado.lista_status = meta["lista_status"]
+    estado.lista_obras = meta["lista_obras"]
+    estado.particoes = particoes
+    for tabela in TABELAS_DADOS:
+        _nova_versao(estado, tabela, particoes[tabela])
+    estado.completo = {t: bool(meta["completo"][t]) and t in marcas for t in TABELAS_DADOS}
+    estado.colunas = {t: None if c is None else set(c) for t, c in meta["colunas"].items()}
+    estado.marcas = marcas
+    estado.ultima_sincronizacao = time.time()
+    estado.ultimo_snapshot = estado.dados_de = meta["salvo_em"]
+    estado.reconciliar_snapshot = True
+
+# Primeira sincronização depois de abrir do disco, incluindo a conferência de exclusões
+def _reconciliar_em_fundo(repo, estado):
+    try:
+        with estado.lock_rede:
+            estado.ultima_conferencia = 0.0
+            _sincronizar(repo, estado)
+        _registrar_sucesso(estado)
+        _salvar_snapshot(estado)
+    except Exception as e:
+        _registrar_falha(estado, e)
+
+def _iniciar_reconciliacao(repo, estado):
+    with estado.lock:
+        if not estado.reconciliar_snapshot:
+            return
+        estado.reconciliar_snapshot = False
+    threading.Thread(target=_reconciliar_em_fundo, args=(repo, estado), daemon=True).start()
+
+# Feed de alterações do banco (repositorio.assinar_alteracoes): cada evento é
+# aplicado direto nas partições em memória, sem consultar o banco. Ao conectar ou
+# cair, a próxima leitura sincroniza para cobrir os eventos que possam ter se
+# perdido no intervalo: edições pela marca updated_at (ou releitura inteira das
+# partições, sem ela) e exclusões pela conferência de ids, antecipada.
+def _iniciar_feed(repo, estado):
+    with estado.lock:
+        if estado.feed_iniciado:
+            return
+        estado.feed_iniciado = True
+    try:
+        repo.assinar_alteracoes(
+            TABELAS_DADOS + ["status", "obras"],
+            lambda tabela, tipo, linha, antiga: _receber_evento(estado, tabela, tipo, linha, antiga),
+            lambda ativo: _feed_mudou(estado, ativo),
         )
-        return conn.client.storage.from_(bucket_name).get_public_url(file_name)
+    except Exception:
+        pass
+
+def _feed_mudou(estado, ativo):
+    with estado.lock:
+        estado.feed_ativo = ativo
+        estado.ultima_sincronizacao = 0.0
+        estado.ultima_conferencia = 0.0
+
+# lock_rede evita que uma sincronização em andamento grave por cima do evento
+# uma versão mais antiga da mesma linha
+def _receber_evento(estado, tabela, tipo, linha, antiga):
+    metricas.contar(f"feed.eventos.{tabela}")
+    if tabela not in TABELAS_DADOS:
+        with estado.lock:
+            estado.ultima_sincronizacao = 0.0
+        return
+    with estado.lock_rede:
+        with estado.lock:
+            if tabela not in estado.marcas:
+                return
+            colunas = _colunas_df(estado, tabela)
+        if tipo == "DELETE":
+            if antiga.get(ID_COL) is None:
+                return
+            _aplicar_alteracoes(estado, tabela, pd.DataFrame(), {int(antiga[ID_COL])})
+            return
+        novas = _montar_df(tabela, [linha])
+        if colunas is not None:
+            novas = novas[[c for c in colunas if c in novas.columns]]
+        _aplicar_alteracoes(estado, tabela, novas, {int(linha[ID_COL])})
+
+# Stale-while-revalidate: depois de uma falha de rede, a próxima tentativa espera
+# um tempo exponencial com jitter (até ESPERA_MAXIMA_FALHAS), e até lá as telas
+# continuam com o que está em memória, marcado como desatualizado.
+ESPERA_FALHAS = 2
+ESPERA_MAXIMA_FALHAS = 120
+
+def _registrar_sucesso(estado):
+    with estado.lock:
+        estado.falhas_seguidas = 0
+        estado.proxima_tentativa = 0.0
+        estado.ultimo_erro = None
+
+def _registrar_falha(estado, erro):
+    metricas.contar("db.falhas_de_carga")
+    with estado.lock:
+        estado.falhas_seguidas += 1
+        estado.ultimo_erro = str(erro)
+        estado.proxima_tentativa = time.time() + min(_espera(ESPERA_FALHAS, estado.falhas_seguidas - 1), ESPERA_MAXIMA_FALHAS)
+
+def _revalidar(repo, estado):
+    try:
+        _sincronizar(repo, estado)
+        _registrar_sucesso(estado)
     except Exception as e:
-        st.error(f"Erro no upload da Foto: {e}")
+        _registrar_falha(estado, e)
+    finally:
+        estado.lock_rede.release()
+    _agendar_snapshot(estado)
+
+# Dispara a sincronização vencida numa thread, se nenhuma operação de rede estiver
+# em andamento (o lock_rede é liberado pela própria thread ao terminar)
+def _revalidar_em_fundo(repo, estado):
+    with estado.lock:
+        if not _sincronizacao_vencida(estado) or time.time() < estado.proxima_tentativa:
+            return
+    if not estado.lock_rede.acquire(blocking=False):
+        return
+    metricas.contar("db.revalidacoes_em_fundo")
+    threading.Thread(target=_revalidar, args=(repo, estado), daemon=True).start()
+
+# Carga que a tela precisa esperar (ver _faltam_dados); uma falha fica registrada
+# para o aviso de dados desatualizados e para a espera antes da próxima tentativa
+@metricas.medido("db.carga_bloqueante")
+def _carregar_bloqueando(repo, estado, obra=None, perfil="login"):
+    try:
+        with estado.lock_rede:
+            _preparar_estado(repo, estado)
+            for tabela, colunas in PERFIS_COLUNAS[perfil].items():
+                _garantir_colunas(repo, estado, tabela, colunas)
+            if perfil != "login":
+                _carregar_particoes(repo, estado, obra)
+        _registrar_sucesso(estado)
+        _agendar_snapshot(estado)
+    except Exception as e:
+        _registrar_falha(estado, e)
+
+def _ler_dados(obra, perfil):
+    repo = get_repositorio()
+    estado = _estado_dados()
+    _iniciar_reconciliacao(repo, estado)
+    _iniciar_feed(repo, estado)
+    if _faltam_dados(estado, obra, perfil):
+        _carregar_bloqueando(repo, estado, obra, perfil)
+    else:
+        _revalidar_em_fundo(repo, estado)
+    return estado
+
+# Estado dos dados exibidos, para o aviso na tela: desatualizado quando a última
+# ida ao banco falhou ou quando os dados são mais velhos que o dobro do intervalo
+# de sincronização (ex.: snapshot do disco ainda não conferido)
+def situacao_dados():
+    estado = _estado_dados()
+    with estado.lock:
+        intervalo = INTERVALO_SINCRONIZACAO_COM_FEED if estado.feed_ativo else INTERVALO_SINCRONIZACAO
+        return {
+            "atualizado_em": estado.dados_de or None,
+            "desatualizado": estado.falhas_seguidas > 0 or time.time() - estado.dados_de > 2 * intervalo,
+            "erro": estado.ultimo_erro,
+        }
+
+# Só status e obras, para a tela de login e a barra lateral (não baixa itens)
+def carregar_listas():
+    estado = _ler_dados(None, "login")
+    with estado.lock:
+        if estado.lista_obras is None:
+            st.error(f"Erro ao carregar dados do Supabase: {estado.ultimo_erro}")
+            return [], []
+        return list(estado.lista_status), list(estado.lista_obras)
+
+# obra: filtro aplicado na consulta ao Supabase; None = todas as obras
+# perfil: chave de PERFIS_COLUNAS com as colunas que a tela vai usar
+# Sem conexão, devolve o que já estiver em memória (ver situacao_dados) em vez de
+# tabelas vazias; só sem nenhum dado carregado o erro aparece no lugar das telas.
+@metricas.medido("db.carregar_dados_app")
+def carregar_dados_app(obra=None, perfil="tabela"):
+    base = PERFIL_BASE.get(perfil, perfil)
+    estado = _ler_dados(obra, base)
+    with estado.lock:
+        if estado.lista_obras is None:
+            st.error(f"Erro ao carregar dados do Supabase: {estado.ultimo_erro}")
+            return [], [], pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        listas = (list(estado.lista_status), list(estado.lista_obras))
+        visoes = [_visao(estado, tabela, obra) for tabela in TABELAS_DADOS]
+    if base != perfil:
+        visoes = [completar_colunas(df, tabela, perfil) for df, tabela in zip(visoes, TABELAS_DADOS)]
+    return (*listas, *visoes)
+
+# Acrescenta ao DataFrame as colunas do perfil que ele ainda não tem (ex.: modo
+# Tabela, que exporta todas as colunas, a partir dos dados carregados para os cards).
+# Uma consulta avulsa traz só id + colunas faltantes das linhas do DataFrame; a
+# projeção compartilhada (estado.colunas) não muda.
+@metricas.medido("db.completar_colunas")
+def completar_colunas(df, tabela, perfil):
+    colunas = PERFIS_COLUNAS[perfil].get(tabela)
+    if df.empty or (colunas is None and _projecao_completa(tabela)):
+        return df
+    faltantes = [c for c in (COLUNAS_TABELAS[tabela] if colunas is None else colunas) if c not in df.columns]
+    if not faltantes:
+        return df
+    projecao = ",".join([ID_COL] + faltantes)
+    obras = _obras_inteiras(df, tabela)
+    try:
+        extra = _consulta_avulsa(tabela, projecao, obras, _chave_linhas(df, tabela), df[ID_COL].astype(int).tolist())
+    except Exception as e:
+        st.error(f"Erro ao carregar dados do Supabase: {e}")
+        return df
+    attrs = dict(df.attrs)
+    completo = df.merge(extra[[ID_COL] + faltantes], on=ID_COL, how="left")
+    completo.attrs.update(attrs)
+    return completo
+
+def _projecao_completa(tabela):
+    estado = _estado_dados()
+    with estado.lock:
+        return estado.colunas[tabela] is None
+
+# Obras cujas linhas estão todas no DataFrame (ex.: visão sem filtro): aí o filtro
+# por obra traz as mesmas linhas que o filtro por id, em menos consultas
+def _obras_inteiras(df, tabela):
+    coluna_obra = df[COLUNA_OBRA[tabela]]
+    if coluna_obra.isna().any():
         return None
-@st.cache_data(ttl=30) 
-def carregar_dados_app():
-    conn = get_db_connection()
-    try:
-        status_resp = conn.table("status").select("*").execute()
-        lista_status = [row['nome_do_status'] for row in status_resp.data]
-        
-        obras_resp = conn.table("obras").select("*").execute()
-        lista_obras = [row['nome_da_obra'] for row in obras_resp.data]
-        
-        patrimonio_resp = conn.table("patrimonio").select("*").execute()
-        patrimonio_df = pd.DataFrame(patrimonio_resp.data)
-        
-        colunas_patrimonio = [
-            ID_COL, OBRA_COL, TOMBAMENTO_COL, NOME_COL, ESPEC_COL, 
-            OBS_COL, LOCAL_COL, RESPONSAVEL_COL, NF_NUM_COL, 
-            NF_LINK_COL, VALOR_COL, STATUS_COL, FOTO_COL
-        ]
-
-        if patrimonio_df.empty: 
-             patrimonio_df = pd.DataFrame(columns=colunas_patrimonio)
-        
-        for col in colunas_patrimonio:
-            if col not in patrimonio_df.columns:
-                patrimonio_df[col] = None
-        
-        if VALOR_COL in patrimonio_df.columns:
-            patrimonio_df[VALOR_COL] = pd.to_numeric(patrimonio_df[VALOR_COL], errors='coerce').fillna(0)
-        
-        movimentacoes_resp = conn.table("movimentacoes").select("*").execute()
-        movimentacoes_df = pd.DataFrame(movimentacoes_resp.data)
-        if movimentacoes_df.empty:
-            movimentacoes_df = pd.DataFrame(columns=[
-                ID_COL, OBRA_COL, TOMBAMENTO_COL, "tipo_movimentacao", 
-                "data_hora", "responsavel_movimentacao", "observacoes"
-            ])
-            
-        locacoes_resp = conn.table("locacoes").select("*").execute()
-        locacoes_df = pd.DataFrame(locacoes_resp.data)
-        if locacoes_df.empty:
-            locacoes_df = pd.DataFrame(columns=[
-                "id", "equipamento", "obra_destino", "responsavel", "quantidade", 
-                "unidade", "valor_mensal", "contrato_sienge", "status", 
-                "data_inicio", "data_previsao_fim"
-            ])
-        else:
-            locacoes_df['data_inicio'] = pd.to_datetime(locacoes_df['data_inicio'], errors='coerce')
-            locacoes_df['data_previsao_fim'] = pd.to_datetime(locacoes_df['data_previsao_fim'], errors='coerce')
+    obras = tuple(sorted(str(o) for o in coluna_obra.unique()))
+    estado = _estado_dados()
+    with estado.lock:
+        particoes = estado.particoes[tabela]
+        if any(o not in particoes for o in obras) or sum(len(particoes[o]) for o in obras) != len(df):
+            return None
+    return obras
+
+# Chave das linhas pedidas: ids + updated_at (muda só com a edição da própria
+# linha); sem a coluna, vale a versão das obras envolvidas
+def _chave_linhas(df, tabela):
+    colunas = [ID_COL, COLUNA_ALTERACAO] if COLUNA_ALTERACAO in df.columns else [ID_COL]
+    hash_linhas = pd.util.hash_pandas_object(df[colunas].astype(str), index=False)
+    chave = hashlib.sha1(hash_linhas.values.tobytes()).hexdigest()
+    if COLUNA_ALTERACAO in df.columns:
+        return chave
+    coluna_obra = df[COLUNA_OBRA[tabela]]
+    if coluna_obra.isna().any():
+        return chave, versao_dados(tabela)
+    return chave, tuple(versao_dados(tabela, str(o)) for o in sorted(coluna_obra.unique()))
+
+# obras: filtro por obra (ver _obras_inteiras); None = por id, em lotes
+@st.cache_data(max_entries=4, show_spinner=False)
+def _consulta_avulsa(tabela, projecao, obras, chave, _ids):
+    repo = get_repositorio()
+    if obras is not None:
+        lotes = [[("in_", COLUNA_OBRA[tabela], list(obras))]]
+    else:
+        lotes = [[("in_", ID_COL, _ids[i:i + TAMANHO_LOTE_CONSULTA_IN])] for i in range(0, len(_ids), TAMANHO_LOTE_CONSULTA_IN)]
+    linhas = []
+    for filtros in lotes:
+        linhas.extend(buscar_tabelas(repo, [tabela], colunas=projecao, filtros={tabela: filtros})[tabela])
+    return _montar_df(tabela, linhas, projecao.split(","))
 
-        return lista_status, lista_obras, patrimonio_df, movimentacoes_df, locacoes_df
-    
+# Linha completa (todas as colunas) de um registro, lida na hora de editar
+def carregar_item(tabela, item_id):
+    repo = get_repositorio()
+    try:
+        resp = repo.consultar(tabela, filtros=[("eq", ID_COL, int(item_id))], limite=1)
+        if not resp.data:
+            return None
+        return _montar_df(tabela, resp.data).iloc[0]
     except Exception as e:
         st.error(f"Erro ao carregar dados do Supabase: {e}")
-        return [], [], pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        return None
+
+# Memória ocupada pelos dados em cache, por tabela e obra (MB)
+def relatorio_memoria():
+    estado = _estado_dados()
+    linhas = []
+    with estado.lock:
+        for tabela in TABELAS_DADOS:
+            for obra, parte in estado.particoes[tabela].items():
+                linhas.append({
+                    "tabela": tabela,
+                    "obra": obra or "(sem obra)",
+                    "linhas": parte.shape[0],
+                    "memoria_mb": round(parte.memory_usage(deep=True).sum() / 1e6, 2),
+                })
+    return pd.DataFrame(linhas, columns=["tabela", "obra", "linhas", "memoria_mb"])
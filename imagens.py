@@ -0,0 +1,40 @@
+import io
+import re
+from PIL import Image, ImageOps
+
+# Fotos de patrimônio: a original do celular (4–8 MB) vira um JPEG de no máximo
+# LADO_MAXIMO_FOTO px, e uma miniatura de LADO_MINIATURA px (2x o quadro de
+# 200 x 130 do card) é gravada ao lado, com SUFIXO_MINIATURA antes da extensão.
+LADO_MAXIMO_FOTO = 1600
+LADO_MINIATURA = 400
+QUALIDADE_FOTO = 82
+QUALIDADE_MINIATURA = 75
+SUFIXO_MINIATURA = "_thumb"
+TIPO_FOTO = "image/jpeg"
+
+_EXTENSAO = re.compile(r"(\.[A-Za-z0-9]+)?(\?.*)?$")
+
+def _jpeg(imagem, lado, qualidade):
+    copia = imagem.copy()
+    copia.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+    saida = io.BytesIO()
+    copia.save(saida, format="JPEG", quality=qualidade, optimize=True, progressive=True)
+    return saida.getvalue()
+
+# Corrige a orientação do EXIF (que é descartado junto com os demais metadados),
+# achata transparência em fundo branco e devolve (foto, miniatura) em JPEG
+def preparar_foto(dados):
+    with Image.open(io.BytesIO(dados)) as original:
+        imagem = ImageOps.exif_transpose(original)
+        if imagem.mode in ("RGBA", "LA", "P"):
+            imagem = imagem.convert("RGBA")
+            fundo = Image.new("RGB", imagem.size, "white")
+            fundo.paste(imagem, mask=imagem.getchannel("A"))
+            imagem = fundo
+        elif imagem.mode != "RGB":
+            imagem = imagem.convert("RGB")
+        return _jpeg(imagem, LADO_MAXIMO_FOTO, QUALIDADE_FOTO), _jpeg(imagem, LADO_MINIATURA, QUALIDADE_MINIATURA)
+
+# "fotos/IMG_1.jpg" -> "fotos/IMG_1_thumb.jpg" (vale também para URLs com query string)
+def caminho_miniatura(caminho):
+    return _EXTENSAO.sub(lambda m: SUFIXO_MINIATURA + ".jpg" + (m.group(2) or ""), caminho, count=1)
@@ -0,0 +1,119 @@
+import io
+import pandas as pd
+import database as db
+import busca
+
+# Cabeçalhos aceitos na planilha (já normalizados: sem acento, minúsculas, "_")
+ALIASES_IMPORTACAO = {
+    db.NOME_COL: ["nome", "nome_do_produto", "produto", "ativo", "descricao"],
+    db.TOMBAMENTO_COL: ["numero_tombamento", "tombamento", "patrimonio"],
+    db.NF_NUM_COL: ["numero_nota_fiscal", "nota_fiscal", "nf", "n_nota_fiscal", "numero_nf"],
+    db.LOCAL_COL: ["local_de_uso", "local", "local_uso"],
+    db.RESPONSAVEL_COL: ["responsavel", "responsavel_pelo_ativo"],
+    db.ESPEC_COL: ["especificacoes", "especificacoes_tecnicas", "especificacao"],
+    db.OBS_COL: ["observacoes", "observacao", "obs"],
+    db.VALOR_COL: ["valor", "valor_r", "valor_rs", "preco"],
+    db.STATUS_COL: ["status"],
+    db.OBRA_COL: ["obra", "obra_de_destino"],
+}
+OBRIGATORIOS_IMPORTACAO = {
+    db.NOME_COL: "Nome",
+    db.NF_NUM_COL: "NF",
+    db.LOCAL_COL: "Local",
+    db.RESPONSAVEL_COL: "Responsável",
+}
+# Gravados em maiúsculas, como no formulário de cadastro
+COLUNAS_MAIUSCULAS = [db.NOME_COL, db.TOMBAMENTO_COL, db.NF_NUM_COL, db.LOCAL_COL, db.RESPONSAVEL_COL, db.ESPEC_COL, db.OBS_COL]
+
+def _coluna_canonica(cabecalho):
+    chave = busca.normalizar(pd.Series([str(cabecalho)])).iloc[0]
+    chave = "_".join(chave.split())
+    chave = "".join(c if c.isalnum() or c == "_" else "" for c in chave)
+    for coluna, aliases in ALIASES_IMPORTACAO.items():
+        if chave in aliases:
+            return coluna
+    return None
+
+# Lê CSV (separador detectado, UTF-8 ou Latin-1) ou XLSX tudo como texto, para
+# não perder zeros à esquerda de NF e tombamento
+def ler_planilha(dados, nome_arquivo):
+    if nome_arquivo.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(io.BytesIO(dados), dtype=str)
+    else:
+        try:
+            df = pd.read_csv(io.BytesIO(dados), sep=None, engine="python", dtype=str, encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            df = pd.read_csv(io.BytesIO(dados), sep=None, engine="python", dtype=str, encoding="latin-1")
+    mapa = {}
+    for cabecalho in df.columns:
+        coluna = _coluna_canonica(cabecalho)
+        if coluna and coluna not in mapa.values():
+            mapa[cabecalho] = coluna
+    df = df[list(mapa)].rename(columns=mapa)
+    return df.dropna(how="all").fillna("")
+
+# "1.234,56", "1234.56" e "R$ 1.234" -> float; vazio -> 0; inválido -> NaN.
+# Sem vírgula, pontos seguidos de grupos de 3 dígitos são separador de milhar
+# ("2.500" -> 2500), como a planilha brasileira exporta valores inteiros.
+def _valores(serie):
+    texto = serie.str.replace("R$", "", regex=False).str.replace(" ", "", regex=False)
+    brasileiro = texto.str.contains(",", regex=False) | texto.str.fullmatch(r"-?\d{1,3}(\.\d{3})+")
+    texto = texto.where(~brasileiro, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(texto.replace("", "0"), errors="coerce")
+
+# Tombamentos preenchidos na planilha, já como serão gravados (para consultar
+# no banco os que já existem, ver db.tombamentos_cadastrados)
+def tombamentos_da_planilha(df):
+    if db.TOMBAMENTO_COL not in df.columns:
+        return []
+    tombamentos = df[db.TOMBAMENTO_COL].astype(str).str.strip().str.upper()
+    return sorted(set(tombamentos[tombamentos != ""]))
+
+# Valida todas as linhas de uma vez. Devolve (linhas válidas prontas para inserir,
+# erros com o número da linha na planilha). obra_padrao vale para linhas sem obra
+# (e para todas, se permitir_obra=False).
+def validar_patrimonio(df, obra_padrao, lista_status, lista_obras, tombamentos_existentes=(), permitir_obra=False):
+    df = df.copy()
+    for coluna in ALIASES_IMPORTACAO:
+        if coluna not in df.columns:
+            df[coluna] = ""
+        df[coluna] = df[coluna].astype(str).str.strip()
+    df[COLUNAS_MAIUSCULAS] = df[COLUNAS_MAIUSCULAS].apply(lambda s: s.str.upper())
+
+    erros = pd.Series("", index=df.index)
+    def registrar(mascara, mensagem):
+        erros.loc[mascara] = erros.loc[mascara] + mensagem + "; "
+
+    for coluna, rotulo in OBRIGATORIOS_IMPORTACAO.items():
+        registrar(df[coluna] == "", f"{rotulo} obrigatório")
+
+    valores = _valores(df[db.VALOR_COL])
+    registrar(valores.isna() | (valores < 0), "Valor inválido")
+    df[db.VALOR_COL] = valores.fillna(0.0)
+
+    status_validos = {str(s).upper(): s for s in lista_status}
+    status = df[db.STATUS_COL].str.upper()
+    registrar((status != "") & ~status.isin(list(status_validos)), "Status desconhecido")
+    df[db.STATUS_COL] = status.map(status_validos).fillna(lista_status[0] if lista_status else "")
+
+    if permitir_obra:
+        registrar((df[db.OBRA_COL] != "") & ~df[db.OBRA_COL].isin(lista_obras), "Obra desconhecida")
+        df[db.OBRA_COL] = df[db.OBRA_COL].where(df[db.OBRA_COL] != "", obra_padrao)
+    else:
+        df[db.OBRA_COL] = obra_padrao
+
+    tombamento = df[db.TOMBAMENTO_COL]
+    preenchido = tombamento != ""
+    registrar(preenchido & tombamento.duplicated(keep=False), "Tombamento repetido na planilha")
+    existentes = {str(t).upper() for t in tombamentos_existentes if pd.notna(t)}
+    registrar(preenchido & tombamento.isin(existentes), "Tombamento já cadastrado")
+    df[db.TOMBAMENTO_COL] = tombamento.astype(object).where(preenchido, None)
+
+    invalidas = erros != ""
+    relatorio = pd.DataFrame({
+        "linha": df.index[invalidas.to_numpy()] + 2,
+        db.NOME_COL: df.loc[invalidas, db.NOME_COL],
+        "erros": erros[invalidas].str.rstrip("; "),
+    }).reset_index(drop=True)
+    validas = df.loc[~invalidas, list(ALIASES_IMPORTACAO)].assign(**{db.NF_LINK_COL: None, db.FOTO_COL: None, db.FOTO_MINIATURA_COL: None})
+    return validas.reset_index(drop=True), relatorio
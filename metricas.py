@@ -0,0 +1,140 @@
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+# Instrumentação leve: tempos (ms) por nome, contadores (linhas lidas, bytes
+# gerados/enviados), acertos/faltas de cache e o detalhamento da rodada atual.
+# O registro é um objeto de módulo, e não st.cache_resource, porque também é
+# alimentado pelas threads de fundo (sincronização, uploads), fora do script.
+AMOSTRAS_POR_MEDIDA = 2000
+PERCENTIS = (0.5, 0.9, 0.99)
+
+class Registro:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tempos = {}
+        self.totais = {}
+        self.contadores = {}
+        self.caches = {}
+
+    def registrar_tempo(self, nome, ms):
+        with self.lock:
+            self.tempos.setdefault(nome, deque(maxlen=AMOSTRAS_POR_MEDIDA)).append(ms)
+            quantidade, soma = self.totais.get(nome, (0, 0.0))
+            self.totais[nome] = (quantidade + 1, soma + ms)
+
+    def somar(self, nome, valor):
+        with self.lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + valor
+
+    def somar_cache(self, nome, resultado, valor):
+        with self.lock:
+            por_resultado = self.caches.setdefault(nome, {"hit": 0, "miss": 0})
+            por_resultado[resultado] += valor
+
+_REGISTRO = Registro()
+_rodada = threading.local()
+
+@contextmanager
+def medir(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        _REGISTRO.registrar_tempo(nome, ms)
+        eventos = getattr(_rodada, "eventos", None)
+        if eventos is not None:
+            eventos.append((nome, ms))
+
+def medido(nome):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with medir(nome):
+                return funcao(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+def contar(nome, valor=1):
+    _REGISTRO.somar(nome, valor)
+
+def contar_cache(nome, acertou, valor=1):
+    _REGISTRO.somar_cache(nome, "hit" if acertou else "miss", valor)
+
+# Rodada = uma execução do script (um rerun). Só a thread do script registra nela.
+def iniciar_rodada():
+    _rodada.eventos = []
+
+def encerrar_rodada():
+    eventos = getattr(_rodada, "eventos", None) or []
+    _rodada.eventos = None
+    return eventos
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+# Estatísticas por medida sobre as últimas AMOSTRAS_POR_MEDIDA amostras
+def resumo_tempos():
+    with _REGISTRO.lock:
+        amostras = {nome: sorted(valores) for nome, valores in _REGISTRO.tempos.items()}
+        totais = dict(_REGISTRO.totais)
+    linhas = []
+    for nome, ordenados in sorted(amostras.items()):
+        quantidade, soma = totais[nome]
+        linha = {"medida": nome, "chamadas": quantidade, "total_ms": round(soma, 1)}
+        for p in PERCENTIS:
+            linha[f"p{int(p * 100)}_ms"] = round(_percentil(ordenados, p), 1)
+        linha["max_ms"] = round(ordenados[-1], 1)
+        linhas.append(linha)
+    return linhas
+
+def contadores():
+    with _REGISTRO.lock:
+        return dict(sorted(_REGISTRO.contadores.items()))
+
+# Acertos e faltas por cache, com a taxa de acerto
+def resumo_caches():
+    with _REGISTRO.lock:
+        caches = {nome: dict(valores) for nome, valores in _REGISTRO.caches.items()}
+    linhas = []
+    for nome, valores in sorted(caches.items()):
+        total = valores["hit"] + valores["miss"]
+        linhas.append({
+            "cache": nome, "hit": valores["hit"], "miss": valores["miss"],
+            "taxa_acerto": round(valores["hit"] / total, 3) if total else None,
+        })
+    return linhas
+
+def _nome_prometheus(nome):
+    return "patrimonio_" + "".join(c if c.isalnum() else "_" for c in nome)
+
+# Formato texto do Prometheus: um summary (em segundos) por medida, um counter por
+# contador e um counter por cache, com o rótulo result="hit"|"miss"
+def exportar_prometheus():
+    with _REGISTRO.lock:
+        amostras = {nome: sorted(valores) for nome, valores in _REGISTRO.tempos.items()}
+        totais = dict(_REGISTRO.totais)
+        valores_contadores = dict(_REGISTRO.contadores)
+        caches = {nome: dict(valores) for nome, valores in _REGISTRO.caches.items()}
+    linhas = []
+    for nome, ordenados in sorted(amostras.items()):
+        metrica = _nome_prometheus(nome) + "_seconds"
+        quantidade, soma = totais[nome]
+        linhas.append(f"# TYPE {metrica} summary")
+        for p in PERCENTIS:
+            linhas.append(f'{metrica}{{quantile="{p}"}} {_percentil(ordenados, p) / 1000:.6f}')
+        linhas.append(f"{metrica}_sum {soma / 1000:.6f}")
+        linhas.append(f"{metrica}_count {quantidade}")
+    for nome, valor in sorted(valores_contadores.items()):
+        metrica = _nome_prometheus(nome) + "_total"
+        linhas.append(f"# TYPE {metrica} counter")
+        linhas.append(f"{metrica} {valor}")
+    for nome, valores in sorted(caches.items()):
+        metrica = _nome_prometheus(nome) + "_total"
+        linhas.append(f"# TYPE {metrica} counter")
+        for resultado, valor in valores.items():
+            linhas.append(f'{metrica}{{result="{resultado}"}} {valor}')
+    return "\n".join(linhas) + "\n"
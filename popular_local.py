@@ -0,0 +1,58 @@
+# Cria/preenche um banco SQLite local com dados sintéticos para teste de carga.
+# Uso: python popular_local.py [caminho.db] [itens]   (padrão: dados_local.db 100000)
+# Depois aponte o app para ele em .streamlit/secrets.toml:
+#   [backend_dados]
+#   tipo = "sqlite"
+#   caminho = "dados_local.db"
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import repositorio
+
+OBRAS = [f"OBRA {i:02d}" for i in range(1, 21)]
+STATUS = ["ATIVO", "MANUTENÇÃO", "EMPRÉSTIMO", "BAIXADO"]
+LOTE = 5000
+
+def popular(caminho, n):
+    repo = repositorio.RepositorioSQLite(caminho)
+    repo.inserir("obras", [{"nome_da_obra": o} for o in OBRAS])
+    repo.inserir("status", [{"nome_do_status": s} for s in STATUS])
+    inicio = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    for base in range(0, n, LOTE):
+        ids = range(base, min(base + LOTE, n))
+        repo.inserir("patrimonio", [{
+            "obra": OBRAS[i % len(OBRAS)],
+            "numero_tombamento": f"PAT-{i:06d}",
+            "nome": f"BETONEIRA ELÉTRICA 400L MODELO {i % 97}",
+            "especificacoes": "MOTOR 2CV, 220V",
+            "observacoes": "",
+            "local_de_uso": f"ALMOXARIFADO {i % 7}",
+            "responsavel": f"RESPONSÁVEL {i % 31}",
+            "numero_nota_fiscal": f"NF-{i // 10:06d}",
+            "valor": (i % 5000) * 10.5,
+            "status": STATUS[i % len(STATUS)],
+        } for i in ids])
+        repo.inserir("movimentacoes", [{
+            "obra": OBRAS[i % len(OBRAS)],
+            "numero_tombamento": f"PAT-{i:06d}",
+            "tipo_movimentacao": "Entrada" if i % 2 else "Saída",
+            "data_hora": (inicio + timedelta(hours=i)).isoformat(),
+            "responsavel_movimentacao": f"RESPONSÁVEL {i % 31}",
+        } for i in ids])
+        repo.inserir("locacoes", [{
+            "equipamento": f"ANDAIME {i % 13}",
+            "obra_destino": OBRAS[i % len(OBRAS)],
+            "quantidade": 1 + i % 10,
+            "unidade": "MÊS",
+            "valor_mensal": 150.0 + i % 300,
+            "valor_total": (1 + i % 10) * (150.0 + i % 300),
+            "status": "ATIVO",
+            "data_inicio": (inicio + timedelta(days=i % 600)).date().isoformat(),
+        } for i in ids[::10]])
+
+if __name__ == "__main__":
+    caminho = sys.argv[1] if len(sys.argv) > 1 else "dados_local.db"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    t0 = time.perf_counter()
+    popular(caminho, n)
+    print(f"{n} itens em {caminho} ({time.perf_counter() - t0:.1f}s)")
@@ -0,0 +1,361 @@
+# Acesso às tabelas (patrimonio, movimentacoes, locacoes, obras, status) e aos
+# arquivos, independente do banco. database.py e as telas usam só esta interface:
+#   consultar(tabela, colunas, filtros, ordem, desc, inicio, limite, contar) -> Resposta
+#   inserir(tabela, linhas) / atualizar(tabela, valores, filtros) / excluir(tabela, filtros)
+#   enviar_arquivo(bucket, caminho, dados, tipo) -> url pública; nunca sobrescreve:
+#     se o caminho já existir, levanta ArquivoExistente (com a url em .url)
+#   assinar_alteracoes(tabelas, ao_receber, ao_mudar_estado): feed de alterações;
+#     ao_receber(tabela, tipo, linha, antiga) com tipo "INSERT", "UPDATE" ou "DELETE"
+#     e ao_mudar_estado(ativo) quando a assinatura conecta ou cai
+#   registrar_movimentacoes(ids, tipo, status, responsavel, observacoes, obra_destino)
+#     -> {"patrimonio": linhas atualizadas, "movimentacoes": linhas inseridas}
+#     (movimentações + status numa transação)
+# filtros: [(operador, coluna, valor), ...] com operador "eq", "gt", "in_" ou "fora_de"
+# (coluna nula ou fora da lista de valores).
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+from pathlib import Path
+
+Resposta = namedtuple("Resposta", ["data", "count"])
+
+# Falhas que valem uma nova tentativa (rede, timeout, banco local ocupado). Erros
+# determinísticos (coluna inexistente, RLS, dados inválidos) não entram.
+def erro_transitorio(erro):
+    if isinstance(erro, (TimeoutError, ConnectionError)):
+        return True
+    if isinstance(erro, sqlite3.OperationalError):
+        return "locked" in str(erro) or "busy" in str(erro)
+    try:
+        import httpx
+    except ModuleNotFoundError:
+        return False
+    return isinstance(erro, httpx.TransportError)
+
+class ArquivoExistente(Exception):
+    def __init__(self, url):
+        super().__init__(f"Arquivo já existe: {url}")
+        self.url = url
+
+# Erro do Storage para upload sem upsert num caminho ocupado: StorageApiError com
+# status 409 / code "Duplicate" (versões antigas do storage3 só trazem o texto)
+def _erro_de_duplicado(erro):
+    if str(getattr(erro, "status", "")) == "409" or getattr(erro, "code", None) == "Duplicate":
+        return True
+    texto = str(erro).lower()
+    return "already exists" in texto or "duplicate" in texto
+
+# Implementação sobre o st.connection do Supabase (PostgREST + Storage)
+class RepositorioSupabase:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _filtrar(self, query, filtros):
+        for operador, coluna, valor in filtros:
+            if operador == "fora_de":
+                valores = ",".join('"' + str(v).replace('"', '\\"') + '"' for v in valor)
+                query = query.or_(f"{coluna}.is.null,{coluna}.not.in.({valores})")
+            else:
+                query = getattr(query, operador)(coluna, valor)
+        return query
+
+    def consultar(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, inicio=0, limite=None, contar=False):
+        query = self._filtrar(self.conn.table(tabela).select(colunas, count="exact" if contar else None), filtros)
+        if ordem:
+            query = query.order(ordem, desc=desc)
+        if limite is not None:
+            query = query.range(inicio, inicio + limite - 1)
+        resp = query.execute()
+        return Resposta(resp.data, resp.count)
+
+    def inserir(self, tabela, linhas):
+        return self.conn.table(tabela).insert(linhas).execute().data
+
+    def atualizar(self, tabela, valores, filtros):
+        return self._filtrar(self.conn.table(tabela).update(valores), filtros).execute().data
+
+    def excluir(self, tabela, filtros):
+        return self._filtrar(self.conn.table(tabela).delete(), filtros).execute().data
+
+    # Função do banco em sql/registrar_movimentacoes.sql: um round trip, atômico
+    def registrar_movimentacoes(self, ids, tipo, status, responsavel, observacoes="", obra_destino=None):
+        return self.conn.client.rpc("registrar_movimentacoes", {
+            "p_ids": list(ids), "p_tipo": tipo, "p_status": status, "p_responsavel": responsavel,
+            "p_observacoes": observacoes, "p_obra_destino": obra_destino,
+        }).execute().data
+
+    def enviar_arquivo(self, bucket, caminho, dados, tipo):
+        storage = self.conn.client.storage.from_(bucket)
+        try:
+            storage.upload(file=dados, path=caminho, file_options={"content-type": tipo, "x-upsert": "false"})
+        except Exception as e:
+            if _erro_de_duplicado(e):
+                raise ArquivoExistente(storage.get_public_url(caminho)) from e
+            raise
+        return storage.get_public_url(caminho)
+
+    # Supabase Realtime (postgres_changes) numa thread própria com seu event loop;
+    # as tabelas precisam estar na publicação supabase_realtime (sql/realtime.sql)
+    def assinar_alteracoes(self, tabelas, ao_receber, ao_mudar_estado):
+        cliente = self.conn.client
+        AssinaturaSupabase(cliente.supabase_url, cliente.supabase_key, tabelas, ao_receber, ao_mudar_estado)
+
+
+# Payload do postgres_changes nos formatos do realtime-py (novo: data.type/record/
+# old_record; antigo: eventType/new/old) -> (tipo, linha, antiga)
+def _evento_realtime(payload):
+    dados = payload.get("data", payload)
+    tipo = dados.get("type") or dados.get("eventType") or ""
+    linha = dados.get("record") or dados.get("new") or {}
+    antiga = dados.get("old_record") or dados.get("old") or {}
+    return str(getattr(tipo, "value", tipo)).upper(), linha, antiga
+
+# Mantém a assinatura viva: reconecta com espera crescente e avisa quando cai ou volta
+class AssinaturaSupabase:
+    ESPERA_MAXIMA = 60
+
+    def __init__(self, url, chave, tabelas, ao_receber, ao_mudar_estado):
+        self.url, self.chave, self.tabelas = url, chave, list(tabelas)
+        self.ao_receber, self.ao_mudar_estado = ao_receber, ao_mudar_estado
+        threading.Thread(target=asyncio.run, args=(self._escutar(),), daemon=True).start()
+
+    def _receber(self, tabela, payload):
+        tipo, linha, antiga = _evento_realtime(payload)
+        self.ao_receber(tabela, tipo, linha, antiga)
+
+    def _inscrito(self, status, erro=None):
+        self.ao_mudar_estado(str(getattr(status, "value", status)).upper() == "SUBSCRIBED")
+
+    async def _escutar(self):
+        from supabase import acreate_client
+        espera = 1
+        while True:
+            try:
+                cliente = await acreate_client(self.url, self.chave)
+                canal = cliente.channel("alteracoes-app")
+                for tabela in self.tabelas:
+                    canal.on_postgres_changes(
+                        "*", schema="public", table=tabela,
+                        callback=lambda payload, tabela=tabela: self._receber(tabela, payload),
+                    )
+                await canal.subscribe(self._inscrito)
+                espera = 1
+                while getattr(cliente.realtime, "is_connected", True):
+                    await asyncio.sleep(5)
+            except Exception:
+                pass
+            self.ao_mudar_estado(False)
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, self.ESPERA_MAXIMA)
+
+
+# Esquema das tabelas no banco local. Colunas sem tipo (afinidade livre do SQLite)
+# guardam o que vier do app; datas ficam em texto ISO 8601 em UTC, como no Postgres.
+ESQUEMA_LOCAL = {
+    "status": ["nome_do_status"],
+    "obras": ["nome_da_obra"],
+    "patrimonio": [
+        "obra", "numero_tombamento", "nome", "especificacoes", "observacoes", "local_de_uso",
+        "responsavel", "numero_nota_fiscal", "link_nota_fiscal", "valor", "status", "foto_item",
+        "foto_miniatura",
+    ],
+    "movimentacoes": [
+        "obra", "numero_tombamento", "tipo_movimentacao", "data_hora",
+        "responsavel_movimentacao", "observacoes",
+    ],
+    "locacoes": [
+        "equipamento", "obra_destino", "responsavel", "quantidade", "unidade", "valor_mensal",
+        "valor_total", "contrato_sienge", "status", "data_inicio", "data_previsao_fim",
+    ],
+}
+AGORA_SQL = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+_IDENTIFICADOR = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def _coluna(nome):
+    if not _IDENTIFICADOR.match(nome):
+        raise ValueError(f"Coluna inválida: {nome!r}")
+    return nome
+
+# Implementação local em SQLite (arquivo único), para testes de carga e profiling
+# com muitos dados sem depender do Supabase. Cada chamada abre a própria conexão,
+# então as consultas paralelas de buscar_tabelas funcionam sem compartilhar cursor.
+class RepositorioSQLite:
+    def __init__(self, caminho, diretorio_arquivos=None):
+        self.caminho = str(caminho)
+        self.diretorio_arquivos = Path(diretorio_arquivos or Path(self.caminho).with_suffix("")).resolve()
+        self._lock_escrita = threading.Lock()
+        self._assinantes = []
+        self.criar_tabelas()
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        conexao.row_factory = sqlite3.Row
+        return conexao
+
+    def criar_tabelas(self):
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            for tabela, colunas in ESQUEMA_LOCAL.items():
+                conexao.execute(
+                    f"CREATE TABLE IF NOT EXISTS {tabela} (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    + "".join(f"{c}, " for c in colunas)
+                    + f"created_at TEXT DEFAULT ({AGORA_SQL}), updated_at TEXT DEFAULT ({AGORA_SQL}))"
+                )
+                conexao.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {tabela}_updated_at AFTER UPDATE ON {tabela} "
+                    f"WHEN NEW.updated_at IS OLD.updated_at BEGIN "
+                    f"UPDATE {tabela} SET updated_at = {AGORA_SQL} WHERE id = NEW.id; END"
+                )
+                conexao.execute(f"CREATE INDEX IF NOT EXISTS {tabela}_updated_at_idx ON {tabela} (updated_at)")
+                # Bancos criados antes de uma coluna nova entrar no esquema
+                existentes = {row["name"] for row in conexao.execute(f"PRAGMA table_info({tabela})")}
+                for coluna in colunas:
+                    if coluna not in existentes:
+                        conexao.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna}")
+
+    def _where(self, filtros):
+        partes, parametros = [], []
+        for operador, coluna, valor in filtros:
+            coluna = _coluna(coluna)
+            if operador == "eq":
+                partes.append(f"{coluna} = ?")
+                parametros.append(valor)
+            elif operador == "gt":
+                partes.append(f"{coluna} > ?")
+                parametros.append(valor)
+            elif operador in ("in_", "fora_de"):
+                valores = list(valor)
+                marcadores = ",".join("?" * len(valores))
+                if operador == "in_":
+                    partes.append(f"{coluna} IN ({marcadores})" if valores else "0")
+                else:
+                    partes.append(f"({coluna} IS NULL OR {coluna} NOT IN ({marcadores}))" if valores else "1")
+                parametros.extend(valores)
+            else:
+                raise ValueError(f"Operador não suportado: {operador}")
+        return (" WHERE " + " AND ".join(partes) if partes else ""), parametros
+
+    def consultar(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, inicio=0, limite=None, contar=False):
+        tabela = _coluna(tabela)
+        projecao = "*" if colunas == "*" else ", ".join(_coluna(c.strip()) for c in colunas.split(","))
+        where, parametros = self._where(filtros)
+        sql = f"SELECT {projecao} FROM {tabela}{where}"
+        if ordem:
+            sql += f" ORDER BY {_coluna(ordem)} {'DESC' if desc else 'ASC'}"
+        if limite is not None:
+            sql += f" LIMIT {int(limite)} OFFSET {int(inicio)}"
+        with self._conectar() as conexao:
+            linhas = [dict(row) for row in conexao.execute(sql, parametros)]
+            total = conexao.execute(f"SELECT COUNT(*) FROM {tabela}{where}", parametros).fetchone()[0] if contar else None
+        return Resposta(linhas, total)
+
+    def inserir(self, tabela, linhas):
+        tabela = _coluna(tabela)
+        if isinstance(linhas, dict):
+            linhas = [linhas]
+        ids = []
+        with self._lock_escrita, self._conectar() as conexao:
+            for linha in linhas:
+                colunas = [_coluna(c) for c in linha]
+                cursor = conexao.execute(
+                    f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                    [_valor_sql(v) for v in linha.values()],
+                )
+                ids.append(cursor.lastrowid)
+        inseridas = self.consultar(tabela, filtros=[("in_", "id", ids)], ordem="id").data
+        self._emitir(tabela, "INSERT", inseridas)
+        return inseridas
+
+    def atualizar(self, tabela, valores, filtros):
+        tabela = _coluna(tabela)
+        where, parametros = self._where(filtros)
+        atribuicoes = ", ".join(f"{_coluna(c)} = ?" for c in valores)
+        with self._lock_escrita, self._conectar() as conexao:
+            ids = [row[0] for row in conexao.execute(f"SELECT id FROM {tabela}{where}", parametros)]
+            conexao.execute(f"UPDATE {tabela} SET {atribuicoes}{where}", [_valor_sql(v) for v in valores.values()] + parametros)
+        atualizadas = self.consultar(tabela, filtros=[("in_", "id", ids)], ordem="id").data
+        self._emitir(tabela, "UPDATE", atualizadas)
+        return atualizadas
+
+    def excluir(self, tabela, filtros):
+        tabela = _coluna(tabela)
+        where, parametros = self._where(filtros)
+        with self._lock_escrita, self._conectar() as conexao:
+            removidas = [dict(row) for row in conexao.execute(f"SELECT * FROM {tabela}{where}", parametros)]
+            conexao.execute(f"DELETE FROM {tabela}{where}", parametros)
+        self._emitir(tabela, "DELETE", removidas)
+        return removidas
+
+    # Equivalente local de sql/registrar_movimentacoes.sql, na mesma transação
+    def registrar_movimentacoes(self, ids, tipo, status, responsavel, observacoes="", obra_destino=None):
+        ids = [int(i) for i in ids]
+        marcadores = ",".join("?" * len(ids))
+        with self._lock_escrita, self._conectar() as conexao:
+            encontrados = conexao.execute(f"SELECT COUNT(*) FROM patrimonio WHERE id IN ({marcadores})", ids).fetchone()[0]
+            if encontrados != len(set(ids)):
+                raise ValueError(f"Item de patrimônio inexistente em {ids}")
+            ultimo_id = conexao.execute("SELECT COALESCE(MAX(id), 0) FROM movimentacoes").fetchone()[0]
+            conexao.execute(
+                "INSERT INTO movimentacoes (obra, numero_tombamento, tipo_movimentacao, data_hora, responsavel_movimentacao, observacoes) "
+                f"SELECT COALESCE(?, obra), numero_tombamento, ?, {AGORA_SQL}, ?, ? FROM patrimonio WHERE id IN ({marcadores})",
+                [obra_destino, tipo, responsavel, observacoes] + ids,
+            )
+            conexao.execute(
+                f"UPDATE patrimonio SET status = ?, obra = COALESCE(?, obra) WHERE id IN ({marcadores})",
+                [status, obra_destino] + ids,
+            )
+            movimentacoes = [dict(row) for row in conexao.execute("SELECT * FROM movimentacoes WHERE id > ? ORDER BY id", [ultimo_id])]
+            atualizadas = [dict(row) for row in conexao.execute(f"SELECT * FROM patrimonio WHERE id IN ({marcadores}) ORDER BY id", ids)]
+        self._emitir("movimentacoes", "INSERT", movimentacoes)
+        self._emitir("patrimonio", "UPDATE", atualizadas)
+        return {"patrimonio": atualizadas, "movimentacoes": movimentacoes}
+
+    # Stand-in local do Realtime: as escritas feitas por este repositório (neste
+    # processo) geram os mesmos eventos INSERT/UPDATE/DELETE, na mesma thread
+    def assinar_alteracoes(self, tabelas, ao_receber, ao_mudar_estado):
+        self._assinantes.append((set(tabelas), ao_receber))
+        ao_mudar_estado(True)
+
+    def _emitir(self, tabela, tipo, linhas):
+        for tabelas, ao_receber in list(self._assinantes):
+            if tabela in tabelas:
+                for linha in linhas:
+                    if tipo == "DELETE":
+                        ao_receber(tabela, tipo, {}, linha)
+                    else:
+                        ao_receber(tabela, tipo, linha, {})
+
+    # Arquivos ficam em <diretorio_arquivos>/<bucket>/<caminho>; a "url" é o file:// local
+    def enviar_arquivo(self, bucket, caminho, dados, tipo):
+        destino = self.diretorio_arquivos / bucket / caminho
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(destino, "xb") as arquivo:
+                arquivo.write(dados)
+        except FileExistsError:
+            raise ArquivoExistente(destino.as_uri()) from None
+        return destino.as_uri()
+
+def _valor_sql(valor):
+    if isinstance(valor, datetime):
+        return valor.astimezone(timezone.utc).isoformat() if valor.tzinfo else valor.isoformat()
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor)
+    return valor
+
+# Config em .streamlit/secrets.toml:
+#   [backend_dados]
+#   tipo = "sqlite"            # padrão: "supabase"
+#   caminho = "dados_local.db"
+def criar_repositorio(config, conexao_supabase):
+    tipo = config.get("tipo", "supabase")
+    if tipo == "sqlite":
+        return RepositorioSQLite(os.path.expanduser(config.get("caminho", "dados_local.db")))
+    if tipo == "supabase":
+        return RepositorioSupabase(conexao_supabase())
+    raise ValueError(f"Backend de dados desconhecido: {tipo}")
@@ -0,0 +1,4 @@
+-- Miniatura da foto usada nos cards (database._enviar_foto). Fica nula para as
+-- fotos enviadas antes dela existir e para arquivos que o Pillow não conseguiu
+-- ler; nesses casos o card mostra a foto original (foto_item).
+alter table public.patrimonio add column if not exists foto_miniatura text;
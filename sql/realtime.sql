@@ -0,0 +1,9 @@
+-- Publica as alterações das tabelas do app no Supabase Realtime (postgres_changes),
+-- usadas pelo feed de alterações (database._iniciar_feed). Exclusões só trazem a
+-- chave primária em old_record, que é o que o app usa.
+alter publication supabase_realtime add table
+    public.patrimonio,
+    public.movimentacoes,
+    public.locacoes,
+    public.obras,
+    public.status;
@@ -0,0 +1,52 @@
+-- Registra a mesma movimentação para vários itens numa única transação:
+-- insere as linhas em movimentacoes, atualiza status (e obra, se p_obra_destino
+-- for informada) em patrimonio e devolve {"patrimonio": [...], "movimentacoes": [...]}
+-- com as linhas já gravadas, para o app aplicar no cache sem reler.
+-- Chamada pelo app via RPC (database.registrar_movimentacoes).
+-- O tipo de retorno mudou (antes setof patrimonio): a versão anterior sai primeiro.
+drop function if exists public.registrar_movimentacoes(bigint[], text, text, text, text, text);
+
+create or replace function public.registrar_movimentacoes(
+    p_ids bigint[],
+    p_tipo text,
+    p_status text,
+    p_responsavel text,
+    p_observacoes text default '',
+    p_obra_destino text default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_movimentacoes jsonb;
+    v_patrimonio jsonb;
+begin
+    if exists (
+        select 1 from unnest(p_ids) as i(id)
+        where not exists (select 1 from public.patrimonio p where p.id = i.id)
+    ) then
+        raise exception 'Item de patrimônio inexistente em %', p_ids;
+    end if;
+
+    with inseridas as (
+        insert into public.movimentacoes
+            (obra, numero_tombamento, tipo_movimentacao, data_hora, responsavel_movimentacao, observacoes)
+        select coalesce(p_obra_destino, p.obra), p.numero_tombamento, p_tipo, now(), p_responsavel, p_observacoes
+        from public.patrimonio p
+        where p.id = any(p_ids)
+        returning *
+    )
+    select coalesce(jsonb_agg(to_jsonb(i) order by i.id), '[]'::jsonb) into v_movimentacoes from inseridas i;
+
+    with atualizadas as (
+        update public.patrimonio p
+        set status = p_status,
+            obra = coalesce(p_obra_destino, p.obra)
+        where p.id = any(p_ids)
+        returning p.*
+    )
+    select coalesce(jsonb_agg(to_jsonb(a) order by a.id), '[]'::jsonb) into v_patrimonio from atualizadas a;
+
+    return jsonb_build_object('patrimonio', v_patrimonio, 'movimentacoes', v_movimentacoes);
+end;
+$$;
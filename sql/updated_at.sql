@@ -0,0 +1,30 @@
+-- Coluna de alteração usada como marca d'água pela sincronização incremental
+-- (database._marca_servidor / _sincronizar): com ela, a sincronização, a
+-- reconciliação do snapshot e a recuperação depois de o feed cair trazem também
+-- as linhas editadas. Sem ela o app relê as partições em memória inteiras.
+-- Reinicie o app depois de aplicar: a marca d'água é escolhida na primeira carga.
+create or replace function public.definir_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+do $$
+declare
+    tabela text;
+begin
+    foreach tabela in array array['patrimonio', 'movimentacoes', 'locacoes'] loop
+        execute format('alter table public.%I add column if not exists updated_at timestamptz not null default now()', tabela);
+        execute format('create index if not exists %I on public.%I (updated_at)', tabela || '_updated_at_idx', tabela);
+        execute format('drop trigger if exists %I on public.%I', tabela || '_updated_at', tabela);
+        execute format(
+            'create trigger %I before update on public.%I for each row execute function public.definir_updated_at()',
+            tabela || '_updated_at', tabela
+        );
+    end loop;
+end;
+$$;
@@ -0,0 +1,56 @@
+import pandas as pd
+import database as db
+import busca
+
+def _patrimonio():
+    return pd.DataFrame({
+        db.ID_COL: [10, 11, 12, 13],
+        db.NOME_COL: ["Betoneira Elétrica 400L", "Martelete", "Betoneira a diesel", None],
+        db.TOMBAMENTO_COL: ["PAT-001", "PAT-002", "PAT-003", "PAT-004"],
+        db.RESPONSAVEL_COL: ["José", "Ana", "Ana", "Ana"],
+    })
+
+COLUNAS = [db.NOME_COL, db.TOMBAMENTO_COL, db.RESPONSAVEL_COL]
+
+def test_normalizar_remove_acentos_e_nulos():
+    assert busca.normalizar(pd.Series(["Elétrica JOSÉ", None])).tolist() == ["eletrica jose", ""]
+
+def test_todos_os_termos_precisam_aparecer():
+    indice = busca.IndiceBusca(_patrimonio(), COLUNAS)
+    assert indice.buscar("betoneira") == {10, 12}
+    assert indice.buscar("BETONEIRA ana") == {12}
+    assert indice.buscar("betoneira xyz") == set()
+
+def test_termo_no_meio_do_token_e_sem_acento():
+    indice = busca.IndiceBusca(_patrimonio(), COLUNAS)
+    assert indice.buscar("toneir") == {10, 12}
+    assert indice.buscar("eletrica") == {10}
+    assert indice.buscar("jose") == {10}
+
+def test_termo_curto_busca_por_prefixo():
+    indice = busca.IndiceBusca(_patrimonio(), COLUNAS)
+    assert indice.buscar("ma") == {11}
+    assert indice.buscar("an") == {11, 12, 13}
+
+def test_consulta_vazia():
+    indice = busca.IndiceBusca(_patrimonio(), COLUNAS)
+    assert indice.buscar("  --  ") is None
+
+def test_buscar_ids_ignora_colunas_ausentes():
+    df = _patrimonio()
+    assert busca.buscar_ids(df, COLUNAS + [db.ESPEC_COL], "003") == {12}
+    assert busca.buscar_ids(df.iloc[0:0], COLUNAS, "003") is None
+
+def test_chave_conteudo_distingue_linhas_trocadas():
+    df = _patrimonio()
+    trocado = df.copy()
+    trocado[db.NOME_COL] = df[db.NOME_COL].iloc[[1, 0, 2, 3]].values
+    assert busca.chave_conteudo(df) == busca.chave_conteudo(df.copy())
+    assert busca.chave_conteudo(df) != busca.chave_conteudo(trocado)
+    assert busca.chave_conteudo(df.iloc[0:0]) == 0
+
+def test_buscar_ids_sem_versao_acompanha_o_conteudo():
+    df = _patrimonio()
+    assert busca.buscar_ids(df, COLUNAS, "martelete") == {11}
+    alterado = df.assign(**{db.NOME_COL: ["Martelete", "Betoneira", "Serra", None]})
+    assert busca.buscar_ids(alterado, COLUNAS, "martelete") == {10}
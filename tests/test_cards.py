@@ -0,0 +1,57 @@
+import threading
+import pandas as pd
+import database as db
+import utils
+
+def _patrimonio(n, sufixo=""):
+    return pd.DataFrame({
+        db.ID_COL: range(n),
+        db.NOME_COL: [f"ITEM {i}{sufixo}" for i in range(n)],
+        db.TOMBAMENTO_COL: [f"PAT-{i}" for i in range(n)],
+        db.OBRA_COL: "OBRA A",
+        db.STATUS_COL: "ATIVO",
+        db.VALOR_COL: 1.0,
+    })
+
+def test_lru_em_lote_respeita_o_limite():
+    cache = utils.CacheLRUBytes(10)
+    cache.put_varios([("a", "1234"), ("b", "1234")])
+    assert cache.get_varios(["a", "x"]) == ["1234", None]
+    cache.put_varios([("c", "1234"), ("grande", "x" * 11)])
+    assert cache.get_varios(["a", "b", "c", "grande"]) == ["1234", None, "1234", None]
+    assert cache.total_bytes == 8
+
+def test_cards_reaproveitam_o_html_das_linhas_iguais(monkeypatch):
+    caches = {"patrimonio": utils.CacheLRUBytes(1 << 20)}
+    monkeypatch.setattr(utils, "_cache_cards", lambda: caches)
+    geradas = []
+    def gerar(df):
+        geradas.append(len(df))
+        return [f"<div>{nome}</div>" for nome in df[db.NOME_COL]]
+    df = _patrimonio(5)
+    primeira = utils._cards_em_cache(df, "patrimonio", utils.COLUNAS_CARD_PATRIMONIO, gerar)
+    alterado = df.assign(**{db.NOME_COL: df[db.NOME_COL].where(df[db.ID_COL] != 2, "NOVO")})
+    segunda = utils._cards_em_cache(alterado, "patrimonio", utils.COLUNAS_CARD_PATRIMONIO, gerar)
+    assert geradas == [5, 1]
+    assert primeira.tolist()[:2] == segunda.tolist()[:2]
+    assert segunda.tolist()[2] == "<div>NOVO</div>"
+
+def test_cards_em_sessoes_concorrentes_com_descarte(monkeypatch):
+    cache = utils.CacheLRUBytes(2000)
+    monkeypatch.setattr(utils, "_cache_cards", lambda: {"patrimonio": cache})
+    erros = []
+    def sessao(sufixo):
+        try:
+            for rodada in range(30):
+                df = _patrimonio(40, f"-{sufixo}-{rodada % 3}")
+                html = utils._cards_em_cache(df, "patrimonio", utils.COLUNAS_CARD_PATRIMONIO, lambda d: [f"<p>{n}</p>" for n in d[db.NOME_COL]])
+                assert html.tolist() == [f"<p>{n}</p>" for n in df[db.NOME_COL]]
+        except Exception as e:
+            erros.append(e)
+    threads = [threading.Thread(target=sessao, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert erros == []
+    assert cache.total_bytes <= 2000
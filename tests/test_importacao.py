@@ -0,0 +1,71 @@
+import pandas as pd
+import database as db
+import importacao
+
+STATUS = ["ATIVO", "MANUTENÇÃO", "BAIXADO"]
+OBRAS = ["OBRA A", "OBRA B"]
+
+def _planilha(*linhas):
+    base = {db.NOME_COL: "betoneira", db.NF_NUM_COL: "0012", db.LOCAL_COL: "almoxarifado", db.RESPONSAVEL_COL: "ana"}
+    return pd.DataFrame([{**base, **linha} for linha in linhas]).fillna("")
+
+def _erros(relatorio):
+    return dict(zip(relatorio["linha"], relatorio["erros"]))
+
+def test_linha_completa_vira_registro_em_maiusculas():
+    validas, relatorio = importacao.validar_patrimonio(_planilha({db.VALOR_COL: "1.234,56"}), "OBRA A", STATUS, OBRAS)
+    assert relatorio.empty
+    linha = validas.iloc[0]
+    assert linha[db.NOME_COL] == "BETONEIRA"
+    assert linha[db.NF_NUM_COL] == "0012"
+    assert linha[db.VALOR_COL] == 1234.56
+    assert linha[db.STATUS_COL] == "ATIVO"
+    assert linha[db.OBRA_COL] == "OBRA A"
+
+def test_links_e_tombamento_vazio_ficam_nulos():
+    validas, _ = importacao.validar_patrimonio(_planilha({}), "OBRA A", STATUS, OBRAS)
+    linha = validas.iloc[0]
+    for coluna in (db.TOMBAMENTO_COL, db.NF_LINK_COL, db.FOTO_COL, db.FOTO_MINIATURA_COL):
+        assert linha[coluna] is None
+
+def test_obrigatorios_valor_e_status_invalidos():
+    df = _planilha({db.NOME_COL: "", db.VALOR_COL: "abc"}, {db.STATUS_COL: "perdido"}, {db.VALOR_COL: "-5"})
+    validas, relatorio = importacao.validar_patrimonio(df, "OBRA A", STATUS, OBRAS)
+    assert validas.empty
+    erros = _erros(relatorio)
+    assert erros[2] == "Nome obrigatório; Valor inválido"
+    assert erros[3] == "Status desconhecido"
+    assert erros[4] == "Valor inválido"
+
+def test_status_aceita_minusculas():
+    validas, relatorio = importacao.validar_patrimonio(_planilha({db.STATUS_COL: "manutenção"}), "OBRA A", STATUS, OBRAS)
+    assert relatorio.empty
+    assert validas.iloc[0][db.STATUS_COL] == "MANUTENÇÃO"
+
+def test_tombamento_repetido_e_ja_cadastrado():
+    df = _planilha({db.TOMBAMENTO_COL: "pat-1"}, {db.TOMBAMENTO_COL: "PAT-1 "}, {db.TOMBAMENTO_COL: "pat-2"}, {db.TOMBAMENTO_COL: "pat-3"})
+    validas, relatorio = importacao.validar_patrimonio(df, "OBRA A", STATUS, OBRAS, tombamentos_existentes=["PAT-2", None])
+    erros = _erros(relatorio)
+    assert erros[2] == erros[3] == "Tombamento repetido na planilha"
+    assert erros[4] == "Tombamento já cadastrado"
+    assert validas[db.TOMBAMENTO_COL].tolist() == ["PAT-3"]
+
+def test_obra_da_planilha_so_com_permissao():
+    df = _planilha({db.OBRA_COL: "OBRA B"}, {db.OBRA_COL: ""}, {db.OBRA_COL: "OBRA Z"})
+    validas, relatorio = importacao.validar_patrimonio(df, "OBRA A", STATUS, OBRAS, permitir_obra=True)
+    assert validas[db.OBRA_COL].tolist() == ["OBRA B", "OBRA A"]
+    assert _erros(relatorio) == {4: "Obra desconhecida"}
+
+    validas, _ = importacao.validar_patrimonio(df.iloc[:2], "OBRA A", STATUS, OBRAS)
+    assert validas[db.OBRA_COL].tolist() == ["OBRA A", "OBRA A"]
+
+def test_tombamentos_da_planilha():
+    df = pd.DataFrame({db.TOMBAMENTO_COL: [" pat-2", "", "PAT-1", "pat-2"]})
+    assert importacao.tombamentos_da_planilha(df) == ["PAT-1", "PAT-2"]
+    assert importacao.tombamentos_da_planilha(pd.DataFrame({db.NOME_COL: ["x"]})) == []
+
+def test_valores_com_separador_de_milhar():
+    df = _planilha(*({db.VALOR_COL: v} for v in ["1.234", "R$ 2.500", "1.234,56", "1234.56", "12.5", "1.234.567", ""]))
+    validas, relatorio = importacao.validar_patrimonio(df, "OBRA A", STATUS, OBRAS)
+    assert relatorio.empty
+    assert validas[db.VALOR_COL].tolist() == [1234.0, 2500.0, 1234.56, 1234.56, 12.5, 1234567.0, 0.0]
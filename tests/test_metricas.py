@@ -0,0 +1,65 @@
+import pytest
+import metricas
+
+@pytest.fixture(autouse=True)
+def registro(monkeypatch):
+    monkeypatch.setattr(metricas, "_REGISTRO", metricas.Registro())
+
+def _tempos(nome, valores):
+    for ms in valores:
+        metricas._REGISTRO.registrar_tempo(nome, ms)
+
+def test_percentis_e_totais():
+    _tempos("db.visao", range(1, 101))
+    (linha,) = metricas.resumo_tempos()
+    assert linha == {
+        "medida": "db.visao", "chamadas": 100, "total_ms": 5050.0,
+        "p50_ms": 51.0, "p90_ms": 91.0, "p99_ms": 100.0, "max_ms": 100.0,
+    }
+
+def test_percentis_usam_so_as_ultimas_amostras():
+    _tempos("x", [1000.0] * 10 + [1.0] * metricas.AMOSTRAS_POR_MEDIDA)
+    (linha,) = metricas.resumo_tempos()
+    assert linha["max_ms"] == 1.0
+    assert linha["chamadas"] == metricas.AMOSTRAS_POR_MEDIDA + 10
+
+def test_medido_registra_inclusive_com_excecao():
+    @metricas.medido("falha")
+    def falhar():
+        raise RuntimeError
+    with pytest.raises(RuntimeError):
+        falhar()
+    assert metricas.resumo_tempos()[0]["chamadas"] == 1
+
+def test_rodada_so_registra_entre_inicio_e_fim():
+    with metricas.medir("antes"):
+        pass
+    metricas.iniciar_rodada()
+    with metricas.medir("durante"):
+        pass
+    assert [nome for nome, _ in metricas.encerrar_rodada()] == ["durante"]
+    assert metricas.encerrar_rodada() == []
+
+def test_resumo_caches():
+    metricas.contar_cache("cache.qr", True)
+    metricas.contar_cache("cache.qr", False, 3)
+    assert metricas.resumo_caches() == [{"cache": "cache.qr", "hit": 1, "miss": 3, "taxa_acerto": 0.25}]
+
+def test_exportar_prometheus():
+    _tempos("db.visao", [10.0, 30.0])
+    metricas.contar("db.linhas_lidas", 7)
+    metricas.contar_cache("cache.cards.patrimonio", True, 5)
+    metricas.contar_cache("cache.cards.patrimonio", False, 2)
+    assert metricas.exportar_prometheus().splitlines() == [
+        "# TYPE patrimonio_db_visao_seconds summary",
+        'patrimonio_db_visao_seconds{quantile="0.5"} 0.030000',
+        'patrimonio_db_visao_seconds{quantile="0.9"} 0.030000',
+        'patrimonio_db_visao_seconds{quantile="0.99"} 0.030000',
+        "patrimonio_db_visao_seconds_sum 0.040000",
+        "patrimonio_db_visao_seconds_count 2",
+        "# TYPE patrimonio_db_linhas_lidas_total counter",
+        "patrimonio_db_linhas_lidas_total 7",
+        "# TYPE patrimonio_cache_cards_patrimonio_total counter",
+        'patrimonio_cache_cards_patrimonio_total{result="hit"} 5',
+        'patrimonio_cache_cards_patrimonio_total{result="miss"} 2',
+    ]
@@ -0,0 +1,90 @@
+import sqlite3
+import pytest
+import repositorio
+
+@pytest.fixture
+def repo(tmp_path):
+    return repositorio.RepositorioSQLite(tmp_path / "dados.db")
+
+def _itens(repo):
+    return repo.inserir("patrimonio", [
+        {"obra": "OBRA A", "numero_tombamento": "PAT-1", "nome": "BETONEIRA", "valor": 10.0, "status": "ATIVO"},
+        {"obra": "OBRA A", "numero_tombamento": "PAT-2", "nome": "MARTELETE", "valor": 20.0, "status": "ATIVO"},
+        {"obra": "OBRA B", "numero_tombamento": "PAT-3", "nome": "SERRA", "valor": 30.0, "status": "ATIVO"},
+        {"obra": None, "numero_tombamento": "PAT-4", "nome": "ANDAIME", "valor": 40.0, "status": "BAIXADO"},
+    ])
+
+def test_inserir_devolve_linhas_com_id_e_carimbos(repo):
+    inseridas = _itens(repo)
+    assert [l["id"] for l in inseridas] == [1, 2, 3, 4]
+    assert all(l["created_at"] and l["updated_at"] for l in inseridas)
+
+def test_filtros(repo):
+    _itens(repo)
+    def nomes(filtros):
+        return [l["nome"] for l in repo.consultar("patrimonio", "nome", filtros, ordem="id").data]
+    assert nomes([("eq", "obra", "OBRA A")]) == ["BETONEIRA", "MARTELETE"]
+    assert nomes([("gt", "valor", 15)]) == ["MARTELETE", "SERRA", "ANDAIME"]
+    assert nomes([("in_", "numero_tombamento", ["PAT-1", "PAT-3"])]) == ["BETONEIRA", "SERRA"]
+    assert nomes([("in_", "numero_tombamento", [])]) == []
+    assert nomes([("fora_de", "obra", ["OBRA A"])]) == ["SERRA", "ANDAIME"]
+    assert nomes([("eq", "obra", "OBRA A"), ("gt", "valor", 15)]) == ["MARTELETE"]
+
+def test_paginacao_e_contagem(repo):
+    _itens(repo)
+    resposta = repo.consultar("patrimonio", "id", ordem="valor", desc=True, inicio=1, limite=2, contar=True)
+    assert [l["id"] for l in resposta.data] == [3, 2]
+    assert resposta.count == 4
+
+def test_nomes_invalidos_sao_recusados(repo):
+    with pytest.raises(ValueError):
+        repo.consultar("patrimonio", "nome; drop table patrimonio")
+    with pytest.raises(ValueError):
+        repo.consultar("patrimonio", filtros=[("like", "nome", "%")])
+
+def test_atualizar_e_excluir_emitem_eventos(repo):
+    eventos = []
+    repo.assinar_alteracoes(["patrimonio"], lambda t, tipo, linha, antiga: eventos.append((tipo, (linha or antiga)["id"])), lambda ativo: None)
+    _itens(repo)
+    atualizadas = repo.atualizar("patrimonio", {"status": "MANUTENÇÃO"}, [("eq", "obra", "OBRA B")])
+    assert [(l["id"], l["status"]) for l in atualizadas] == [(3, "MANUTENÇÃO")]
+    removidas = repo.excluir("patrimonio", [("eq", "id", 4)])
+    assert [l["nome"] for l in removidas] == ["ANDAIME"]
+    assert eventos[-2:] == [("UPDATE", 3), ("DELETE", 4)]
+
+def test_registrar_movimentacoes(repo):
+    _itens(repo)
+    gravadas = repo.registrar_movimentacoes([1, 2], "Saída", "EMPRÉSTIMO", "ANA", "obs", obra_destino="OBRA B")
+    assert [(l["id"], l["status"], l["obra"]) for l in gravadas["patrimonio"]] == [(1, "EMPRÉSTIMO", "OBRA B"), (2, "EMPRÉSTIMO", "OBRA B")]
+    movimentacoes = repo.consultar("movimentacoes", ordem="id").data
+    assert [(m["numero_tombamento"], m["tipo_movimentacao"], m["obra"]) for m in movimentacoes] == [("PAT-1", "Saída", "OBRA B"), ("PAT-2", "Saída", "OBRA B")]
+    assert gravadas["movimentacoes"] == movimentacoes
+
+def test_registrar_movimentacoes_com_id_inexistente_nao_grava(repo):
+    _itens(repo)
+    with pytest.raises(ValueError):
+        repo.registrar_movimentacoes([1, 99], "Saída", "EMPRÉSTIMO", "ANA")
+    assert repo.consultar("movimentacoes").data == []
+    assert repo.consultar("patrimonio", "status", [("eq", "id", 1)]).data == [{"status": "ATIVO"}]
+
+def test_enviar_arquivo_nunca_sobrescreve(repo):
+    url = repo.enviar_arquivo("fotos", "a/foto.jpg", b"1", "image/jpeg")
+    with pytest.raises(repositorio.ArquivoExistente) as erro:
+        repo.enviar_arquivo("fotos", "a/foto.jpg", b"2", "image/jpeg")
+    assert erro.value.url == url
+    assert (repo.diretorio_arquivos / "fotos" / "a" / "foto.jpg").read_bytes() == b"1"
+
+def test_banco_antigo_ganha_colunas_novas(tmp_path):
+    caminho = tmp_path / "antigo.db"
+    repositorio.RepositorioSQLite(caminho)
+    with sqlite3.connect(caminho) as conexao:
+        conexao.execute("ALTER TABLE patrimonio DROP COLUMN foto_miniatura")
+    repo = repositorio.RepositorioSQLite(caminho)
+    repo.inserir("patrimonio", {"nome": "SERRA", "foto_miniatura": "mini.jpg"})
+    assert repo.consultar("patrimonio", "nome,foto_miniatura").data == [{"nome": "SERRA", "foto_miniatura": "mini.jpg"}]
+
+def test_erro_transitorio():
+    assert repositorio.erro_transitorio(TimeoutError())
+    assert repositorio.erro_transitorio(sqlite3.OperationalError("database is locked"))
+    assert not repositorio.erro_transitorio(sqlite3.OperationalError("no such column: x"))
+    assert not repositorio.erro_transitorio(ValueError("dados inválidos"))
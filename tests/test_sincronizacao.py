@@ -0,0 +1,126 @@
+import pytest
+import database as db
+import repositorio
+
+# Banco sem a coluna updated_at (Supabase antes de sql/updated_at.sql)
+class RepositorioSemAlteracao(repositorio.RepositorioSQLite):
+    def consultar(self, tabela, colunas="*", filtros=(), ordem=None, desc=False, inicio=0, limite=None, contar=False):
+        if db.COLUNA_ALTERACAO in (ordem, colunas) or any(f[1] == db.COLUNA_ALTERACAO for f in filtros):
+            raise ValueError("coluna updated_at não existe")
+        resposta = super().consultar(tabela, colunas, filtros, ordem, desc, inicio, limite, contar)
+        linhas = [{c: v for c, v in linha.items() if c != db.COLUNA_ALTERACAO} for linha in resposta.data]
+        return repositorio.Resposta(linhas, resposta.count)
+
+@pytest.fixture(params=[repositorio.RepositorioSQLite, RepositorioSemAlteracao], ids=["updated_at", "sem_updated_at"])
+def repo(request, tmp_path):
+    repo = request.param(tmp_path / "dados.db")
+    repo.inserir("patrimonio", [
+        {"obra": "OBRA A", "numero_tombamento": "PAT-1", "nome": "SERRA", "status": "ATIVO"},
+        {"obra": "OBRA A", "numero_tombamento": "PAT-2", "nome": "MARTELETE", "status": "ATIVO"},
+        {"obra": "OBRA B", "numero_tombamento": "PAT-3", "nome": "ANDAIME", "status": "ATIVO"},
+    ])
+    return repo
+
+def _estado(repo, obra="OBRA A"):
+    estado = db.EstadoDados()
+    db._preparar_estado(repo, estado)
+    for tabela, colunas in db.PERFIS_COLUNAS["cards"].items():
+        db._garantir_colunas(repo, estado, tabela, colunas)
+    db._carregar_particoes(repo, estado, obra)
+    return estado
+
+def _nomes(estado, obra="OBRA A"):
+    return db._visao(estado, "patrimonio", obra)[db.NOME_COL].astype(str).tolist()
+
+def test_marca_segue_a_coluna_de_alteracao(repo):
+    estado = _estado(repo)
+    esperado = not isinstance(repo, RepositorioSemAlteracao)
+    assert db._marca_incremental(estado.marcas["patrimonio"]) == esperado
+
+def test_sincronizacao_traz_edicoes_de_outro_processo(repo):
+    estado = _estado(repo)
+    versao_b = db._versao(estado, "movimentacoes", None)
+    repo.atualizar("patrimonio", {"nome": "SERRA CIRCULAR"}, [("eq", "id", 1)])
+    repo.inserir("patrimonio", {"obra": "OBRA A", "numero_tombamento": "PAT-4", "nome": "BETONEIRA", "status": "ATIVO"})
+    repo.excluir("patrimonio", [("eq", "id", 2)])
+    estado.ultima_conferencia = 0.0
+    db._sincronizar(repo, estado)
+    assert _nomes(estado) == ["SERRA CIRCULAR", "BETONEIRA"]
+    assert "OBRA B" not in estado.particoes["patrimonio"]
+    assert db._versao(estado, "movimentacoes", None) == versao_b
+
+def test_sincronizacao_sem_mudancas_nao_troca_versao(repo):
+    estado = _estado(repo)
+    antes = db._versao(estado, "patrimonio", "OBRA A")
+    db._sincronizar(repo, estado)
+    assert db._versao(estado, "patrimonio", "OBRA A") == antes
+
+def test_snapshot_so_guarda_tabelas_com_marca_incremental(repo, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(db, "DIRETORIO_SNAPSHOT", str(tmp_path / "snapshot"))
+    db._salvar_snapshot(_estado(repo))
+    repo.atualizar("patrimonio", {"nome": "SERRA CIRCULAR"}, [("eq", "id", 1)])
+
+    aberto = db.EstadoDados()
+    db._ler_snapshot(aberto)
+    assert aberto.lista_obras is not None
+    if isinstance(repo, RepositorioSemAlteracao):
+        assert aberto.particoes["patrimonio"] == {} and "patrimonio" not in aberto.marcas
+        assert db._faltantes(aberto, "OBRA A") == ["patrimonio", "movimentacoes", "locacoes"]
+    else:
+        assert _nomes(aberto) == ["SERRA", "MARTELETE"]
+        db._sincronizar(repo, aberto)
+        assert _nomes(aberto) == ["SERRA CIRCULAR", "MARTELETE"]
+
+def test_reconexao_do_feed_recupera_edicoes_e_exclusoes_perdidas(repo):
+    estado = _estado(repo)
+    db._feed_mudou(estado, False)
+    db._sincronizar(repo, estado)
+    # Escritas feitas enquanto o feed estava fora (sem eventos para este estado)
+    repo.atualizar("patrimonio", {"nome": "SERRA CIRCULAR"}, [("eq", "id", 1)])
+    repo.excluir("patrimonio", [("eq", "id", 2)])
+    db._feed_mudou(estado, True)
+    db._sincronizar(repo, estado)
+    assert _nomes(estado) == ["SERRA CIRCULAR"]
+
+def test_completar_colunas_traz_so_as_faltantes_das_linhas_pedidas(repo, monkeypatch):
+    repo.atualizar("patrimonio", {"observacoes": "CABO NOVO"}, [("eq", "id", 2)])
+    estado = _estado(repo)
+    consultas = []
+    consultar = repo.consultar
+    def registrar(tabela, colunas="*", filtros=(), *args, **kwargs):
+        if tabela == "patrimonio":
+            consultas.append((colunas, [f[:2] for f in filtros]))
+        return consultar(tabela, colunas, filtros, *args, **kwargs)
+    monkeypatch.setattr(repo, "consultar", registrar)
+    monkeypatch.setattr(db, "get_repositorio", lambda: repo)
+    monkeypatch.setattr(db, "_estado_dados", lambda: estado)
+    db._consulta_avulsa.clear()
+
+    visao = db._visao(estado, "patrimonio", "OBRA A")
+    completo = db.completar_colunas(visao, "patrimonio", "tabela")
+    assert completo[db.OBS_COL].fillna("").tolist() == ["", "CABO NOVO"]
+    assert completo.attrs == visao.attrs
+    colunas, filtros = consultas[0]
+    assert colunas.split(",") == [db.ID_COL, db.OBS_COL, db.NF_NUM_COL]
+    assert filtros == [("in_", db.OBRA_COL)]
+
+    consultas.clear()
+    filtrado = db.completar_colunas(visao[visao[db.ID_COL] == 2], "patrimonio", "tabela")
+    assert filtrado[db.OBS_COL].tolist() == ["CABO NOVO"]
+    assert consultas[0][1] == [("in_", db.ID_COL)]
+
+    consultas.clear()
+    db.completar_colunas(visao, "patrimonio", "tabela")
+    assert consultas == []
+
+def test_registrar_movimentacoes_aplica_o_retorno_sem_sincronizar(repo, monkeypatch):
+    estado = _estado(repo)
+    monkeypatch.setattr(db, "get_repositorio", lambda: repo)
+    monkeypatch.setattr(db, "_estado_dados", lambda: estado)
+    db.registrar_movimentacoes([1, 2], "Saída", "ANA", obra_destino="OBRA B")
+    assert not estado.sincronizar_ja and not estado.ids_pendentes["movimentacoes"]
+    assert db._visao(estado, "patrimonio", "OBRA A").empty
+    movimentacoes = db._visao(estado, "movimentacoes", None)
+    assert movimentacoes[db.TOMBAMENTO_COL].astype(str).tolist() == ["PAT-1", "PAT-2"]
+    assert movimentacoes[db.OBRA_COL].astype(str).tolist() == ["OBRA B", "OBRA B"]
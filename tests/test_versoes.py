@@ -0,0 +1,88 @@
+import pandas as pd
+import database as db
+
+def _linhas(*itens):
+    return [{db.ID_COL: i, db.OBRA_COL: obra, db.NOME_COL: nome, db.VALOR_COL: 1.0} for i, obra, nome in itens]
+
+def _estado():
+    estado = db.EstadoDados()
+    df = db._montar_df("patrimonio", _linhas((1, "OBRA A", "SERRA"), (2, "OBRA B", "MARTELETE"), (3, "OBRA A", "ANDAIME")))
+    particoes = db._dividir_por_obra("patrimonio", df)
+    estado.particoes["patrimonio"].update(particoes)
+    estado.completo["patrimonio"] = True
+    db._nova_versao(estado, "patrimonio", particoes)
+    return estado
+
+def _chave(estado, obra):
+    return db._visao(estado, "patrimonio", obra).attrs["versao_dados"]
+
+def test_visao_leva_tabela_obra_e_versao():
+    estado = _estado()
+    assert _chave(estado, "OBRA A") == ("patrimonio", "OBRA A", db._versao(estado, "patrimonio", "OBRA A"))
+    assert _chave(estado, None)[2] == max(estado.versoes["patrimonio"].values())
+    assert db._visao(estado, "patrimonio", None)[db.ID_COL].tolist() == [1, 2, 3]
+
+def test_alteracao_so_muda_a_versao_da_obra_alterada():
+    estado = _estado()
+    antes = {obra: _chave(estado, obra) for obra in ("OBRA A", "OBRA B", None)}
+    novas = db._montar_df("patrimonio", _linhas((2, "OBRA B", "MARTELETE 2")))
+    db._aplicar_alteracoes(estado, "patrimonio", novas, {2})
+    assert _chave(estado, "OBRA A") == antes["OBRA A"]
+    assert _chave(estado, "OBRA B") != antes["OBRA B"]
+    assert _chave(estado, None) != antes[None]
+    assert db._visao(estado, "patrimonio", "OBRA B")[db.NOME_COL].tolist() == ["MARTELETE 2"]
+
+def test_obra_nova_ganha_particao_e_versao():
+    estado = _estado()
+    novas = db._montar_df("patrimonio", _linhas((4, "OBRA C", "BETONEIRA")))
+    db._aplicar_alteracoes(estado, "patrimonio", novas, set())
+    assert db._versao(estado, "patrimonio", "OBRA C") == db._versao(estado, "patrimonio", None)
+    assert db._visao(estado, "patrimonio", "OBRA C")[db.ID_COL].tolist() == [4]
+
+def test_outras_tabelas_e_obras_sem_dados_nao_mudam():
+    estado = _estado()
+    db._aplicar_alteracoes(estado, "patrimonio", db._montar_df("patrimonio", _linhas((5, "OBRA A", "SERRA"))), set())
+    assert db._versao(estado, "movimentacoes", None) == 0
+    assert db._versao(estado, "patrimonio", "OBRA Z") == 0
+    vazia = db._visao(estado, "locacoes", "OBRA A")
+    assert vazia.empty and vazia.attrs["versao_dados"] == ("locacoes", "OBRA A", 0)
+
+def _movimentacoes(*itens):
+    return [{db.ID_COL: i, db.OBRA_COL: obra, db.TOMBAMENTO_COL: tomb, "tipo_movimentacao": tipo, "data_hora": "2026-01-01T00:00:00+00:00"} for i, obra, tomb, tipo in itens]
+
+def _com_movimentacoes(estado):
+    df = db._montar_df("movimentacoes", _movimentacoes((1, "OBRA A", "PAT-1", "Entrada"), (2, "OBRA B", "PAT-2", "Entrada"), (3, "OBRA A", "PAT-2", "Saída")))
+    particoes = db._dividir_por_obra("movimentacoes", df)
+    estado.particoes["movimentacoes"].update(particoes)
+    estado.completo["movimentacoes"] = True
+    db._nova_versao(estado, "movimentacoes", particoes)
+    return estado
+
+def test_movimentacoes_da_obra_seguem_os_tombamentos_do_patrimonio():
+    estado = _estado()
+    novas = db._montar_df("patrimonio", [{db.ID_COL: 2, db.OBRA_COL: "OBRA A", db.TOMBAMENTO_COL: "PAT-2", db.NOME_COL: "MARTELETE", db.VALOR_COL: 1.0}])
+    db._aplicar_alteracoes(estado, "patrimonio", novas, {2})
+    estado = _com_movimentacoes(estado)
+    visao = db._visao(estado, "movimentacoes", "OBRA A")
+    # A Entrada de PAT-2 foi gravada na obra de origem e continua na visão da obra atual
+    assert visao[db.ID_COL].tolist() == [2, 3]
+    assert db._visao(estado, "movimentacoes", "OBRA B").empty
+
+def test_versao_das_movimentacoes_da_obra_acompanha_o_patrimonio():
+    estado = _com_movimentacoes(_estado())
+    antes = db._visao(estado, "movimentacoes", "OBRA A").attrs["versao_dados"]
+    db._aplicar_alteracoes(estado, "patrimonio", db._montar_df("patrimonio", _linhas((6, "OBRA A", "ESCADA"))), set())
+    assert db._visao(estado, "movimentacoes", "OBRA A").attrs["versao_dados"] != antes
+
+def test_movimentacoes_sao_carregadas_inteiras():
+    estado = db.EstadoDados()
+    assert db._faltantes(estado, "OBRA A") == ["patrimonio", "movimentacoes", "locacoes"]
+    estado.particoes["patrimonio"]["OBRA A"] = estado.particoes["locacoes"]["OBRA A"] = pd.DataFrame()
+    estado.particoes["movimentacoes"]["OBRA A"] = pd.DataFrame()
+    assert db._faltantes(estado, "OBRA A") == ["movimentacoes"]
+
+def test_visao_da_obra_e_uma_copia():
+    estado = _estado()
+    visao = db._visao(estado, "patrimonio", "OBRA A")
+    visao.loc[0, db.NOME_COL] = "ALTERADO"
+    assert "ALTERADO" not in db._visao(estado, "patrimonio", "OBRA A")[db.NOME_COL].tolist()
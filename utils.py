@@ -1,10 +1,21 @@
 import streamlit as st
 import pandas as pd
 import io
+import os
+import html
+import hashlib
+import itertools
+import multiprocessing
+import threading
 import qrcode
-import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from importlib.util import find_spec
 from fpdf import FPDF
 import database as db
+import blocos_pdf
+import busca
+import metricas
 
 def aplicar_css():
     APP_STYLE_CSS = """
@@ -41,11 +52,220 @@ def aplicar_css():
     """
     st.markdown(APP_STYLE_CSS, unsafe_allow_html=True)
 
+CORES_STATUS_PATRIMONIO = {"ATIVO": "#35BE53", "MANUTENÇÃO": "#ffc107", "EMPRÉSTIMO": "#ffc107"}
+CORES_STATUS_LOCACAO = {"ATIVO": "#35BE53", "MANUTENÇÃO": "#ffc107"}
+COR_STATUS_PADRAO = "#dc3545"
+# Por tipo de card; o tamanho de cada entrada é o do texto HTML
+MAX_BYTES_CACHE_CARDS = 32 * 1024 * 1024
+
+COLUNAS_CARD_PATRIMONIO = [
+    db.NOME_COL, db.TOMBAMENTO_COL, db.OBRA_COL, db.LOCAL_COL, db.RESPONSAVEL_COL,
+    db.VALOR_COL, db.ESPEC_COL, db.STATUS_COL, db.FOTO_COL, db.FOTO_MINIATURA_COL
+]
+COLUNAS_CARD_LOCACAO = [
+    "equipamento", "contrato_sienge", "status", "obra_destino", "quantidade", "responsavel",
+    "valor_mensal", "valor_total", "data_inicio", "data_previsao_fim"
+]
+
+# Compartilhado entre sessões (e threads): CacheLRUBytes faz o acesso sob lock
+@st.cache_resource
+def _cache_cards():
+    return {"patrimonio": CacheLRUBytes(MAX_BYTES_CACHE_CARDS), "locacoes": CacheLRUBytes(MAX_BYTES_CACHE_CARDS)}
+
+# HTML de cada linha guardado pelo hash do conteúdo das colunas exibidas: só as
+# linhas novas ou alteradas passam pela geração (feita em lote, por coluna, fora
+# do lock do cache).
+def _cards_em_cache(df, tipo, colunas, gerar):
+    if df.empty:
+        return pd.Series(dtype=object)
+    cache = _cache_cards()[tipo]
+    visiveis = df[[c for c in colunas if c in df.columns]]
+    chaves = pd.util.hash_pandas_object(visiveis.astype(str), index=False).tolist()
+    html = pd.Series(cache.get_varios(chaves), index=df.index, dtype=object)
+    faltando = html.isna()
+    metricas.contar_cache(f"cache.cards.{tipo}", True, int((~faltando).sum()))
+    metricas.contar_cache(f"cache.cards.{tipo}", False, int(faltando.sum()))
+    if faltando.any():
+        novos = list(gerar(df[faltando.values]))
+        html[faltando] = novos
+        cache.put_varios(zip((c for c, f in zip(chaves, faltando) if f), novos))
+    return html
+
+# Como str(valor) linha a linha: no pandas 3 o astype(str) mantém os ausentes
+# como NaN, e um NaN anularia o HTML do card inteiro
+def _texto(serie):
+    return serie.astype(object).map(str)
+
+# URL de foto como texto; "" quando não há (None, NaN, vazio)
+def _url(serie):
+    texto = _texto(serie).str.strip()
+    return texto.where(serie.notna() & (texto != "None") & (texto != "nan"), "")
+
+def _gerar_cards_patrimonio(df):
+    st_txt = _texto(df[db.STATUS_COL]).str.strip().str.upper()
+    cor_status = st_txt.map(CORES_STATUS_PATRIMONIO).fillna(COR_STATUS_PADRAO)
+    valor_fmt = pd.to_numeric(df[db.VALOR_COL], errors="coerce").fillna(0).map("R$ {:,.2f}".format)
+    nome_safe = _texto(df[db.NOME_COL]).str.replace('"', '&quot;', regex=False)
+    espec = df[db.ESPEC_COL]
+    espec_safe = (_texto(espec).str[:200] + "...").where(espec.notna() & (espec != ""), "")
+    foto = _url(df[db.FOTO_COL])
+    miniatura = _url(df[db.FOTO_MINIATURA_COL]) if db.FOTO_MINIATURA_COL in df.columns else pd.Series("", index=df.index)
+    src = miniatura.where(miniatura != "", foto).map(lambda u: html.escape(u, quote=True))
+    img_html = ('<img src="' + src + '" loading="lazy" decoding="async" style="width: 200px; height: 130px; object-fit: cover; border-radius: 8px; border: 1px solid #333; margin-top: 10px;">').where(foto != "", "")
+
+    return (
+        '<div style="margin-bottom: 10px; display: flex; justify-content: space-between; gap: 15px;">'
+        '<div style="flex-grow: 1;">'
+        '<h3 style="margin:0; color: white; font-size: 1.3em;">' + nome_safe + '</h3>'
+        '<div style="color: #E37026; font-weight: bold; font-size: 0.9em; margin-bottom: 10px;">TOMBAMENTO: ' + _texto(df[db.TOMBAMENTO_COL]) + '</div>'
+        '<div style="display:flex; flex-wrap: wrap; gap: 15px; color: #CCC; font-size: 0.85em;">'
+        '<div style="min-width: 100px;"><b style="color: #888; display:block;">OBRA</b>' + _texto(df[db.OBRA_COL]) + '</div>'
+        '<div style="min-width: 100px;"><b style="color: #888; display:block;">LOCAL</b>' + _texto(df[db.LOCAL_COL]) + '</div>'
+        '<div style="min-width: 100px;"><b style="color: #888; display:block;">RESPONSÁVEL</b>' + _texto(df[db.RESPONSAVEL_COL]) + '</div>'
+        '<div><b style="color: #888; display:block;">VALOR</b><span style="color: #E37026;">' + valor_fmt + '</span></div>'
+        '</div>'
+        '<div style="margin-top: 10px; font-size: 0.8em; color: #888; font-style: italic;">' + espec_safe + '</div>'
+        '</div>'
+        '<div style="display: flex; flex-direction: column; align-items: flex-end; min-width: 130px; flex-shrink: 0;">'
+        '<span style="background-color: ' + cor_status + '22; color: ' + cor_status + '; padding: 4px 12px; border-radius: 4px; font-size: 0.75em; border: 1px solid ' + cor_status + '; font-weight: bold; text-align: center; margin-bottom: 5px;">' + st_txt + '</span>' + img_html + '</div>'
+        '</div>'
+        '<hr style="border-top: 1px solid #333; margin: 5px 0 10px 0;">'
+    ).tolist()
+
+def _gerar_cards_locacao(df):
+    def data_fmt(col):
+        return pd.to_datetime(df[col], errors="coerce").dt.strftime('%d/%m/%Y').fillna('-')
+
+    valor_mensal = pd.to_numeric(df['valor_mensal'], errors="coerce").fillna(0)
+    quantidade = pd.to_numeric(df['quantidade'], errors="coerce").fillna(0)
+    valor_total = pd.to_numeric(df['valor_total'], errors="coerce") if 'valor_total' in df.columns else pd.Series(0, index=df.index)
+    v_total_show = valor_total.where(valor_total.fillna(0) != 0, quantidade * valor_mensal)
+    st_loc = _texto(df['status'])
+    cor_loc = st_loc.map(CORES_STATUS_LOCACAO).fillna(COR_STATUS_PADRAO)
+
+    return (
+        '<div style="margin-bottom: 10px;">'
+        '<div style="display:flex; justify-content:space-between; align-items:start;">'
+        '<div>'
+        '<h3 style="margin:0; color: white; font-size: 1.3em;">' + _texto(df['equipamento']).str.replace('"', '&quot;', regex=False) + '</h3>'
+        '<span style="color: #888; font-size: 0.9em;">' + _texto(df['contrato_sienge']) + '</span>'
+        '</div>'
+        '<span style="background-color: ' + cor_loc + '22; color: ' + cor_loc + '; padding: 4px 12px; border-radius: 4px; font-size: 0.75em; border: 1px solid ' + cor_loc + '; font-weight: bold;">' + st_loc + '</span>'
+        '</div>'
+        '<div style="margin-top: 15px; display:flex; flex-wrap:wrap; gap: 20px; color: #CCC; font-size: 0.9em;">'
+        '<div style="min-width: 140px;"><b style="color: #888; display:block;">OBRA</b>' + _texto(df['obra_destino']) + '</div>'
+        '<div style="min-width: 50px;"><b style="color: #888; display:block;">QTD</b>' + _texto(df['quantidade']) + '</div>'
+        '<div style="min-width: 140px;"><b style="color: #888; display:block;">RESPONSÁVEL</b>' + _texto(df['responsavel']) + '</div>'
+        '<div><b style="color: #888; display:block;">VALOR UNIT.</b><span style="color: #aaa;">' + valor_mensal.map("R$ {:,.2f}".format) + '</span></div>'
+        '<div><b style="color: #888; display:block;">VALOR TOTAL</b><span style="color: #E37026; font-weight:bold;">' + v_total_show.map("R$ {:,.2f}".format) + '</span></div>'
+        '</div>'
+        '<div style="margin-top: 10px; font-size: 0.85em; color: #aaa; display:flex; gap: 20px;">'
+        '<span>Início: ' + data_fmt('data_inicio') + '</span><span>Prev. Fim: ' + data_fmt('data_previsao_fim') + '</span>'
+        '</div>'
+        '<hr style="border-top: 1px solid #333; margin: 15px 0 10px 0;">'
+        '</div>'
+    ).tolist()
+
+@metricas.medido("utils.html_cards_patrimonio")
+def html_cards_patrimonio(df):
+    return _cards_em_cache(df, "patrimonio", COLUNAS_CARD_PATRIMONIO, _gerar_cards_patrimonio)
+
+@metricas.medido("utils.html_cards_locacoes")
+def html_cards_locacoes(df):
+    return _cards_em_cache(df, "locacoes", COLUNAS_CARD_LOCACAO, _gerar_cards_locacao)
+
 def clean_text(text):
     if text is None: return ""
     return str(text).encode('latin-1', 'replace').decode('latin-1')
 
+MAX_BYTES_CACHE_QR = 64 * 1024 * 1024
+
+# LRU limitado pelo total de bytes guardados (não pelo número de entradas)
+class CacheLRUBytes:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.itens = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, chave):
+        with self.lock:
+            dados = self.itens.get(chave)
+            if dados is not None:
+                self.itens.move_to_end(chave)
+            return dados
+
+    def put(self, chave, dados):
+        self.put_varios([(chave, dados)])
+
+    # Em lote (ex.: uma página de cards), com um único acesso ao lock
+    def get_varios(self, chaves):
+        with self.lock:
+            encontrados = [self.itens.get(chave) for chave in chaves]
+            for chave, dados in zip(chaves, encontrados):
+                if dados is not None:
+                    self.itens.move_to_end(chave)
+            return encontrados
+
+    def put_varios(self, pares):
+        with self.lock:
+            for chave, dados in pares:
+                if len(dados) > self.max_bytes:
+                    continue
+                antigo = self.itens.pop(chave, None)
+                if antigo is not None:
+                    self.total_bytes -= len(antigo)
+                self.itens[chave] = dados
+                self.total_bytes += len(dados)
+            while self.total_bytes > self.max_bytes:
+                _, removido = self.itens.popitem(last=False)
+                self.total_bytes -= len(removido)
+
+@st.cache_resource
+def _cache_qr():
+    return CacheLRUBytes(MAX_BYTES_CACHE_QR)
+
+def payload_qr(row_series):
+    return f"ID: {row_series[db.ID_COL]}\nItem: {row_series[db.NOME_COL]}\nTombamento: {row_series[db.TOMBAMENTO_COL]}\nObra: {row_series[db.OBRA_COL]}"
+
+def gerar_png_qr(qr_data, box_size=10, border=4):
+    qr = qrcode.QRCode(box_size=box_size, border=border)
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    img_qr = qr.make_image(fill_color="black", back_color="white")
+    output = io.BytesIO()
+    img_qr.save(output, format="PNG")
+    return output.getvalue()
+
+# A chave é o próprio conteúdo (payload e tamanho): se id, nome, tombamento ou
+# obra mudarem, a chave muda e a imagem antiga simplesmente sai por LRU.
+def png_qr_em_cache(qr_data, box_size=10, border=4):
+    chave = ("png", qr_data, box_size, border)
+    png = _cache_qr().get(chave)
+    metricas.contar_cache("cache.qr", png is not None)
+    if png is None:
+        png = gerar_png_qr(qr_data, box_size, border)
+        _cache_qr().put(chave, png)
+    return png
+
+CAMPOS_FICHA_QR = [
+    db.ID_COL, db.NOME_COL, db.TOMBAMENTO_COL, db.OBRA_COL,
+    db.RESPONSAVEL_COL, db.STATUS_COL, db.ESPEC_COL, db.OBS_COL
+]
+
+# A ficha também mostra responsável, status e textos, então esses campos entram na chave do PDF
 def gerar_ficha_qr_code(row_series):
+    chave = ("ficha",) + tuple(str(row_series.get(c, "")) for c in CAMPOS_FICHA_QR)
+    pdf_bytes = _cache_qr().get(chave)
+    metricas.contar_cache("cache.ficha_qr", pdf_bytes is not None)
+    if pdf_bytes is None:
+        pdf_bytes = _gerar_ficha_qr_code(row_series)
+        if pdf_bytes:
+            _cache_qr().put(chave, pdf_bytes)
+    return pdf_bytes
+
+@metricas.medido("utils.gerar_ficha_qr_code")
+def _gerar_ficha_qr_code(row_series):
     try:
         pdf = FPDF(orientation='P', unit='mm', format='A4')
         pdf.add_page()
@@ -55,15 +275,7 @@ def gerar_ficha_qr_code(row_series):
         pdf.set_font('Helvetica', 'B', 16)
         pdf.text(10, 14, "Ficha de Identificação de Ativo - LAVIE")
         
-        qr_data = f"ID: {row_series[db.ID_COL]}\nItem: {row_series[db.NOME_COL]}\nTombamento: {row_series[db.TOMBAMENTO_COL]}\nObra: {row_series[db.OBRA_COL]}"
-        qr = qrcode.QRCode(box_size=10, border=4)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        img_qr = qr.make_image(fill_color="black", back_color="white")
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_file:
-            img_qr.save(tmp_file.name)
-            qr_path = tmp_file.name
+        qr_png = png_qr_em_cache(payload_qr(row_series))
 
         pdf.set_text_color(0, 0, 0)
         pdf.set_y(30)
@@ -79,75 +291,305 @@ def gerar_ficha_qr_code(row_series):
         pdf.set_font('Helvetica', 'B', 10)
         pdf.cell(0, 8, "Especificações / Obs:", ln=True)
         pdf.set_font('Helvetica', '', 10)
-        pdf.multi_cell(110, 6, f"{str(row_series[db.ESPEC_COL])}\n{str(row_series[db.OBS_COL])}")
-        pdf.image(qr_path, x=130, y=30, w=60)
+        pdf.multi_cell(110, 6, f"{str(row_series.get(db.ESPEC_COL, ''))}\n{str(row_series.get(db.OBS_COL, ''))}")
+        pdf.image(io.BytesIO(qr_png), x=130, y=30, w=60)
         return bytes(pdf.output())
     except Exception as e:
         st.error(f"Erro ao gerar Ficha QR: {e}")
         return None
 
-def gerar_excel(df, sheet_name="Relatorio"):
+AMOSTRA_LARGURA_EXCEL = 1000
+LINHAS_POR_BLOCO_EXCEL = 5000
+
+# Largura pela maior célula de uma amostra (cabeçalho incluído), sem converter a coluna inteira
+def _larguras_excel(df):
+    amostra = df.head(AMOSTRA_LARGURA_EXCEL)
+    larguras = []
+    for col in df.columns:
+        maior = amostra[col].astype(str).str.len().max() if not amostra.empty else 0
+        larguras.append(min(max(maior, len(str(col))) + 2, 50))
+    return larguras
+
+# Valores que o xlsxwriter aceita: datas sem fuso, NaN/NaT como célula vazia
+def _valores_excel(bloco):
+    bloco = bloco.copy()
+    for col in bloco.columns:
+        serie = bloco[col]
+        if isinstance(serie.dtype, pd.DatetimeTZDtype):
+            serie = serie.dt.tz_localize(None)
+        bloco[col] = serie.astype(object).where(serie.notna(), None)
+    return bloco.itertuples(index=False, name=None)
+
+# Planilha com uma aba por DataFrame ({nome_aba: df}), escrita linha a linha em
+# modo constant_memory do xlsxwriter (só a linha corrente fica em memória).
+@metricas.medido("utils.gerar_workbook")
+def gerar_workbook(abas):
     output = io.BytesIO()
     try:
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name=sheet_name)
-            worksheet = writer.sheets[sheet_name]
-            for i, col in enumerate(df.columns):
-                max_len = max(df[col].astype(str).map(len).max() if not df[col].empty else 0, len(str(col))) + 2
-                worksheet.set_column(i, i, min(max_len, 50)) 
+        import xlsxwriter
     except ModuleNotFoundError:
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name=sheet_name)
+            for sheet_name, df in abas.items():
+                df.to_excel(writer, index=False, sheet_name=sheet_name)
+        return output.getvalue()
+
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'default_date_format': 'dd/mm/yyyy hh:mm'})
+    negrito = workbook.add_format({'bold': True})
+    for sheet_name, df in abas.items():
+        worksheet = workbook.add_worksheet(sheet_name[:31])
+        for i, largura in enumerate(_larguras_excel(df)):
+            worksheet.set_column(i, i, largura)
+        worksheet.write_row(0, 0, [str(c) for c in df.columns], negrito)
+        linha = 1
+        for inicio in range(0, df.shape[0], LINHAS_POR_BLOCO_EXCEL):
+            for valores in _valores_excel(df.iloc[inicio:inicio + LINHAS_POR_BLOCO_EXCEL]):
+                worksheet.write_row(linha, 0, valores)
+                linha += 1
+    workbook.close()
     return output.getvalue()
 
-def gerar_pdf(df, tipo="patrimonio", obra_nome="Geral"):
-    try:
-        pdf = FPDF(orientation='L', unit='mm', format='A4')
-        pdf.add_page()
-        try: pdf.image("Lavie.png", x=10, y=5, w=35)
-        except: pass 
-        pdf.set_y(15)
-        pdf.set_font('Arial', 'B', 14)
-        titulo = f'Relatório de {tipo.title()} - {obra_nome}'
-        pdf.cell(0, 10, clean_text(titulo), 0, 1, 'C')
-        pdf.ln(5)
+def gerar_excel(df, sheet_name="Relatorio"):
+    return gerar_workbook({sheet_name: df})
 
-        if tipo == "patrimonio":
-            col_map = [
-                (db.TOMBAMENTO_COL, 25, "Tomb."),
-                (db.NOME_COL, 80, "Item / Descrição"),
-                (db.STATUS_COL, 25, "Status"),
-                (db.LOCAL_COL, 40, "Local"),
-                (db.RESPONSAVEL_COL, 40, "Responsável"),
-                (db.VALOR_COL, 30, "Valor (R$)")
-            ]
+@st.cache_resource
+def _executor_exportacoes():
+    return ThreadPoolExecutor(max_workers=2)
+
+# Gera a planilha numa thread de fundo; a tela guarda o Future e consulta depois
+def iniciar_workbook(abas):
+    return _executor_exportacoes().submit(gerar_workbook, abas)
+
+COLUNAS_PDF = {
+    "patrimonio": [
+        (db.TOMBAMENTO_COL, 25, "Tomb."),
+        (db.NOME_COL, 80, "Item / Descrição"),
+        (db.STATUS_COL, 25, "Status"),
+        (db.LOCAL_COL, 40, "Local"),
+        (db.RESPONSAVEL_COL, 40, "Responsável"),
+        (db.VALOR_COL, 30, "Valor (R$)")
+    ],
+    "locacoes": [
+        ('equipamento', 70, "Equipamento"),
+        ('obra_destino', 50, "Obra"),
+        ('data_inicio', 30, "Início"),
+        ('data_previsao_fim', 30, "Fim"),
+        ('valor_mensal', 30, "Valor"),
+        ('status', 30, "Status")
+    ],
+}
+COLUNAS_MOEDA_PDF = {db.VALOR_COL, 'valor_mensal'}
+COLUNAS_DATA_PDF = {'data_inicio', 'data_previsao_fim'}
+LINHAS_POR_BLOCO_PDF = 5000
+MAX_PROCESSOS_PDF = 4
+
+# Formata cada coluna do relatório de uma vez (moeda, datas, latin-1 e corte
+# pela largura da célula) e devolve as linhas já como tuplas de texto.
+def _formatar_linhas_pdf(df, colunas):
+    formatadas = {}
+    for col_key, width, _ in colunas:
+        serie = df[col_key]
+        if col_key in COLUNAS_MOEDA_PDF:
+            texto = pd.to_numeric(serie, errors='coerce').fillna(0).map("{:,.2f}".format)
+        elif col_key in COLUNAS_DATA_PDF:
+            texto = pd.to_datetime(serie, errors='coerce').dt.strftime('%d/%m/%Y').fillna("")
         else:
-            col_map = [
-                ('equipamento', 70, "Equipamento"),
-                ('obra_destino', 50, "Obra"),
-                ('data_inicio', 30, "Início"),
-                ('data_fim', 30, "Fim"),
-                ('valor_mensal', 30, "Valor"),
-                ('status', 30, "Status")
-            ]
+            texto = serie.astype(object).where(serie.notna(), "").astype(str)
+        texto = texto.str.encode('latin-1', 'replace').str.decode('latin-1')
+        limit = int(width / 1.8)
+        formatadas[col_key] = texto.where(texto.str.len() <= limit, texto.str[:limit] + "...")
+    return list(pd.DataFrame(formatadas, index=df.index).itertuples(index=False, name=None))
+
+# Blocos de LINHAS_POR_BLOCO_PDF linhas formatados sob demanda: só o bloco em
+# uso (e os que estão no pool) fica em memória como texto
+def _blocos_formatados(df, colunas):
+    for inicio in range(0, len(df), LINHAS_POR_BLOCO_PDF):
+        yield _formatar_linhas_pdf(df.iloc[inicio:inicio + LINHAS_POR_BLOCO_PDF], colunas)
+
+# Processos iniciados com "spawn": um fork do servidor do Streamlit, que tem
+# várias threads, pode herdar locks presos e travar o processo filho
+@st.cache_resource
+def _pool_pdf():
+    return ProcessPoolExecutor(max_workers=MAX_PROCESSOS_PDF, mp_context=multiprocessing.get_context("spawn"))
 
+# No máximo `processos` blocos em andamento; cada parte pronta entra no
+# PdfWriter, na ordem, e os bytes dela são descartados
+def _renderizar_em_paralelo(blocos, larguras, cabecalhos, titulo, processos):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    pool = _pool_pdf()
+    em_andamento = deque()
+    for i, linhas in enumerate(blocos):
+        em_andamento.append(pool.submit(blocos_pdf.renderizar_bloco, linhas, larguras, cabecalhos, titulo if i == 0 else None))
+        if len(em_andamento) >= processos:
+            writer.append(io.BytesIO(em_andamento.popleft().result()))
+    while em_andamento:
+        writer.append(io.BytesIO(em_andamento.popleft().result()))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+# Relatórios grandes são renderizados em blocos de LINHAS_POR_BLOCO_PDF linhas
+# num pool de processos (um por núcleo, até MAX_PROCESSOS_PDF) e juntados com
+# pypdf. Com um núcleo só, poucas linhas ou sem pypdf, gera um único documento,
+# alimentado bloco a bloco.
+@metricas.medido("utils.gerar_pdf")
+def gerar_pdf(df, tipo="patrimonio", obra_nome="Geral", processos=None):
+    try:
+        titulo = clean_text(f'Relatório de {tipo.title()} - {obra_nome}')
+        col_map = COLUNAS_PDF["patrimonio" if tipo == "patrimonio" else "locacoes"]
         valid_cols = [c for c in col_map if c[0] in df.columns]
-        pdf.set_font('Arial', 'B', 9)
-        pdf.set_fill_color(220, 220, 220) 
-        
-        for _, width, header in valid_cols:
-            pdf.cell(width, 8, clean_text(header), 1, 0, 'C', fill=True)
-        pdf.ln()
-        pdf.set_font('Arial', '', 8)
-        
-        for _, row in df.iterrows():
-            for col_key, width, _ in valid_cols:
-                texto = clean_text(row[col_key])
-                limit = int(width / 1.8)
-                if len(texto) > limit: texto = texto[:limit] + "..."
-                pdf.cell(width, 7, texto, 1, 0, 'C')
-            pdf.ln()
-        return bytes(pdf.output()) 
+        larguras = [width for _, width, _ in valid_cols]
+        cabecalhos = [clean_text(header) for _, _, header in valid_cols]
+        if processos is None:
+            processos = min(MAX_PROCESSOS_PDF, os.cpu_count() or 1)
+
+        blocos = _blocos_formatados(df, valid_cols)
+        if len(df) <= LINHAS_POR_BLOCO_PDF or processos <= 1 or find_spec("pypdf") is None:
+            return blocos_pdf.renderizar_bloco(itertools.chain.from_iterable(blocos), larguras, cabecalhos, titulo)
+        return _renderizar_em_paralelo(blocos, larguras, cabecalhos, titulo, processos)
     except Exception as e:
         st.error(f"Erro ao gerar PDF: {e}")
         return None
+
+# Modelos de folha de etiquetas adesivas A4: colunas x linhas e tamanho da etiqueta (mm)
+MODELOS_ETIQUETA = {
+    "A4 3 x 8 (70 x 37 mm)": dict(colunas=3, linhas=8, largura=70, altura=37),
+    "A4 3 x 7 (63,5 x 38,1 mm)": dict(colunas=3, linhas=7, largura=63.5, altura=38.1),
+    "A4 2 x 7 (99,1 x 38,1 mm)": dict(colunas=2, linhas=7, largura=99.1, altura=38.1),
+    "A4 2 x 5 (99 x 57 mm)": dict(colunas=2, linhas=5, largura=99, altura=57),
+}
+# Reaproveita os QR já em cache e só gera os que faltam. A geração fica na
+# thread da sessão: o qrcode é Python puro (não solta o GIL), então threads não
+# aceleram, e um pool de processos não compensou no benchmark (bench_relatorios.py).
+def _pngs_qr(payloads):
+    cache = _cache_qr()
+    pngs = [cache.get(("png", p, 6, 2)) for p in payloads]
+    gerados = {}
+    for payload, png in zip(payloads, pngs):
+        if png is None and payload not in gerados:
+            gerados[payload] = gerar_png_qr(payload, box_size=6, border=2)
+            cache.put(("png", payload, 6, 2), gerados[payload])
+    return [png if png is not None else gerados[p] for p, png in zip(payloads, pngs)]
+
+# Folha de etiquetas (QR + nome, tombamento e obra) para todos os itens do
+# DataFrame, distribuídas na grade do modelo e centralizadas na página. Os QR
+# são gerados em memória, sem arquivos temporários.
+@metricas.medido("utils.gerar_etiquetas_qr")
+def gerar_etiquetas_qr(df, modelo="A4 3 x 8 (70 x 37 mm)"):
+    try:
+        grade = MODELOS_ETIQUETA[modelo]
+        largura, altura = grade["largura"], grade["altura"]
+        margem_x = (210 - grade["colunas"] * largura) / 2
+        margem_y = (297 - grade["linhas"] * altura) / 2
+        por_pagina = grade["colunas"] * grade["linhas"]
+        lado_qr = altura - 4
+
+        registros = df[[db.ID_COL, db.NOME_COL, db.TOMBAMENTO_COL, db.OBRA_COL]].to_dict("records")
+        pngs = _pngs_qr([payload_qr(r) for r in registros])
+
+        pdf = FPDF(orientation='P', unit='mm', format='A4')
+        pdf.set_auto_page_break(False)
+        largura_texto = largura - lado_qr - 4
+        for i, (registro, png) in enumerate(zip(registros, pngs)):
+            posicao = i % por_pagina
+            if posicao == 0:
+                pdf.add_page()
+            x = margem_x + (posicao % grade["colunas"]) * largura
+            y = margem_y + (posicao // grade["colunas"]) * altura
+            pdf.image(io.BytesIO(png), x=x + 2, y=y + 2, w=lado_qr, h=lado_qr)
+
+            pdf.set_xy(x + lado_qr + 3, y + 3)
+            pdf.set_font('Helvetica', 'B', 8)
+            pdf.multi_cell(largura_texto, 3.5, clean_text(str(registro[db.NOME_COL]).upper())[:60])
+            pdf.set_x(x + lado_qr + 3)
+            pdf.set_font('Helvetica', '', 7)
+            pdf.cell(largura_texto, 4, clean_text(f"Tomb.: {registro[db.TOMBAMENTO_COL]}"), ln=True)
+            pdf.set_x(x + lado_qr + 3)
+            pdf.cell(largura_texto, 4, clean_text(f"Obra: {registro[db.OBRA_COL]}")[:40], ln=True)
+        return bytes(pdf.output())
+    except Exception as e:
+        st.error(f"Erro ao gerar etiquetas: {e}")
+        return None
+
+@st.cache_data(max_entries=16, show_spinner="Gerando etiquetas...")
+def gerar_etiquetas_em_cache(chave, modelo, _df):
+    return gerar_etiquetas_qr(_df, modelo)
+
+# Chave de uma exportação: versão dos dados + colunas + ids das linhas filtradas (na ordem)
+def chave_exportacao(df, versao_dados):
+    h = hashlib.sha256(repr((versao_dados, tuple(df.columns))).encode())
+    if not df.empty:
+        h.update(pd.util.hash_pandas_object(df[db.ID_COL], index=False).values.tobytes())
+    return h.hexdigest()
+
+# Só roda quando o usuário pede o arquivo; a mesma chave devolve o arquivo já gerado
+@st.cache_data(max_entries=32, show_spinner="Gerando arquivo...")
+def gerar_exportacao(chave, formato, _df, tipo="patrimonio", obra_nome="Geral", sheet_name="Relatorio"):
+    if formato == "excel":
+        arquivo = gerar_excel(_df, sheet_name=sheet_name)
+    else:
+        arquivo = gerar_pdf(_df, tipo=tipo, obra_nome=obra_nome)
+    metricas.contar(f"exportacao.{formato}.bytes", len(arquivo or b""))
+    return arquivo
+
+CLASSES_ABC = ['A (Crítico - 80%)', 'B (Médio - 15%)', 'C (Baixo - 5%)']
+
+def _chave_dados(df):
+    versao = df.attrs.get("versao_dados")
+    if versao is not None:
+        return versao
+    return busca.chave_conteudo(df)
+
+# Todas as séries do dashboard de uma vez, recalculadas só quando a versão dos
+# dados (que já identifica a obra em visão) muda ou quando vira o dia (a idade
+# dos itens é contada até hoje)
+def agregados_dashboard(df_patr, df_mov):
+    hoje = pd.Timestamp.now(tz="UTC").normalize()
+    return _calcular_agregados_dashboard(_chave_dados(df_patr), _chave_dados(df_mov), hoje, df_patr, df_mov)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+@metricas.medido("utils.agregados_dashboard")
+def _calcular_agregados_dashboard(chave_patr, chave_mov, hoje, _df_patr, _df_mov):
+    df_patr, df_mov = _df_patr, _df_mov
+    dados_com_idade = df_patr[[db.TOMBAMENTO_COL, db.VALOR_COL]]
+    idade_media_dias = None
+    mov_no_tempo = None
+
+    if not df_mov.empty:
+        df_mov = df_mov.assign(data_hora=pd.to_datetime(df_mov['data_hora'], utc=True))
+        entradas = df_mov[df_mov['tipo_movimentacao'] == 'Entrada']
+        if not entradas.empty:
+            aquisicoes = entradas.groupby(db.TOMBAMENTO_COL)['data_hora'].min().rename('data_aquisicao').reset_index()
+            dados_com_idade = dados_com_idade.merge(aquisicoes, on=db.TOMBAMENTO_COL, how='left')
+            idade_media_dias = (hoje - dados_com_idade['data_aquisicao']).dt.days.mean()
+        mov_no_tempo = df_mov.set_index('data_hora').groupby('tipo_movimentacao', observed=True).resample('ME').size().reset_index(name='contagem')
+
+    aquisicoes_no_tempo = None
+    if 'data_aquisicao' in dados_com_idade.columns and not dados_com_idade['data_aquisicao'].isnull().all():
+        aquisicoes_no_tempo = dados_com_idade.set_index('data_aquisicao').resample('ME')[db.VALOR_COL].sum().reset_index()
+        aquisicoes_no_tempo = aquisicoes_no_tempo[aquisicoes_no_tempo[db.VALOR_COL] > 0]
+
+    valor_total = df_patr[db.VALOR_COL].sum()
+    valor_manut = df_patr.loc[df_patr[db.STATUS_COL] == 'MANUTENÇÃO', db.VALOR_COL].sum()
+
+    df_abc = df_patr[[db.NOME_COL, db.RESPONSAVEL_COL, db.VALOR_COL]].sort_values(by=db.VALOR_COL, ascending=False)
+    perc_acumulado = df_abc[db.VALOR_COL].cumsum() / df_abc[db.VALOR_COL].sum()
+    df_abc['Classe ABC'] = pd.cut(perc_acumulado, bins=[-float("inf"), 0.8, 0.95, float("inf")], labels=CLASSES_ABC).astype(object).fillna(CLASSES_ABC[2])
+
+    treemap = df_patr.groupby([db.STATUS_COL, db.NOME_COL], observed=True)[db.VALOR_COL].sum().reset_index()
+    treemap[db.STATUS_COL] = treemap[db.STATUS_COL].astype(object)
+    valor_por_resp = df_patr.groupby(db.RESPONSAVEL_COL, observed=True)[db.VALOR_COL].sum().sort_values(ascending=False).head(10).reset_index()
+    valor_por_resp[db.RESPONSAVEL_COL] = valor_por_resp[db.RESPONSAVEL_COL].astype(object)
+
+    return {
+        "total_itens": df_patr.shape[0],
+        "valor_total": valor_total,
+        "idade_media_dias": idade_media_dias,
+        "valor_manut": valor_manut,
+        "perc_manut": (valor_manut / valor_total) * 100 if valor_total > 0 else 0,
+        "abc": df_abc,
+        "treemap": treemap,
+        "aquisicoes_no_tempo": aquisicoes_no_tempo,
+        "mov_no_tempo": mov_no_tempo,
+        "valor_por_resp": valor_por_resp,
+    }
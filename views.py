@@ -1,16 +1,73 @@
 import streamlit as st
 import pandas as pd
 import time
+import math
 import base64
 import textwrap
 import plotly.express as px
-from datetime import datetime
 from streamlit_option_menu import option_menu
 import database as db
 import utils
+import busca
+import importacao
+import metricas
+
+TAMANHOS_PAGINA_CARDS = [10, 25, 50, 100]
+
+def _mudar_pagina(chave_pagina, passo):
+    st.session_state[chave_pagina] += passo
+
+# Mostra os controles de paginação e devolve só as linhas da página atual.
+# Os filtros ficam nos próprios widgets, então trocar de página não os perde.
+def _paginar(df, chave):
+    chave_pagina, chave_tamanho = f"{chave}_pagina", f"{chave}_tamanho"
+    tamanho = st.session_state.get(chave_tamanho, TAMANHOS_PAGINA_CARDS[1])
+    total = df.shape[0]
+    total_paginas = max(1, math.ceil(total / tamanho))
+    if chave_pagina not in st.session_state:
+        st.session_state[chave_pagina] = 1
+    st.session_state[chave_pagina] = min(max(st.session_state[chave_pagina], 1), total_paginas)
+    pagina = st.session_state[chave_pagina]
+
+    c_tam, c_ant, c_pag, c_prox = st.columns([1.5, 1, 1, 1], vertical_alignment="bottom")
+    with c_tam:
+        st.selectbox("Itens por página", TAMANHOS_PAGINA_CARDS, index=1, key=chave_tamanho)
+    with c_ant:
+        st.button("Anterior", key=f"{chave}_ant", disabled=pagina <= 1, on_click=_mudar_pagina, args=(chave_pagina, -1), use_container_width=True)
+    with c_pag:
+        st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, step=1, key=chave_pagina)
+    with c_prox:
+        st.button("Próxima", key=f"{chave}_prox", disabled=pagina >= total_paginas, on_click=_mudar_pagina, args=(chave_pagina, 1), use_container_width=True)
+
+    inicio = (pagina - 1) * tamanho
+    fim = min(inicio + tamanho, total)
+    st.caption(f"Mostrando {inicio + 1 if total else 0}–{fim} de {total}")
+    return df.iloc[inicio:fim]
+
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Botões "Gerar" que só montam o arquivo quando clicados; depois disso o download
+# fica disponível enquanto os dados filtrados (chave) não mudarem.
+def _botoes_exportacao(df, versao_dados, chave, tipo, sheet_name, nome_arquivo):
+    chave_dados = utils.chave_exportacao(df, versao_dados)
+    obra_nome = st.session_state.get("selected_obra", "Geral")
+    formatos = [("excel", "Excel", f"{nome_arquivo}.xlsx", MIME_EXCEL), ("pdf", "PDF", f"{nome_arquivo}.pdf", "application/pdf")]
+    for coluna, (formato, rotulo, arquivo, mime) in zip(st.columns([1, 1]), formatos):
+        with coluna:
+            chave_estado = f"{chave}_{formato}_pronto"
+            pronto = st.session_state.get(chave_estado) == chave_dados
+            if not pronto and st.button(f"Gerar {rotulo}", key=f"{chave}_{formato}_gerar", use_container_width=True, type="primary"):
+                st.session_state[chave_estado] = chave_dados
+                pronto = True
+            if pronto:
+                dados = utils.gerar_exportacao(chave_dados, formato, df, tipo=tipo, obra_nome=obra_nome, sheet_name=sheet_name)
+                if dados: st.download_button(f"Baixar {rotulo}", dados, arquivo, mime, key=f"{chave}_{formato}_baixar", use_container_width=True, type="primary")
 
 @st.dialog("Editar Patrimônio")
 def modal_editar_patrimonio(item_series, lista_status):
+    item_completo = db.carregar_item("patrimonio", item_series[db.ID_COL])
+    if item_completo is not None:
+        item_series = item_completo
     st.write(f"Editando: **{item_series[db.NOME_COL]}**")
     with st.form("form_edit_patr_modal"):
         if item_series.get(db.FOTO_COL):
@@ -37,7 +94,6 @@ def modal_editar_patrimonio(item_series, lista_status):
         
         if st.form_submit_button("Salvar"):
             try:
-                conn = db.get_db_connection()
                 update_dict = {
                     db.NOME_COL: novo_nome,
                     db.TOMBAMENTO_COL: novo_tombamento,
@@ -50,20 +106,15 @@ def modal_editar_patrimonio(item_series, lista_status):
                     db.OBS_COL: novas_obs
                 }
                 if nova_foto_file:
-                    img_name = f"EDIT_{int(item_series[db.ID_COL])}_{datetime.now().strftime('%H%M%S')}.jpg"
-                    
-                    url_foto = db.upload_foto_patrimonio(
-                        nova_foto_file.getvalue(), 
-                        img_name, 
-                        nova_foto_file.type
-                    )
+                    url_foto, url_miniatura = db.upload_foto_patrimonio(nova_foto_file.getvalue(), nova_foto_file.type)
                     
                     if url_foto:
                         update_dict[db.FOTO_COL] = url_foto
-                conn.table("patrimonio").update(update_dict).eq(db.ID_COL, int(item_series[db.ID_COL])).execute()
+                        update_dict[db.FOTO_MINIATURA_COL] = url_miniatura
+                db.get_repositorio().atualizar("patrimonio", update_dict, [("eq", db.ID_COL, int(item_series[db.ID_COL]))])
                 st.success("Patrimônio atualizado!")
                 time.sleep(1)
-                st.cache_data.clear()
+                db.marcar_alteracao("patrimonio", [item_series[db.ID_COL]])
                 st.rerun()
             except Exception as e:
                 st.error(f"Erro ao atualizar: {e}")
@@ -99,37 +150,78 @@ def modal_editar_locacao(row, lista_obras):
         
         st.write("---")
         if st.form_submit_button("Salvar Edição", type="primary", use_container_width=True):
-            conn = db.get_db_connection()
-            conn.table("locacoes").update({
+            db.get_repositorio().atualizar("locacoes", {
                 "equipamento": n_equip, "contrato_sienge": n_contrato,
                 "valor_mensal": n_valor, "responsavel": n_resp, "status": n_status,
                 "obra_destino": n_obra, "data_inicio": n_inicio.isoformat() if n_inicio else None,
                 "data_previsao_fim": n_fim.isoformat() if n_fim else None
-            }).eq("id", int(row['id'])).execute()
+            }, [("eq", "id", int(row['id']))])
             st.success("Locação salva!")
             time.sleep(1)
-            st.cache_data.clear()
+            db.marcar_alteracao("locacoes", [row['id']])
             st.rerun()
 
 @st.dialog("Registrar Nova Movimentação")
-def form_movimentacoes():
+def form_movimentacoes(row_sel):
     with st.form("form_movimentacao"):
-        tipo = st.radio("Tipo", ["Entrada", "Saída"], horizontal=True)
+        tipo = st.radio("Tipo", list(db.STATUS_MOVIMENTACAO), horizontal=True)
         resp = st.text_input("Responsável pela Movimentação")
         obs = st.text_area("Observações")
         if st.form_submit_button("Salvar Movimentação", type="primary"):
-            conn = db.get_db_connection()
-            conn.table("movimentacoes").insert({
-                db.OBRA_COL: row_sel[db.OBRA_COL], db.TOMBAMENTO_COL: row_sel[db.TOMBAMENTO_COL],
-                "tipo_movimentacao": tipo, "data_hora": datetime.now().isoformat(),
-                "responsavel_movimentacao": resp, db.OBS_COL: obs
-            }).execute()
-            novo_st = "ATIVO" if tipo == "Entrada" else "EMPRÉSTIMO"
-            conn.table("patrimonio").update({db.STATUS_COL: novo_st}).eq(db.ID_COL, int(row_sel[db.ID_COL])).execute()
+            db.registrar_movimentacoes([row_sel[db.ID_COL]], tipo, resp, obs)
             st.success("Movimentação registrada com sucesso!")
             time.sleep(1.5)
             st.rerun()
 
+# Mesma movimentação para vários itens: seleção na lista (por id) ou tombamentos
+# colados/lidos pelo leitor (um por linha, ou separados por vírgula/espaço). Os
+# tombamentos são procurados só na obra em visão; um tombamento que aparece em
+# mais de um item (ex.: visão "Todas") não é movimentado.
+def _secao_movimentacao_lote(dados_filt, dados_patrimonio, lista_obras, is_admin, obra_visao=None):
+    with st.expander("Movimentação em lote"):
+        rotulos = dict(zip(
+            dados_filt[db.ID_COL].tolist(),
+            (dados_filt[db.TOMBAMENTO_COL].astype(object).fillna("S/ tombamento").map(str) + " - " + dados_filt[db.NOME_COL].astype(object).fillna("").map(str)).tolist()
+        ))
+        selecionados = st.multiselect("Itens", options=list(rotulos), format_func=rotulos.get, key="lote_mov_itens", placeholder="Selecione os itens...")
+        lidos = st.text_area("Ou cole/escaneie os tombamentos", key="lote_mov_tombamentos", height=100)
+
+        ids = set(selecionados)
+        tombamentos = {t.upper() for t in lidos.replace(",", " ").split()}
+        if tombamentos:
+            escopo = dados_patrimonio if obra_visao is None else dados_patrimonio[dados_patrimonio[db.OBRA_COL] == obra_visao]
+            escopo = escopo[escopo[db.TOMBAMENTO_COL].notna()]
+            chave_tomb = escopo[db.TOMBAMENTO_COL].astype(str).str.strip().str.upper()
+            encontrados = escopo[chave_tomb.isin(tombamentos)]
+            chave_encontrados = chave_tomb[chave_tomb.isin(tombamentos)]
+            repetidos = set(chave_encontrados[chave_encontrados.duplicated(keep=False)])
+            ids.update(encontrados.loc[~chave_encontrados.isin(repetidos), db.ID_COL].tolist())
+            nao_encontrados = sorted(tombamentos - set(chave_encontrados))
+            if nao_encontrados:
+                st.warning(f"Tombamento(s) não encontrado(s): {', '.join(nao_encontrados)}")
+            if repetidos:
+                st.warning(f"Tombamento(s) em mais de um item, selecione na lista: {', '.join(sorted(repetidos))}")
+        ids = sorted(int(i) for i in ids)
+
+        m1, m2, m3 = st.columns(3)
+        with m1:
+            tipo = st.radio("Tipo", list(db.STATUS_MOVIMENTACAO), horizontal=True, key="lote_mov_tipo")
+        with m2:
+            responsavel = st.text_input("Responsável pela Movimentação", key="lote_mov_resp")
+        with m3:
+            obra_destino = st.selectbox("Obra de destino", ["(manter)"] + sorted(lista_obras), key="lote_mov_obra") if is_admin else "(manter)"
+        obs = st.text_area("Observações", key="lote_mov_obs")
+
+        if st.button(f"Registrar movimentação de {len(ids)} item(ns)", type="primary", use_container_width=True, disabled=not ids, key="btn_lote_mov"):
+            try:
+                db.registrar_movimentacoes(ids, tipo, responsavel, obs, None if obra_destino == "(manter)" else obra_destino)
+                st.success(f"{len(ids)} movimentação(ões) registrada(s)!")
+                time.sleep(1)
+                st.rerun()
+            except Exception as e:
+                st.error(f"Erro ao registrar movimentações: {e}")
+
+@metricas.medido("views.dashboard")
 def pagina_dashboard(df_patr, df_mov):
     st.header("Dashboard de Inteligência de Ativos", divider='orange')
     
@@ -145,91 +237,69 @@ def pagina_dashboard(df_patr, df_mov):
         margin=dict(t=30, l=10, r=10, b=10)
     )
     
-    dados_com_idade = df_patr.copy()
-    idade_media_dias = None
-
-    if not df_mov.empty:
-        df_mov['data_hora'] = pd.to_datetime(df_mov['data_hora'])
-        entradas = df_mov[df_mov['tipo_movimentacao'] == 'Entrada']
-        if not entradas.empty:
-            aquisicoes = entradas.groupby(db.TOMBAMENTO_COL)['data_hora'].min().reset_index()
-            aquisicoes.rename(columns={'data_hora': 'data_aquisicao'}, inplace=True)
-            dados_com_idade = pd.merge(dados_com_idade, aquisicoes, on=db.TOMBAMENTO_COL, how='left')
-            if 'data_aquisicao' in dados_com_idade.columns:
-                agora_utc = datetime.now(datetime.timezone.utc)
-                dados_com_idade['data_aquisicao'] = pd.to_datetime(dados_com_idade['data_aquisicao'], utc=True)
-                dados_com_idade['idade_dias'] = (agora_utc - dados_com_idade['data_aquisicao']).dt.days
-                idade_media_dias = dados_com_idade['idade_dias'].mean()
+    agregados = utils.agregados_dashboard(df_patr, df_mov)
+    idade_media_dias = agregados["idade_media_dias"]
 
     st.subheader("Visão Geral Executiva")
-    total_itens = df_patr.shape[0]
-    valor_total = df_patr[db.VALOR_COL].sum()
+    total_itens = agregados["total_itens"]
+    valor_total = agregados["valor_total"]
     
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
     with kpi1: st.metric("Total de Itens", f"{total_itens} un.")
     with kpi2: st.metric("Valor Patrimonial", f"R$ {valor_total:,.2f}")
     with kpi3: st.metric("Idade Média", f"{idade_media_dias:,.0f} dias" if idade_media_dias else "N/A")
     with kpi4:
-        df_manut = df_patr[df_patr[db.STATUS_COL] == 'MANUTENÇÃO']
-        valor_manut = df_manut[db.VALOR_COL].sum()
-        perc_manut = (valor_manut / valor_total) * 100 if valor_total > 0 else 0
+        valor_manut = agregados["valor_manut"]
+        perc_manut = agregados["perc_manut"]
         st.metric("Em Manutenção", f"R$ {valor_manut:,.2f}", f"{perc_manut:.1f}%", delta_color="inverse")
             
     st.write("---")
 
     st.subheader("Estratégia e Priorização")
     
-    df_abc = df_patr.copy()
-    df_abc = df_abc.sort_values(by=db.VALOR_COL, ascending=False)
-    df_abc['valor_acumulado'] = df_abc[db.VALOR_COL].cumsum()
-    df_abc['perc_acumulado'] = df_abc['valor_acumulado'] / df_abc[db.VALOR_COL].sum()
-    
-    def classificar_abc(perc):
-        if perc <= 0.8: return 'A (Crítico - 80%)'
-        elif perc <= 0.95: return 'B (Médio - 15%)'
-        else: return 'C (Baixo - 5%)'
-    
-    df_abc['Classe ABC'] = df_abc['perc_acumulado'].apply(classificar_abc)
+    df_abc = agregados["abc"]
 
     col_intel1, col_intel2 = st.columns([1.5, 1])
 
     with col_intel1:
         st.markdown("**Curva ABC (Dispersão de Valor)**")
-        fig_abc = px.strip(
-            df_abc, 
-            x=db.VALOR_COL, 
-            y='Classe ABC', 
-            color='Classe ABC',
-            custom_data=[db.NOME_COL, db.RESPONSAVEL_COL],
-            stripmode='overlay',
-            color_discrete_map={
-                'A (Crítico - 80%)': '#FF8C00', 
-                'B (Médio - 15%)': '#FFD700',  
-                'C (Baixo - 5%)': '#A9A9A9'    
-            }
-        )
-        fig_abc.update_traces(hovertemplate='<b>%{customdata[0]}</b><br>Valor: R$ %{x:,.2f}')
-        fig_abc.update_layout(**LAYOUT_CLEAN) 
-        fig_abc.update_layout(xaxis_title="Valor (R$)", showlegend=False, xaxis=dict(showgrid=True, gridcolor='#333'))
+        with metricas.medir("views.dashboard.figura_abc"):
+            fig_abc = px.strip(
+                df_abc, 
+                x=db.VALOR_COL, 
+                y='Classe ABC', 
+                color='Classe ABC',
+                custom_data=[db.NOME_COL, db.RESPONSAVEL_COL],
+                stripmode='overlay',
+                color_discrete_map={
+                    'A (Crítico - 80%)': '#FF8C00', 
+                    'B (Médio - 15%)': '#FFD700',  
+                    'C (Baixo - 5%)': '#A9A9A9'    
+                }
+            )
+            fig_abc.update_traces(hovertemplate='<b>%{customdata[0]}</b><br>Valor: R$ %{x:,.2f}')
+            fig_abc.update_layout(**LAYOUT_CLEAN) 
+            fig_abc.update_layout(xaxis_title="Valor (R$)", showlegend=False, xaxis=dict(showgrid=True, gridcolor='#333'))
         st.plotly_chart(fig_abc, use_container_width=True)
 
     with col_intel2:
         st.markdown("**Mapa Financeiro (Treemap)**")
         if not df_patr.empty:
-            fig_tree = px.treemap(
-                df_patr, 
-                path=[db.STATUS_COL, db.NOME_COL], 
-                values=db.VALOR_COL,
-                color=db.STATUS_COL,
-                color_discrete_map={
-                    'ATIVO': '#2E8B57',      
-                    'MANUTENÇÃO': '#CD5C5C', 
-                    'EMPRÉSTIMO': '#DAA520', 
-                    'BAIXADO': '#696969'     
-                }
-            )
-            fig_tree.update_traces(textinfo="label+value")
-            fig_tree.update_layout(**LAYOUT_CLEAN) 
+            with metricas.medir("views.dashboard.figura_treemap"):
+                fig_tree = px.treemap(
+                    agregados["treemap"], 
+                    path=[db.STATUS_COL, db.NOME_COL], 
+                    values=db.VALOR_COL,
+                    color=db.STATUS_COL,
+                    color_discrete_map={
+                        'ATIVO': '#2E8B57',      
+                        'MANUTENÇÃO': '#CD5C5C', 
+                        'EMPRÉSTIMO': '#DAA520', 
+                        'BAIXADO': '#696969'     
+                    }
+                )
+                fig_tree.update_traces(textinfo="label+value")
+                fig_tree.update_layout(**LAYOUT_CLEAN) 
             st.plotly_chart(fig_tree, use_container_width=True)
 
     st.write("---")
@@ -239,43 +309,45 @@ def pagina_dashboard(df_patr, df_mov):
     
     with col_t1:
         st.markdown("**Investimento Mensal (Aquisições)**")
-        if 'data_aquisicao' in dados_com_idade.columns and not dados_com_idade['data_aquisicao'].isnull().all():
-            aquisicoes_no_tempo = dados_com_idade.set_index('data_aquisicao').resample('ME')[db.VALOR_COL].sum().reset_index()
-            aquisicoes_no_tempo = aquisicoes_no_tempo[aquisicoes_no_tempo[db.VALOR_COL] > 0]
-            
-            fig_aquisicao = px.area(aquisicoes_no_tempo, x='data_aquisicao', y=db.VALOR_COL)
-            fig_aquisicao.update_traces(line_color=COR_PRINCIPAL, fillcolor="rgba(227, 112, 38, 0.3)")
-            fig_aquisicao.update_layout(**LAYOUT_CLEAN) 
-            fig_aquisicao.update_layout(xaxis_title=None, yaxis_title="R$", yaxis=dict(gridcolor='#333'))
+        aquisicoes_no_tempo = agregados["aquisicoes_no_tempo"]
+        if aquisicoes_no_tempo is not None:
+            with metricas.medir("views.dashboard.figura_aquisicoes"):
+                fig_aquisicao = px.area(aquisicoes_no_tempo, x='data_aquisicao', y=db.VALOR_COL)
+                fig_aquisicao.update_traces(line_color=COR_PRINCIPAL, fillcolor="rgba(227, 112, 38, 0.3)")
+                fig_aquisicao.update_layout(**LAYOUT_CLEAN) 
+                fig_aquisicao.update_layout(xaxis_title=None, yaxis_title="R$", yaxis=dict(gridcolor='#333'))
             st.plotly_chart(fig_aquisicao, use_container_width=True)
         else:
             st.info("Sem dados temporais.")
 
     with col_t2:
         st.markdown("**Movimentações**")
-        if not df_mov.empty:
-            mov_no_tempo = df_mov.set_index('data_hora').groupby('tipo_movimentacao').resample('ME').size().reset_index(name='contagem')
+        mov_no_tempo = agregados["mov_no_tempo"]
+        if mov_no_tempo is not None:
             color_map = {'Entrada': COR_PRINCIPAL, 'Saída': '#A9A9A9'}
             
-            fig_mov = px.line(mov_no_tempo, x='data_hora', y='contagem', color='tipo_movimentacao', color_discrete_map=color_map, markers=True)
-            fig_mov.update_layout(**LAYOUT_CLEAN) 
-            fig_mov.update_layout(xaxis_title=None, yaxis_title="Qtd", yaxis=dict(gridcolor='#333'))
+            with metricas.medir("views.dashboard.figura_movimentacoes"):
+                fig_mov = px.line(mov_no_tempo, x='data_hora', y='contagem', color='tipo_movimentacao', color_discrete_map=color_map, markers=True)
+                fig_mov.update_layout(**LAYOUT_CLEAN) 
+                fig_mov.update_layout(xaxis_title=None, yaxis_title="Qtd", yaxis=dict(gridcolor='#333'))
             st.plotly_chart(fig_mov, use_container_width=True)
         else:
             st.info("Sem dados de movimentação.")
             
     st.markdown("**Top Responsáveis (Valor)**")
-    valor_por_resp = df_patr.groupby(db.RESPONSAVEL_COL)[db.VALOR_COL].sum().sort_values(ascending=False).head(10).reset_index()
+    valor_por_resp = agregados["valor_por_resp"]
     
-    fig_resp_val = px.bar(valor_por_resp, x=db.RESPONSAVEL_COL, y=db.VALOR_COL, text_auto='.2s')
-    fig_resp_val.update_traces(marker_color=COR_PRINCIPAL, textposition='outside')
-    fig_resp_val.update_layout(**LAYOUT_CLEAN) 
-    fig_resp_val.update_layout(yaxis_title="R$", xaxis_title=None, yaxis=dict(gridcolor='#333'))
+    with metricas.medir("views.dashboard.figura_responsaveis"):
+        fig_resp_val = px.bar(valor_por_resp, x=db.RESPONSAVEL_COL, y=db.VALOR_COL, text_auto='.2s')
+        fig_resp_val.update_traces(marker_color=COR_PRINCIPAL, textposition='outside')
+        fig_resp_val.update_layout(**LAYOUT_CLEAN) 
+        fig_resp_val.update_layout(yaxis_title="R$", xaxis_title=None, yaxis=dict(gridcolor='#333'))
     st.plotly_chart(fig_resp_val, use_container_width=True)
 
+@metricas.medido("views.cadastro")
 def pagina_cadastrar_item(is_admin, lista_status, lista_obras_app, existing_data):
     st.header("Novo Cadastro", divider='orange')
-    tab_patrimonio, tab_locacao = st.tabs(["Patrimônio", "Locação"])
+    tab_patrimonio, tab_locacao, tab_importacao = st.tabs(["Patrimônio", "Locação", "Importar Planilha"])
 
     with tab_patrimonio:
         st.markdown("### Registrar Novo Ativo")
@@ -323,15 +395,11 @@ def pagina_cadastrar_item(is_admin, lista_status, lista_obras_app, existing_data
                     if not (nome_produto and num_nota_fiscal and local_uso and responsavel):
                         st.error("Preencha os campos obrigatórios: Nome, NF, Local e Responsável.")
                     else:
-                        link_nota_fiscal = ""
-                        if uploaded_pdf:
-                            f_name_pdf = f"NF_{obra_para_cadastro}_{datetime.now().strftime('%H%M%S')}.pdf"
-                            link_nota_fiscal = db.upload_nota_fiscal(uploaded_pdf.getvalue(), f_name_pdf)
-                        
-                        link_foto = ""
-                        if uploaded_img:
-                            f_name_img = f"IMG_{obra_para_cadastro}_{datetime.now().strftime('%H%M%S')}.jpg"
-                            link_foto = db.upload_foto_patrimonio(uploaded_img.getvalue(), f_name_img, uploaded_img.type)
+                        link_nota_fiscal, link_foto, link_miniatura = db.enviar_anexos(
+                            uploaded_pdf.getvalue() if uploaded_pdf else None,
+                            uploaded_img.getvalue() if uploaded_img else None,
+                            uploaded_img.type if uploaded_img else None,
+                        )
                         novo_item_dict = {
                             db.OBRA_COL: obra_para_cadastro,
                             db.TOMBAMENTO_COL: num_tombamento_manual.upper() if num_tombamento_manual else None,
@@ -341,16 +409,17 @@ def pagina_cadastrar_item(is_admin, lista_status, lista_obras_app, existing_data
                             db.LOCAL_COL: local_uso.upper(),
                             db.RESPONSAVEL_COL: responsavel.upper(),
                             db.NF_NUM_COL: num_nota_fiscal.upper(),
-                            db.NF_LINK_COL: link_nota_fiscal,
-                            db.FOTO_COL: link_foto,
+                            db.NF_LINK_COL: link_nota_fiscal or None,
+                            db.FOTO_COL: link_foto or None,
+                            db.FOTO_MINIATURA_COL: link_miniatura,
                             db.VALOR_COL: valor_produto,
                             db.STATUS_COL: status_selecionado 
                         }
                         
                         try:
-                            db.get_db_connection().table("patrimonio").insert(novo_item_dict).execute()
+                            inseridos = db.get_repositorio().inserir("patrimonio", novo_item_dict)
                             st.success(f"Patrimônio '{nome_produto}' cadastrado com sucesso!")
-                            st.cache_data.clear() 
+                            db.marcar_alteracao("patrimonio", [r[db.ID_COL] for r in inseridos])
                             st.rerun()
                         except Exception as e:
                             st.error(f"Erro ao salvar: {e}")
@@ -413,15 +482,88 @@ def pagina_cadastrar_item(is_admin, lista_status, lista_obras_app, existing_data
                     }
                     
                     try:
-                        conn.table("locacoes").insert(nova_locacao).execute()
+                        inseridos = db.get_repositorio().inserir("locacoes", nova_locacao)
                         st.success(f"Locação de '{loc_equipamento}' registrada! Total: R$ {calc_total:,.2f}")
-                        st.cache_data.clear()
+                        db.marcar_alteracao("locacoes", [r["id"] for r in inseridos])
                         st.rerun()
                     except Exception as e:
                         st.error(f"Erro ao salvar locação: {e}")
 
+    with tab_importacao:
+        st.markdown("### Importar Patrimônio em Lote")
+        st.caption("CSV ou Excel com as colunas: Nome, NF, Local, Responsável (obrigatórias) e, opcionalmente, Tombamento, Valor, Status, Especificações, Observações" + (" e Obra." if is_admin else "."))
+
+        if is_admin:
+            obra_importacao = st.selectbox("Obra padrão (linhas sem obra)", options=lista_obras_app, key="imp_obra_sel")
+        else:
+            obra_importacao = st.session_state.selected_obra
+
+        # A chave muda depois de uma importação bem-sucedida, para esvaziar o campo
+        # e um segundo clique não gravar as mesmas linhas de novo
+        versao_arquivo = st.session_state.get("imp_arquivo_versao", 0)
+        arquivo = st.file_uploader("Planilha", type=["csv", "xlsx"], key=f"imp_arquivo_{versao_arquivo}")
+        if arquivo and obra_importacao:
+            try:
+                df_imp = importacao.ler_planilha(arquivo.getvalue(), arquivo.name)
+            except Exception as e:
+                st.error(f"Não foi possível ler a planilha: {e}")
+                df_imp = None
+
+            if df_imp is not None:
+                try:
+                    tombamentos = db.tombamentos_cadastrados(importacao.tombamentos_da_planilha(df_imp))
+                except Exception as e:
+                    st.error(f"Não foi possível conferir os tombamentos já cadastrados: {e}")
+                    df_imp = None
+
+            if df_imp is not None:
+                validas, erros = importacao.validar_patrimonio(
+                    df_imp, obra_importacao, lista_status, lista_obras_app, tombamentos, permitir_obra=is_admin
+                )
+                i1, i2 = st.columns(2)
+                i1.metric("Linhas válidas", validas.shape[0])
+                i2.metric("Linhas com erro", erros.shape[0])
+                if not erros.empty:
+                    st.dataframe(erros, use_container_width=True, hide_index=True)
+                if not validas.empty:
+                    with st.expander("Pré-visualizar linhas válidas"):
+                        st.dataframe(validas.head(100), use_container_width=True, hide_index=True)
+                    if st.button(f"Importar {validas.shape[0]} item(ns)", type="primary", use_container_width=True, key="btn_importar"):
+                        barra = st.progress(0.0, text="Gravando...")
+                        try:
+                            ids = db.inserir_em_lotes(
+                                "patrimonio", validas.to_dict("records"),
+                                ao_progredir=lambda feitas, total: barra.progress(feitas / total, text=f"{feitas}/{total} gravadas")
+                            )
+                            st.success(f"{len(ids)} item(ns) importado(s) com sucesso!")
+                            st.session_state["imp_arquivo_versao"] = versao_arquivo + 1
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"Erro durante a importação (os lotes anteriores foram gravados): {e}")
+
+
+# Planilha com patrimônio, movimentações e locações da obra em visão (None = todas),
+# gerada em segundo plano para não travar a sessão
+def _secao_workbook(obra_visao):
+    with st.expander("Planilha completa (patrimônio, movimentações e locações)"):
+        tarefa = st.session_state.get("tarefa_workbook")
+        if st.button("Gerar planilha completa", key="btn_workbook", type="primary", use_container_width=True, disabled=tarefa is not None and not tarefa.done()):
+            _, _, patr, mov, loc = db.carregar_dados_app(obra_visao, "tabela")
+            tarefa = utils.iniciar_workbook({"Patrimonio": patr, "Movimentacoes": mov, "Locacoes": loc})
+            st.session_state["tarefa_workbook"] = tarefa
+        if tarefa is None:
+            return
+        if not tarefa.done():
+            st.info("Gerando planilha em segundo plano. Você pode continuar usando o sistema.")
+            st.button("Verificar andamento", key="btn_workbook_status", use_container_width=True)
+        elif tarefa.exception() is not None:
+            st.error(f"Erro ao gerar planilha: {tarefa.exception()}")
+        else:
+            nome_arquivo = f"Patrimonio_{obra_visao or 'Todas'}.xlsx"
+            st.download_button("Baixar Planilha Completa", tarefa.result(), nome_arquivo, MIME_EXCEL, key="btn_workbook_baixar", use_container_width=True, type="primary")
 
-def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, lista_status, lista_obras):
+@metricas.medido("views.inventario")
+def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, lista_status, lista_obras, obra_visao=None):
     st.header("Inventário & Gerenciamento", divider="orange")
     
     if 'movement_item_id' not in st.session_state: st.session_state.movement_item_id = None
@@ -462,7 +604,7 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
             col_f1, col_f2, col_f3 = st.columns([2, 1, 1])
             
             with col_f1:
-                search_term = st.text_input("Buscar Patrimônio", key="search_patr_uni", placeholder="Nome, Tombamento ou Responsável...")
+                search_term = st.text_input("Buscar Patrimônio", key="search_patr_uni", placeholder="Nome, Tombamento, Responsável, Local...")
             
             with col_f2:
                 if is_admin:
@@ -484,11 +626,9 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                 dados_filt = dados_filt[dados_filt[db.OBRA_COL] == filtro_obra]
 
             if search_term:
-                dados_filt = dados_filt[
-                    dados_filt[db.NOME_COL].str.contains(search_term, case=False, na=False) |
-                    dados_filt[db.TOMBAMENTO_COL].astype(str).str.contains(search_term, case=False, na=False) |
-                    dados_filt[db.RESPONSAVEL_COL].str.contains(search_term, case=False, na=False)
-                ]
+                ids_busca = busca.buscar_ids(dados_patrimonio, busca.COLUNAS_BUSCA_PATRIMONIO, search_term)
+                if ids_busca is not None:
+                    dados_filt = dados_filt[dados_filt[db.ID_COL].isin(ids_busca)]
 
             if filter_st != "Todos":
                 dados_filt = dados_filt[dados_filt[db.STATUS_COL] == filter_st]
@@ -508,41 +648,10 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                 <div><b>{qtd_patr}</b> itens encontrados</div>
                 </div>"""), unsafe_allow_html=True)
 
-                for index, row in dados_filt.iterrows():
+                pagina_patr = _paginar(dados_filt, "cards_patr")
+                for (index, row), html_content in zip(pagina_patr.iterrows(), utils.html_cards_patrimonio(pagina_patr)):
                     with st.container(border=False):
-                        st_txt = str(row[db.STATUS_COL]).strip().upper()
-                        if st_txt == "ATIVO": cor_status = "#35BE53" 
-                        elif st_txt in ["MANUTENÇÃO", "EMPRÉSTIMO"]: cor_status = "#ffc107" 
-                        else: cor_status = "#dc3545" 
-                        bg_status = f"{cor_status}22" 
-                        valor_fmt = f"R$ {row[db.VALOR_COL]:,.2f}"
-                        nome_safe = str(row[db.NOME_COL]).replace('"', '&quot;')
-                        espec_safe = str(row[db.ESPEC_COL])[:200] + "..." if row[db.ESPEC_COL] else ""
-                        
                         st.header("", divider="orange")
-                        url_foto = row.get(db.FOTO_COL)
-                        if url_foto and str(url_foto).strip() != "" and str(url_foto) != "None":
-                            img_html = f'<img src="{url_foto}" style="width: 200px; height: 130px; object-fit: cover; border-radius: 8px; border: 1px solid #333; margin-top: 10px;">'
-                        else:
-                            img_html = ""
-
-                        html_content = f"""
-                        <div style="margin-bottom: 10px; display: flex; justify-content: space-between; gap: 15px;">
-                            <div style="flex-grow: 1;">
-                                <h3 style="margin:0; color: white; font-size: 1.3em;">{nome_safe}</h3>
-                                <div style="color: #E37026; font-weight: bold; font-size: 0.9em; margin-bottom: 10px;">TOMBAMENTO: {row[db.TOMBAMENTO_COL]}</div>
-                                <div style="display:flex; flex-wrap: wrap; gap: 15px; color: #CCC; font-size: 0.85em;">
-                                    <div style="min-width: 100px;"><b style="color: #888; display:block;">OBRA</b>{row[db.OBRA_COL]}</div>
-                                    <div style="min-width: 100px;"><b style="color: #888; display:block;">LOCAL</b>{row[db.LOCAL_COL]}</div>
-                                    <div style="min-width: 100px;"><b style="color: #888; display:block;">RESPONSÁVEL</b>{row[db.RESPONSAVEL_COL]}</div>
-                                    <div><b style="color: #888; display:block;">VALOR</b><span style="color: #E37026;">{valor_fmt}</span></div>
-                                </div>
-                                <div style="margin-top: 10px; font-size: 0.8em; color: #888; font-style: italic;">{espec_safe}</div>
-                            </div>
-                            <div style="display: flex; flex-direction: column; align-items: flex-end; min-width: 130px; flex-shrink: 0;">
-                                <span style="background-color: {bg_status}; color: {cor_status}; padding: 4px 12px; border-radius: 4px; font-size: 0.75em; border: 1px solid {cor_status}; font-weight: bold; text-align: center; margin-bottom: 5px;">{st_txt}</span>{img_html}</div>
-                        <hr style="border-top: 1px solid #333; margin: 5px 0 10px 0;">
-                        """
                         st.markdown(html_content, unsafe_allow_html=True)
                         
                         c_edit, c_nf, c_qr = st.columns(3)
@@ -554,23 +663,36 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                             else: st.button("Sem Nota", disabled=True, key=f"nf_{row[db.ID_COL]}", type="secondary", use_container_width=True)
                         with c_qr:
                             if st.button("Etiqueta QR", key=f"qr_{row[db.ID_COL]}", type="primary", use_container_width=True):
-                                pdf_bytes = utils.gerar_ficha_qr_code(row)
+                                # O card só tem as colunas do perfil "cards"; a ficha também mostra as observações
+                                item_completo = db.carregar_item("patrimonio", row[db.ID_COL])
+                                pdf_bytes = utils.gerar_ficha_qr_code(item_completo) if item_completo is not None else None
                                 if pdf_bytes:
                                     b64 = base64.b64encode(pdf_bytes).decode()
                                     href = f'<a href="data:application/pdf;base64,{b64}" download="Etiqueta_{row[db.TOMBAMENTO_COL]}.pdf" id="d_{row[db.ID_COL]}"></a><script>document.getElementById("d_{row[db.ID_COL]}").click();</script>'
                                     st.markdown(href, unsafe_allow_html=True)
 
             else:
+                dados_filt = db.completar_colunas(dados_filt, "patrimonio", "tabela")
                 st.header("", divider='orange')
                 st.dataframe(dados_filt, use_container_width=True, hide_index=True)
                 
-                dados_xls = utils.gerar_excel(dados_filt, sheet_name="Patrimonio")
-                dados_pdf = utils.gerar_pdf(dados_filt, tipo="patrimonio", obra_nome=st.session_state.get("selected_obra", "Geral"))
-                col_d1, col_d2 = st.columns([1, 1])
-                with col_d1:
-                    if dados_xls: st.download_button("Excel", dados_xls, "Patrimonio.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True, type="primary")
-                with col_d2:
-                    if dados_pdf: st.download_button("PDF", dados_pdf, "Patrimonio.pdf", "application/pdf", use_container_width=True, type="primary")
+                _botoes_exportacao(dados_filt, dados_patrimonio.attrs.get("versao_dados"), "exp_patr", "patrimonio", "Patrimonio", "Patrimonio")
+
+                _secao_workbook(obra_visao)
+
+                _secao_movimentacao_lote(dados_filt, dados_patrimonio, lista_obras, is_admin, obra_visao)
+
+                with st.expander("Etiquetas QR em lote"):
+                    modelo_etiqueta = st.selectbox("Modelo da folha de etiquetas", list(utils.MODELOS_ETIQUETA), key="modelo_etiqueta")
+                    st.caption(f"{dados_filt.shape[0]} etiqueta(s) para os itens filtrados acima.")
+                    chave_etiquetas = (utils.chave_exportacao(dados_filt, dados_patrimonio.attrs.get("versao_dados")), modelo_etiqueta)
+                    pronto = st.session_state.get("etiquetas_pronto") == chave_etiquetas
+                    if not pronto and st.button("Gerar Etiquetas", key="btn_gerar_etiquetas", type="primary", use_container_width=True, disabled=dados_filt.empty):
+                        st.session_state["etiquetas_pronto"] = chave_etiquetas
+                        pronto = True
+                    if pronto:
+                        etiquetas = utils.gerar_etiquetas_em_cache(chave_etiquetas[0], modelo_etiqueta, dados_filt)
+                        if etiquetas: st.download_button("Baixar Etiquetas", etiquetas, "Etiquetas_QR.pdf", "application/pdf", key="btn_baixar_etiquetas", use_container_width=True, type="primary")
 
                 st.header("", divider='orange')
 
@@ -590,14 +712,14 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                                 modal_editar_patrimonio(row_sel, lista_status)
                         with b2:
                             if st.button("Registrar Movimentação", use_container_width=True, type="primary"):
-                                form_movimentacoes()
+                                form_movimentacoes(row_sel)
                                 
                         with b3:
                             if st.button("Excluir Item", use_container_width=True, type="secondary", key="btn_del_tab"):
-                                 db.get_db_connection().table("patrimonio").delete().eq(db.ID_COL, int(row_sel[db.ID_COL])).execute()
+                                 db.get_repositorio().excluir("patrimonio", [("eq", db.ID_COL, int(row_sel[db.ID_COL]))])
                                  st.success("Removido.")
                                  time.sleep(1)
-                                 st.cache_data.clear()
+                                 db.marcar_exclusao("patrimonio", [row_sel[db.ID_COL]])
                                  st.rerun()
 
                     
@@ -643,7 +765,9 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
             if filtro_obra_loc != "Todas":
                 df_l = df_l[df_l["obra_destino"] == filtro_obra_loc]
             if busca_loc:
-                df_l = df_l[df_l["equipamento"].str.contains(busca_loc, case=False, na=False) | df_l["contrato_sienge"].str.contains(busca_loc, case=False, na=False)]
+                ids_busca_loc = busca.buscar_ids(dados_locacoes, busca.COLUNAS_BUSCA_LOCACOES, busca_loc)
+                if ids_busca_loc is not None:
+                    df_l = df_l[df_l["id"].isin(ids_busca_loc)]
 
             if modo_view_loc == "Cards":
                 total_mensal = df_l["valor_total"].sum() if "valor_total" in df_l.columns else 0.0
@@ -661,44 +785,10 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                      <div><b>{qtd_equip}</b> equipamento(s) locado(s)</div>
                 </div>"""), unsafe_allow_html=True)
 
-                for index, row in df_l.iterrows():
+                pagina_loc = _paginar(df_l, "cards_loc")
+                for (index, row), html_loc in zip(pagina_loc.iterrows(), utils.html_cards_locacoes(pagina_loc)):
                     with st.container(border=False):
-                        d_inicio = pd.to_datetime(row['data_inicio']).strftime('%d/%m/%Y') if pd.notnull(row['data_inicio']) else '-'
-                        d_fim = pd.to_datetime(row['data_previsao_fim']).strftime('%d/%m/%Y') if pd.notnull(row['data_previsao_fim']) else '-'
-                        valor_loc_fmt = f"R$ {row['valor_mensal']:,.2f}"
-                        equip_safe = str(row['equipamento']).replace('"', '&quot;')
-                        
-                        st_loc = str(row['status'])
-                        if st_loc == "ATIVO": cor_loc = "#35BE53" 
-                        elif st_loc in ["MANUTENÇÃO"]: cor_loc = "#ffc107" 
-                        else: cor_loc = "#dc3545" 
-                        bg_loc = f"{cor_loc}22"
                         st.header("", divider="orange")
-                        
-                        v_total_show = row['valor_total'] if row.get('valor_total') else (row['quantidade'] * row['valor_mensal'])
-
-                        html_loc = f"""
-                        <div style="margin-bottom: 10px;">
-                            <div style="display:flex; justify-content:space-between; align-items:start;">
-                                <div>
-                                    <h3 style="margin:0; color: white; font-size: 1.3em;">{equip_safe}</h3>
-                                    <span style="color: #888; font-size: 0.9em;">{row['contrato_sienge']}</span>
-                                </div>
-                                <span style="background-color: {bg_loc}; color: {cor_loc}; padding: 4px 12px; border-radius: 4px; font-size: 0.75em; border: 1px solid {cor_loc}; font-weight: bold;">{st_loc}</span>
-                            </div>
-                            <div style="margin-top: 15px; display:flex; flex-wrap:wrap; gap: 20px; color: #CCC; font-size: 0.9em;">
-                                <div style="min-width: 140px;"><b style="color: #888; display:block;">OBRA</b>{row['obra_destino']}</div>
-                                <div style="min-width: 50px;"><b style="color: #888; display:block;">QTD</b>{row['quantidade']}</div>
-                                <div style="min-width: 140px;"><b style="color: #888; display:block;">RESPONSÁVEL</b>{row['responsavel']}</div>
-                                <div><b style="color: #888; display:block;">VALOR UNIT.</b><span style="color: #aaa;">{valor_loc_fmt}</span></div>
-                                <div><b style="color: #888; display:block;">VALOR TOTAL</b><span style="color: #E37026; font-weight:bold;">R$ {v_total_show:,.2f}</span></div>
-                            </div>
-                            <div style="margin-top: 10px; font-size: 0.85em; color: #aaa; display:flex; gap: 20px;">
-                                <span>Início: {d_inicio}</span><span>Prev. Fim: {d_fim}</span>
-                            </div>
-                            <hr style="border-top: 1px solid #333; margin: 15px 0 10px 0;">
-                        </div>
-                        """
                         st.markdown(html_loc, unsafe_allow_html=True)
                     
                         c_edt, c_del = st.columns(2)
@@ -708,7 +798,8 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                     with c_del:
                         if st.button("Excluir", key=f"dl_l_{row['id']}", type="secondary", use_container_width=True):
                             if st.session_state.get(f"cf_l_{row['id']}"):
-                                db.get_db_connection().table("locacoes").delete().eq("id", row['id']).execute()
+                                db.get_repositorio().excluir("locacoes", [("eq", "id", int(row['id']))])
+                                db.marcar_exclusao("locacoes", [row['id']])
                                 st.rerun()
                             else:
                                 st.session_state[f"cf_l_{row['id']}"] = True
@@ -717,12 +808,7 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
             else:
                 st.header("", divider='orange')
                 st.dataframe(df_l, use_container_width=True, hide_index=True)
-                excel_data = utils.gerar_excel(df_l, sheet_name="locaçoes")
-                pdf_data = utils.gerar_pdf(df_l, tipo="locaçoes", obra_nome=st.session_state.get("selected_obra", "Geral"))
-                
-                col_l1, col_l2 = st.columns([1, 1])
-                with col_l1: st.download_button(label="Baixar Excel", data=excel_data, file_name="Locacoes.xlsx", type="primary", use_container_width=True)
-                with col_l2: st.download_button(label="Baixar PDF", data=pdf_data, file_name="Locacoes.pdf", type="primary", use_container_width=True)
+                _botoes_exportacao(df_l, dados_locacoes.attrs.get("versao_dados"), "exp_loc", "locaçoes", "locaçoes", "Locacoes")
 
                 st.header("", divider='orange')
                 
@@ -739,8 +825,46 @@ def pagina_inventario_unificado(is_admin, dados_patrimonio, dados_locacoes, list
                             modal_editar_locacao(r_loc, lista_obras)
                     with bl2:
                         if st.button("Excluir Locação", key="btn_g_dl", type="secondary", use_container_width=True):
-                            db.get_db_connection().table("locacoes").delete().eq("id", lid).execute()
+                            db.get_repositorio().excluir("locacoes", [("eq", "id", lid)])
                             st.success("Excluído.")
                             time.sleep(1)
-                            st.cache_data.clear()
+                            db.marcar_exclusao("locacoes", [lid])
                             st.rerun()
+
+# Tempos e contadores do processo (todas as sessões) e o detalhamento da rodada
+# anterior desta sessão; só para administradores
+def pagina_diagnostico():
+    st.header("Diagnóstico de Desempenho", divider='orange')
+
+    rodada = st.session_state.get("rodada_anterior") or []
+    st.markdown("### Última rodada desta sessão")
+    if rodada:
+        df_rodada = pd.DataFrame(rodada, columns=["medida", "ms"])
+        st.caption(f"{df_rodada.shape[0]} medidas")
+        st.bar_chart(df_rodada.groupby("medida", sort=False)["ms"].sum())
+        st.dataframe(df_rodada, use_container_width=True, hide_index=True)
+    else:
+        st.info("Navegue por outra tela e volte para ver o detalhamento.")
+
+    st.markdown("### Tempos por medida (ms)")
+    tempos = pd.DataFrame(metricas.resumo_tempos())
+    if tempos.empty:
+        st.info("Nenhuma medida registrada ainda.")
+    else:
+        st.dataframe(tempos.sort_values("total_ms", ascending=False), use_container_width=True, hide_index=True)
+
+    st.markdown("### Contadores")
+    contadores = metricas.contadores()
+    st.dataframe(pd.DataFrame(list(contadores.items()), columns=["contador", "valor"]), use_container_width=True, hide_index=True)
+
+    st.markdown("### Caches")
+    caches = pd.DataFrame(metricas.resumo_caches())
+    if caches.empty:
+        st.info("Nenhum acesso a cache registrado ainda.")
+    else:
+        st.dataframe(caches, use_container_width=True, hide_index=True)
+
+    st.download_button(
+        "Exportar (Prometheus)", metricas.exportar_prometheus(), "metricas.prom", "text/plain",
+        key="btn_prometheus", type="primary", use_container_width=True
+    )